@@ -2,7 +2,10 @@
 Main application entry point
 """
 import streamlit as st
-from utils.data_loader import load_and_clean_data
+from utils.backend import get_backend
+from utils.registry import select_dataset
+from utils.warmup import wait_for_data
+from utils.metrics import query_kpis
 
 # Configure the page settings
 # Set up the dashboard layout, title, and sidebar
@@ -13,23 +16,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Load data with loading spinner
-# Show a spinner while data is being downloaded from the online source
-with st.spinner("Loading data from online source..."):
-    try:
-        # Call the function that loads data directly from URL
-        # No file path needed anymore - data comes from GitHub
-        df = load_and_clean_data()
-        
-        # Store data in session state so it persists across pages
-        st.session_state['data_loaded'] = True
-        st.session_state['df'] = df
-    except Exception as e:
-        # If loading fails, show error message
-        st.session_state['data_loaded'] = False
-        st.error(f"❌ Failed to load data: {e}")
-        st.info("Please check your internet connection. The data is loaded from GitHub.")
-
 # Main page content
 st.title("💳 Credit Card Risk Dashboard")
 st.markdown("""
@@ -40,25 +26,46 @@ This dashboard helps you monitor and analyze credit card fraud risk.
 👈 Select a page from the sidebar to begin
 """)
 
+# Dataset picked in the sidebar (kept across pages; hidden when only one is configured)
+source = select_dataset()
+
+# Show a placeholder while the data loads in the background
+# (returns immediately once it is ready, so the page above is painted first)
+wait_for_data()
+
+# Get the shared dataset
+# The spinner only shows when background warm-up is disabled (CREDIT_CARD_WARMUP=0)
+with st.spinner("Loading data from online source..."):
+    try:
+        # Shared query backend: the in-memory dataset (one copy for every session and page)
+        # or partitioned Parquet files (CREDIT_CARD_BACKEND=parquet)
+        data = get_backend(source)
+        st.session_state['data_loaded'] = True
+    except Exception as e:
+        # If loading fails, show error message
+        st.session_state['data_loaded'] = False
+        st.error(f"❌ Failed to load data: {e}")
+        st.info("Please check your internet connection. The data is loaded from GitHub.")
+
 # Show quick stats if data is loaded successfully
 if st.session_state.get('data_loaded', False):
-    df = st.session_state['df']
+    # KPIs come from the aggregate cube (built once per dataset version)
+    kpis = query_kpis(data.cube())
     
     # Create three columns for key metrics
     col1, col2, col3 = st.columns(3)
     
     with col1:
         # Display total number of transactions
-        st.info(f"📊 **Total Transactions**: {len(df):,}")
+        st.info(f"📊 **Total Transactions**: {kpis['total_transactions']:,}")
     
     with col2:
         # Calculate and display fraud transactions count and percentage
-        fraud_count = df['Class'].sum()
-        st.warning(f"⚠️ **Fraud Transactions**: {fraud_count:,} ({(fraud_count/len(df))*100:.4f}%)")
+        st.warning(f"⚠️ **Fraud Transactions**: {kpis['fraud_transactions']:,} ({kpis['fraud_rate']:.4f}%)")
     
     with col3:
         # Display total amount of all transactions
-        st.success(f"💰 **Total Amount**: ${df['Amount'].sum():,.0f}")
+        st.success(f"💰 **Total Amount**: ${kpis['total_amount']:,.0f}")
     
     # Add a small caption showing data source
     st.caption("📌 Data loaded from: GitHub repository (online source)")
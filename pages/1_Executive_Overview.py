@@ -2,9 +2,12 @@
 Executive Overview page - shows high-level KPIs for management
 """
 import streamlit as st
-from utils.data_loader import load_and_clean_data, get_basic_stats
-from utils.metrics import calculate_financial_impact
+from utils.backend import get_backend
+from utils.registry import select_dataset
+from utils.warmup import wait_for_data
+from utils.metrics import query_kpis
 from utils.charts import create_fraud_timeline, create_amount_distribution
+from utils.figure_cache import cached_figure
 
 # Configure page
 st.set_page_config(
@@ -21,16 +24,18 @@ st.markdown("""
     <hr>
 """, unsafe_allow_html=True)
 
-# Load data with caching
-@st.cache_data
-def load_data():
-    df = load_and_clean_data()
-    return df
+# Dataset picked in the sidebar (kept across pages; hidden when only one is configured)
+source = select_dataset()
+
+# Show a placeholder until the background load has finished
+wait_for_data()
 
 try:
-    df = load_data()
-    stats = get_basic_stats(df)
-    impact = calculate_financial_impact(df)
+    # Shared query backend (in-memory dataset or Parquet files, see utils.backend)
+    data = get_backend(source)
+    
+    # All KPIs come from the aggregate cube (built once per dataset version)
+    stats = query_kpis(data.cube())
     
     # Row 1: Key Performance Indicators
     col1, col2, col3, col4 = st.columns(4)
@@ -70,12 +75,13 @@ try:
     
     with col1:
         st.subheader("📈 Fraud Transactions Timeline")
-        fig_timeline = create_fraud_timeline(df)
+        fig_timeline = cached_figure(data, create_fraud_timeline, granularity='hour')
         st.plotly_chart(fig_timeline, use_container_width=True)
     
     with col2:
         st.subheader("📊 Amount Distribution")
-        fig_amount = create_amount_distribution(df)
+        log_scale = st.checkbox("Log-scaled amount bins", value=False)
+        fig_amount = cached_figure(data, create_amount_distribution, bins=50, log_scale=log_scale)
         st.plotly_chart(fig_amount, use_container_width=True)
     
     st.markdown("---")
@@ -89,14 +95,14 @@ try:
         st.info(f"""
         ### 📌 Risk Summary
         - **Fraud Rate**: {stats['fraud_rate']:.4f}% of transactions
-        - **Average Fraud Loss**: ${impact['avg_loss_per_fraud']:.2f} per transaction
-        - **Maximum Loss**: ${impact['max_fraud_amount']:.2f} in one transaction
+        - **Average Fraud Loss**: ${stats['avg_loss_per_fraud']:.2f} per transaction
+        - **Maximum Loss**: ${stats['max_fraud_amount']:.2f} in one transaction
         """)
     
     with col2:
         st.warning(f"""
         ### ⚠️ Areas to Monitor
-        - Fraud losses represent {impact['loss_percentage']:.2f}% of total amount
+        - Fraud losses represent {stats['loss_percentage']:.2f}% of total amount
         - Average normal transaction: ${stats['avg_normal_amount']:.2f}
         """)
     
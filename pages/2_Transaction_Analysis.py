@@ -2,9 +2,14 @@
 Transaction Analysis page - analyzes normal customer behavior
 """
 import streamlit as st
-import plotly.express as px
 import pandas as pd
-from utils.data_loader import load_and_clean_data
+from utils.backend import get_backend
+from utils.registry import select_dataset
+from utils.warmup import wait_for_data
+from utils.derived import AMOUNT_EDGES, TIME_GRANULARITIES, bucket_label
+from utils.metrics import query_totals
+from utils.sketch import RELATIVE_ACCURACY
+from utils.schema import AMOUNT_CATEGORIES
 
 # Configure page
 st.set_page_config(page_title="Transaction Analysis", page_icon="📊", layout="wide")
@@ -12,15 +17,18 @@ st.set_page_config(page_title="Transaction Analysis", page_icon="📊", layout="
 st.title("📊 Transaction Analysis")
 st.markdown("Analyzing normal customer behavior patterns")
 
-# Load data
-@st.cache_data
-def load_data():
-    return load_and_clean_data()
+# Dataset picked in the sidebar (kept across pages; hidden when only one is configured)
+source = select_dataset()
+
+# Show a placeholder until the background load has finished
+wait_for_data()
 
-df = load_data()
+# Shared query backend (in-memory dataset or Parquet files, see utils.backend)
+data = get_backend(source)
+largest_amount = int(query_totals(data.cube())['max'])
 
-# Filter for normal transactions only
-normal_df = df[df['Class'] == 0]
+# Plotly is only imported once the page actually draws charts
+import plotly.express as px
 
 # Sidebar filters
 st.sidebar.header("🔍 Analysis Filters")
@@ -28,8 +36,8 @@ st.sidebar.header("🔍 Analysis Filters")
 amount_range = st.sidebar.slider(
     "Amount Range ($)",
     min_value=0,
-    max_value=int(df['Amount'].max()),
-    value=(0, int(df['Amount'].max()))
+    max_value=largest_amount,
+    value=(0, largest_amount)
 )
 
 hour_range = st.sidebar.slider(
@@ -39,34 +47,44 @@ hour_range = st.sidebar.slider(
     value=(0, 23)
 )
 
+# Time buckets within the day (the hour filter maps onto any of them)
+granularities = [name for name in TIME_GRANULARITIES if name != 'day']
+granularity = st.sidebar.selectbox(
+    "Time Bucket",
+    options=granularities,
+    index=granularities.index('hour')
+)
+
 # Apply filters
-filtered_df = normal_df[
-    (normal_df['Amount'] >= amount_range[0]) &
-    (normal_df['Amount'] <= amount_range[1]) &
-    (normal_df['Hour'] >= hour_range[0]) &
-    (normal_df['Hour'] <= hour_range[1])
-]
+# In memory a range index (built once per dataset version) answers the filters by binary
+# search, so no filtered copy of the frame is built when a slider moves
+selection = data.range_summary(amount_range, hour_range, cls=0, granularity=granularity, edges=AMOUNT_EDGES)
 
 # Quick stats
 col1, col2, col3 = st.columns(3)
 with col1:
-    st.metric("Normal Transactions", f"{len(filtered_df):,}")
+    st.metric("Normal Transactions", f"{selection['count']:,}")
 with col2:
-    st.metric("Average Amount", f"${filtered_df['Amount'].mean():.2f}")
+    st.metric("Average Amount", f"${selection['mean']:.2f}")
 with col3:
-    st.metric("Total Amount", f"${filtered_df['Amount'].sum():,.0f}")
+    st.metric("Total Amount", f"${selection['sum']:,.0f}")
 
 # Hourly distribution chart
 st.subheader("🕐 Customer Activity Throughout the Day")
 
-hourly_data = filtered_df.groupby('Hour').size().reset_index(name='count')
+# Counts per time bucket (24 bars per day at hourly granularity)
+bucket_counts = selection['bucket_counts']
+hourly_data = pd.DataFrame({
+    'Label': [bucket_label(bucket, granularity) for bucket in range(len(bucket_counts))],
+    'count': bucket_counts
+})
 
 fig = px.bar(
     hourly_data,
-    x='Hour',
+    x='Label',
     y='count',
-    title='Transactions by Hour',
-    labels={'Hour': 'Hour of Day', 'count': 'Number of Transactions'},
+    title='Transactions by Hour' if granularity == 'hour' else 'Transactions over Time',
+    labels={'Label': 'Time of Day', 'count': 'Number of Transactions'},
     color='count',
     color_continuous_scale='Blues'
 )
@@ -75,7 +93,11 @@ st.plotly_chart(fig, use_container_width=True)
 # Amount category analysis
 st.subheader("💰 Amount Category Analysis")
 
-category_stats = filtered_df.groupby('Amount_Category').size().reset_index(name='count')
+category_stats = pd.DataFrame({
+    'Amount_Category': AMOUNT_CATEGORIES,
+    'count': selection['bin_counts']
+})
+category_stats = category_stats[category_stats['count'] > 0]
 category_stats['percentage'] = (category_stats['count'] / category_stats['count'].sum()) * 100
 
 col1, col2 = st.columns(2)
@@ -103,7 +125,12 @@ with col2:
 
 # Summary statistics
 st.subheader("📊 Summary Statistics")
+
+# Large selections get their quantiles from per-bucket sketches instead of gathering every amount
+summary = data.range_describe(amount_range, hour_range, cls=0, granularity=granularity)
 st.dataframe(
-    filtered_df['Amount'].describe().round(2),
+    summary.round(2),
     use_container_width=True
-)
\ No newline at end of file
+)
+if not summary.attrs['exact']:
+    st.caption(f"Quantiles are estimated from sketches (within {RELATIVE_ACCURACY:.0%} of the exact values).")
\ No newline at end of file
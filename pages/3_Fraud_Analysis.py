@@ -2,9 +2,14 @@
 Fraud Analysis page - analyzes fraud patterns
 """
 import streamlit as st
-import plotly.express as px
 import pandas as pd
-from utils.data_loader import load_and_clean_data
+from utils.backend import get_backend
+from utils.registry import select_dataset
+from utils.warmup import wait_for_data
+from utils.derived import ensure_columns
+from utils.metrics import query_totals, query_by_hour, query_by_category
+from utils.charts import create_fraud_heatmap
+from utils.figure_cache import cached_figure
 
 # Configure page
 st.set_page_config(page_title="Fraud Analysis", page_icon="⚠️", layout="wide")
@@ -12,18 +17,24 @@ st.set_page_config(page_title="Fraud Analysis", page_icon="⚠️", layout="wide
 st.title("⚠️ Fraud Transaction Analysis")
 st.markdown("Understanding fraud patterns and characteristics")
 
-# Load data
-@st.cache_data
-def load_data():
-    return load_and_clean_data()
+# Dataset picked in the sidebar (kept across pages; hidden when only one is configured)
+source = select_dataset()
+
+# Show a placeholder until the background load has finished
+wait_for_data()
 
-df = load_data()
+# Shared query backend (in-memory dataset or Parquet files, see utils.backend)
+data = get_backend(source)
+
+# Plotly is only imported once the page actually draws charts
+import plotly.express as px
 
-# Separate fraud and normal transactions
-fraud_df = df[df['Class'] == 1]
-normal_df = df[df['Class'] == 0]
+# Totals per class come from the aggregate cube (built once per dataset version)
+cube = data.cube()
+fraud = query_totals(cube, 1)
+normal = query_totals(cube, 0)
 
-if len(fraud_df) == 0:
+if fraud['count'] == 0:
     st.warning("No fraud transactions found in the data!")
     st.stop()
 
@@ -31,21 +42,21 @@ if len(fraud_df) == 0:
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    st.metric("Fraud Transactions", f"{len(fraud_df):,}")
+    st.metric("Fraud Transactions", f"{fraud['count']:,}")
 with col2:
-    st.metric("Percentage of Total", f"{(len(fraud_df)/len(df))*100:.4f}%")
+    st.metric("Percentage of Total", f"{(fraud['count']/(fraud['count'] + normal['count']))*100:.4f}%")
 with col3:
-    st.metric("Total Loss", f"${fraud_df['Amount'].sum():,.0f}")
+    st.metric("Total Loss", f"${fraud['sum']:,.0f}")
 with col4:
-    st.metric("Maximum Loss", f"${fraud_df['Amount'].max():,.2f}")
+    st.metric("Maximum Loss", f"${fraud['max']:,.2f}")
 
 # Comparison chart
 st.subheader("📊 Normal vs Fraud Comparison")
 
 comparison_df = pd.DataFrame({
     'Type': ['Normal', 'Fraud'],
-    'Count': [len(normal_df), len(fraud_df)],
-    'Average Amount': [normal_df['Amount'].mean(), fraud_df['Amount'].mean()]
+    'Count': [normal['count'], fraud['count']],
+    'Average Amount': [normal['mean'], fraud['mean']]
 })
 
 col1, col2 = st.columns(2)
@@ -75,8 +86,7 @@ with col2:
 # Hourly fraud distribution
 st.subheader("🕐 Fraud Distribution by Hour")
 
-fraud_by_hour = fraud_df.groupby('Hour').size().reset_index(name='count')
-fraud_by_hour['Hour'] = fraud_by_hour['Hour'].astype(int)
+fraud_by_hour = query_by_hour(cube, 1)
 
 fig = px.line(
     fraud_by_hour,
@@ -88,11 +98,31 @@ fig = px.line(
 fig.update_traces(line_color='red', line_width=3)
 st.plotly_chart(fig, use_container_width=True)
 
+# Fraud rate by time of day and amount
+st.subheader("🔥 Fraud Rate Heatmap")
+
+col1, col2 = st.columns(2)
+
+with col1:
+    heatmap_granularity = st.selectbox(
+        "Time resolution",
+        ['hour', '15min', '5min'],
+        format_func=lambda g: {'hour': 'Hour', '15min': '15 minutes', '5min': '5 minutes'}[g]
+    )
+with col2:
+    heatmap_bins = st.select_slider("Amount bins (log scale, plus one for amounts above $5,000)",
+                                    options=[10, 20, 40, 80], value=20)
+
+st.plotly_chart(
+    cached_figure(data, create_fraud_heatmap, granularity=heatmap_granularity, amount_bins=heatmap_bins),
+    use_container_width=True
+)
+
 # Amount category analysis
 st.subheader("💰 Fraud by Amount Category")
 
-fraud_by_category = fraud_df.groupby('Amount_Category').size().reset_index(name='count')
-fraud_by_category['percentage'] = (fraud_by_category['count'] / fraud_by_category['count'].sum()) * 100
+fraud_by_category = query_by_category(cube, 1)
+fraud_by_category = fraud_by_category[fraud_by_category['count'] > 0]
 
 col1, col2 = st.columns(2)
 
@@ -121,7 +151,10 @@ with col2:
 # Top fraud transactions
 st.subheader("💰 Top 10 Fraud Transactions")
 
-top_frauds = fraud_df.nlargest(10, 'Amount')[['Amount', 'Hour', 'Amount_Category']]
+# Derived columns are only computed for the 10 selected rows
+top_frauds = data.top_transactions(10, cls=1)
+top_frauds = ensure_columns(top_frauds[['Amount', 'Time']], ['Hour', 'Amount_Category'])
+top_frauds = top_frauds[['Amount', 'Hour', 'Amount_Category']]
 top_frauds['Amount'] = top_frauds['Amount'].apply(lambda x: f"${x:,.2f}")
 
 st.dataframe(
@@ -139,7 +172,7 @@ st.dataframe(
 if len(fraud_by_hour) > 0 and len(fraud_by_category) > 0:
     st.subheader("🔍 Key Findings")
     st.markdown(f"""
-    - **Average Fraud Amount**: ${fraud_df['Amount'].mean():.2f} ({(fraud_df['Amount'].mean()/normal_df['Amount'].mean()):.1f}x larger than normal)
+    - **Average Fraud Amount**: ${fraud['mean']:.2f} ({(fraud['mean']/normal['mean']):.1f}x larger than normal)
     - **Peak Fraud Hour**: {int(fraud_by_hour.loc[fraud_by_hour['count'].idxmax(), 'Hour'])}:00
     - **Highest Risk Category**: {fraud_by_category.loc[fraud_by_category['count'].idxmax(), 'Amount_Category']}
     """)
\ No newline at end of file
@@ -2,9 +2,11 @@
 Risk Insights page - provides recommendations and risk analysis
 """
 import streamlit as st
-import pandas as pd
-from utils.data_loader import load_and_clean_data
-from utils.metrics import calculate_risk_metrics, calculate_financial_impact
+from utils.backend import get_backend
+from utils.registry import select_dataset
+from utils.warmup import wait_for_data
+from utils.derived import AMOUNT_EDGES
+from utils.metrics import query_kpis, query_risk_matrix, binned_risk_matrix
 
 # Configure page
 st.set_page_config(page_title="Risk Insights", page_icon="🎯", layout="wide")
@@ -12,14 +14,18 @@ st.set_page_config(page_title="Risk Insights", page_icon="🎯", layout="wide")
 st.title("🎯 Risk Insights & Recommendations")
 st.markdown("Data-driven recommendations to reduce fraud risk")
 
-# Load data
-@st.cache_data
-def load_data():
-    return load_and_clean_data()
+# Dataset picked in the sidebar (kept across pages; hidden when only one is configured)
+source = select_dataset()
 
-df = load_data()
-risk_metrics = calculate_risk_metrics(df)
-impact = calculate_financial_impact(df)
+# Show a placeholder until the background load has finished
+wait_for_data()
+
+# Shared query backend (in-memory dataset or Parquet files, see utils.backend)
+data = get_backend(source)
+
+# All KPIs come from the aggregate cube (built once per dataset version)
+cube = data.cube()
+kpis = query_kpis(cube)
 
 # Risk metrics cards
 st.subheader("📊 Key Risk Indicators")
@@ -29,14 +35,14 @@ col1, col2, col3 = st.columns(3)
 with col1:
     st.metric(
         "📈 Fraud vs Normal Ratio",
-        f"{risk_metrics['fraud_to_normal_ratio']:.1f}x"
+        f"{kpis['fraud_to_normal_ratio']:.1f}x"
     )
 
 with col2:
-    if risk_metrics['busiest_fraud_hour'] is not None:
+    if kpis['busiest_fraud_hour'] is not None:
         st.metric(
             "⏰ Riskiest Hour",
-            f"{risk_metrics['busiest_fraud_hour']:02d}:00"
+            f"{kpis['busiest_fraud_hour']:02d}:00"
         )
     else:
         st.metric("⏰ Riskiest Hour", "No data")
@@ -44,40 +50,30 @@ with col2:
 with col3:
     st.metric(
         "💸 Total Fraud Loss",
-        f"${impact['total_fraud_loss']:,.0f}"
+        f"${kpis['total_fraud_loss']:,.0f}"
     )
 
 # Risk matrix by category
 st.subheader("🎯 Risk Matrix by Amount Category")
 
-# Create risk matrix
-categories = ['Small (< $100)', 'Medium ($100-$500)', 'Large ($500-$1000)', 'Very Large (> $1000)']
-normal_counts = []
-fraud_counts = []
-
-for i, cat in enumerate(categories):
-    if i == 0:
-        normal_counts.append(len(df[(df['Class']==0) & (df['Amount']<100)]))
-        fraud_counts.append(len(df[(df['Class']==1) & (df['Amount']<100)]))
-    elif i == 1:
-        normal_counts.append(len(df[(df['Class']==0) & (df['Amount']>=100) & (df['Amount']<500)]))
-        fraud_counts.append(len(df[(df['Class']==1) & (df['Amount']>=100) & (df['Amount']<500)]))
-    elif i == 2:
-        normal_counts.append(len(df[(df['Class']==0) & (df['Amount']>=500) & (df['Amount']<1000)]))
-        fraud_counts.append(len(df[(df['Class']==1) & (df['Amount']>=500) & (df['Amount']<1000)]))
-    else:
-        normal_counts.append(len(df[(df['Class']==0) & (df['Amount']>=1000)]))
-        fraud_counts.append(len(df[(df['Class']==1) & (df['Amount']>=1000)]))
-
-risk_matrix = pd.DataFrame({
-    'Category': categories,
-    'Normal Count': normal_counts,
-    'Fraud Count': fraud_counts
-})
-
-# Calculate risk percentage
-risk_matrix['Risk Rate (%)'] = (risk_matrix['Fraud Count'] / (risk_matrix['Normal Count'] + risk_matrix['Fraud Count'])) * 100
-risk_matrix['Risk Rate (%)'] = risk_matrix['Risk Rate (%)'].fillna(0).round(4)
+# Analysts can try other amount tiers (e.g. "50, 100, 500, 1000, 5000")
+edges_text = st.text_input(
+    "Amount tier edges ($, comma separated)",
+    value=", ".join(str(edge) for edge in AMOUNT_EDGES)
+)
+
+try:
+    edges = sorted({float(edge) for edge in edges_text.split(',') if edge.strip()})
+except ValueError:
+    st.warning("Tier edges must be numbers; showing the default tiers.")
+    edges = list(AMOUNT_EDGES)
+
+# Normal / fraud counts and fraud rate per amount category
+# Default tiers come from the cube; custom tiers are counted in one pass over the rows
+if not edges or edges == list(AMOUNT_EDGES):
+    risk_matrix = query_risk_matrix(cube)
+else:
+    risk_matrix = binned_risk_matrix(data, edges)
 
 st.dataframe(risk_matrix, use_container_width=True, hide_index=True)
 
@@ -144,7 +140,7 @@ col1, col2 = st.columns(2)
 with col1:
     st.metric(
         "Estimated Annual Savings",
-        f"${impact['total_fraud_loss'] * 0.3:,.0f}",
+        f"${kpis['total_fraud_loss'] * 0.3:,.0f}",
         help="30% reduction target"
     )
 
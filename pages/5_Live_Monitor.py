@@ -0,0 +1,115 @@
+"""
+Live Monitor page - replays transactions as a simulated live feed
+"""
+import streamlit as st
+import pandas as pd
+from utils.backend import get_backend
+from utils.registry import select_dataset
+from utils.warmup import wait_for_data
+from utils.derived import SECONDS_PER_DAY
+from utils.replay import SPEEDS, WINDOWS, Replay
+
+# Seconds between two refreshes of the live widgets
+REFRESH_SECONDS = 1.0
+
+# Configure page
+st.set_page_config(page_title="Live Monitor", page_icon="📡", layout="wide")
+
+st.title("📡 Live Transaction Monitor")
+st.markdown("Replays the dataset in time order as if the transactions were arriving now")
+
+# Dataset picked in the sidebar (kept across pages; hidden when only one is configured)
+source = select_dataset()
+
+# Show a placeholder until the background load has finished
+wait_for_data()
+
+# Shared query backend (in-memory dataset or Parquet files, see utils.backend);
+# the replay asks it for the transactions of each refresh's Time window
+data = get_backend(source)
+
+def clock_label(seconds):
+    """
+    Formats a Time value as 'Day N HH:MM:SS'
+    """
+    day, rest = divmod(int(seconds), SECONDS_PER_DAY)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"Day {day + 1} {hours:02d}:{minutes:02d}:{secs:02d}"
+
+# Replay settings
+col1, col2 = st.columns(2)
+
+with col1:
+    speed = st.select_slider(
+        "Replay speed",
+        options=SPEEDS,
+        value=60,
+        format_func=lambda s: f"{s}x"
+    )
+with col2:
+    window_label = st.selectbox("Sliding window", list(WINDOWS), index=1)
+
+# One replay per session, started over when the window or the dataset changes
+replay_key = (data.version, WINDOWS[window_label])
+if st.session_state.get('replay_key') != replay_key:
+    st.session_state['replay'] = Replay(data, WINDOWS[window_label], speed)
+    st.session_state['replay_key'] = replay_key
+replay = st.session_state['replay']
+
+if replay.speed != speed:
+    replay.set_speed(speed)
+
+col1, col2, col3 = st.columns(3)
+
+with col1:
+    if st.button("▶️ Start", disabled=replay.running or replay.finished, use_container_width=True):
+        replay.start()
+        st.rerun()
+with col2:
+    if st.button("⏸️ Pause", disabled=not replay.running, use_container_width=True):
+        replay.pause()
+        st.rerun()
+with col3:
+    if st.button("🔄 Reset", use_container_width=True):
+        st.session_state['replay'] = Replay(data, WINDOWS[window_label], speed)
+        st.rerun()
+
+# Only this fragment reruns on every refresh, not the whole page
+@st.fragment(run_every=REFRESH_SECONDS if replay.running else None)
+def live_panel():
+    replay.step()
+    window = replay.window.snapshot()
+
+    st.subheader(f"🕐 {clock_label(replay.clock)}")
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric(f"Transactions ({window_label})", f"{window['count']:,}")
+    with col2:
+        st.metric("Fraud Transactions", f"{window['fraud']:,}")
+    with col3:
+        st.metric("Fraud Rate", f"{window['fraud_rate']:.3f}%")
+    with col4:
+        st.metric("Fraud Loss", f"${window['loss']:,.2f}")
+
+    if replay.history:
+        history = pd.DataFrame(list(replay.history))
+        history['Time'] = history['Time'] / 3600
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Transactions in window** (by hour of replay)")
+            st.line_chart(history, x='Time', y='count', height=250)
+        with col2:
+            st.markdown("**Fraud rate in window (%)**")
+            st.line_chart(history, x='Time', y='fraud_rate', color='#d62728', height=250)
+
+    st.caption(
+        f"Replayed {replay.position:,} of {replay.total:,} transactions · "
+        f"processing rate {replay.throughput():,.0f} events/s"
+    )
+    if replay.finished:
+        st.success("✅ Replay finished. Press Reset to start again.")
+
+live_panel()
@@ -0,0 +1,126 @@
+"""
+Shared fixtures: a local HTTP server standing in for the dataset's host, and a throwaway cache folder
+"""
+import hashlib
+import http.server
+import re
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from utils import snapshot
+from utils.schema import FEATURE_COLUMNS
+
+class SourceServer(http.server.ThreadingHTTPServer):
+    """
+    Serves in-memory files with an ETag and byte ranges (If-Range included)
+
+    delay: seconds to wait before sending a reply's body (a slow host)
+    drop_after: bytes of a range reply sent before the connection is closed (a dropped transfer)
+    before_reply: called with (path, status) once a reply's ETag and body are fixed,
+                  before it is sent (e.g. to change the file during a download)
+    Every request is recorded in requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SourceHandler)
+        self.files = {}
+        self.delay = 0.0
+        self.drop_after = None
+        self.before_reply = None
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_port}{path}'
+
+    def etag(self, path):
+        return '"' + hashlib.sha256(self.files[path]).hexdigest()[:16] + '"'
+
+class _SourceHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        body = server.files.get(self.path)
+        wanted = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        partial = (body is not None and wanted is not None
+                   and self.headers.get('If-Range') in (None, server.etag(self.path)))
+        status = 404 if body is None else 206 if partial else 200
+        with server.lock:
+            server.requests.append({
+                'path': self.path,
+                'status': status,
+                'range': self.headers.get('Range'),
+                'if_range': self.headers.get('If-Range'),
+                'accept_encoding': self.headers.get('Accept-Encoding'),
+            })
+        if body is None:
+            time.sleep(server.delay)
+            self.send_error(404)
+            return
+
+        payload = body
+        if partial:
+            start = int(wanted[1])
+            end = int(wanted[2]) if wanted[2] else len(body) - 1
+            payload = body[start:end + 1]
+        etag = server.etag(self.path)
+        if server.before_reply is not None:
+            server.before_reply(self.path, status)
+        self.send_response(status)
+        if partial:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        time.sleep(server.delay)
+        try:
+            if partial and server.drop_after is not None:
+                # Fewer bytes than Content-Length, then the connection closes
+                self.wfile.write(payload[:server.drop_after])
+                self.close_connection = True
+            else:
+                self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+@pytest.fixture
+def source_server():
+    server = SourceServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """
+    Points the snapshot and download cache at an empty folder
+    """
+    folder = tmp_path / 'cache'
+    monkeypatch.setattr(snapshot, 'CACHE_DIR', str(folder))
+    return folder
+
+@pytest.fixture
+def transactions_csv():
+    """
+    Returns the bytes of a CSV shaped like the source dataset (rows random, Time sorted)
+    """
+    def build(rows=2_000, seed=0):
+        rng = np.random.default_rng(seed)
+        df = pd.DataFrame({'Time': np.sort(rng.integers(0, 172_800, rows)).astype(float)})
+        for name in FEATURE_COLUMNS:
+            df[name] = rng.normal(size=rows).round(6)
+        df['Amount'] = rng.exponential(80, rows).round(2)
+        df['Class'] = (rng.random(rows) < 0.01).astype(int)
+        return df.to_csv(index=False).encode('utf-8')
+    return build
@@ -0,0 +1,130 @@
+"""
+Tests for the parallel range download with resume and verification (utils.download)
+"""
+import hashlib
+import os
+import random
+import pytest
+import requests
+from utils import data_loader, snapshot, download as downloader
+from utils.download import DownloadError, download
+
+# Segment size used by the tests, so a 1 MB file is split into 16 ranges
+SEGMENT = 64 * 1024
+
+FILE_BYTES = 1_000_000
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    """
+    Splits test files into SEGMENT-sized ranges, written in small blocks, and retries without waiting
+    """
+    monkeypatch.setattr(downloader, 'SEGMENT_BYTES', SEGMENT)
+    monkeypatch.setattr(downloader, 'MIN_PARALLEL_BYTES', 2 * SEGMENT)
+    monkeypatch.setattr(downloader, 'READ_BYTES', 4096)
+    monkeypatch.setattr(downloader, 'RETRY_BACKOFF', 0.0)
+
+def _payload(seed=0, size=FILE_BYTES):
+    return random.Random(seed).randbytes(size)
+
+def _range_bytes(requests_seen):
+    """
+    Returns the bytes asked for by the range requests of a request log
+    """
+    total = 0
+    for request in requests_seen:
+        if request['range']:
+            start, end = request['range'].removeprefix('bytes=').split('-')
+            total += int(end) - int(start) + 1
+    return total
+
+def test_downloads_ranges_in_parallel(source_server, tmp_path):
+    payload = _payload()
+    source_server.files['/data.csv'] = payload
+    dest = tmp_path / 'data.csv'
+
+    result = download(source_server.url('/data.csv'), str(dest), workers=4)
+
+    assert dest.read_bytes() == payload
+    assert result['bytes'] == FILE_BYTES
+    assert result['segments'] == -(-FILE_BYTES // SEGMENT)
+    assert result['resumed_bytes'] == 0
+    assert result['sha256'] == hashlib.sha256(payload).hexdigest()
+    probe, *ranges = source_server.requests
+    # The probe asks for the uncompressed file, so it can be split into ranges
+    assert probe['range'] is None and probe['accept_encoding'] == 'identity'
+    assert len(ranges) == result['segments']
+    assert all(r['status'] == 206 and r['if_range'] == source_server.etag('/data.csv') for r in ranges)
+    assert not os.path.exists(str(dest) + '.part') and not os.path.exists(str(dest) + '.progress')
+
+def test_interrupted_download_resumes(source_server, tmp_path, monkeypatch):
+    payload = _payload()
+    source_server.files['/data.csv'] = payload
+    dest = str(tmp_path / 'data.csv')
+
+    # Every range reply is cut short, and a failed segment is not retried
+    source_server.drop_after = 20_000
+    monkeypatch.setattr(downloader, 'RETRIES', 1)
+    with pytest.raises(requests.RequestException):
+        download(source_server.url('/data.csv'), dest, workers=4)
+    assert not os.path.exists(dest)
+    assert os.path.exists(dest + '.progress')
+
+    source_server.drop_after = None
+    first_run = len(source_server.requests)
+    result = download(source_server.url('/data.csv'), dest, workers=4)
+
+    with open(dest, 'rb') as f:
+        assert f.read() == payload
+    assert result['resumed_bytes'] > 0
+    # Only the missing bytes are asked for again
+    assert _range_bytes(source_server.requests[first_run:]) == FILE_BYTES - result['resumed_bytes']
+
+def test_source_changed_during_download_restarts(source_server, tmp_path):
+    old, new = _payload(seed=0), _payload(seed=1)
+    source_server.files['/data.csv'] = old
+    old_etag = source_server.etag('/data.csv')
+    dest = str(tmp_path / 'data.csv')
+
+    def publish_new_version(path, status):
+        # The probe still describes the old file; every range request then sees the new one
+        if status == 200:
+            source_server.files[path] = new
+            source_server.before_reply = None
+
+    source_server.before_reply = publish_new_version
+    with pytest.raises(DownloadError):
+        download(source_server.url('/data.csv'), dest, workers=4)
+    ranges = [r for r in source_server.requests if r['range']]
+    # If-Range carried the old ETag, so the server answered with the whole (new) file instead of a range
+    assert ranges and all(r['if_range'] == old_etag and r['status'] == 200 for r in ranges)
+    assert not os.path.exists(dest)
+
+    result = download(source_server.url('/data.csv'), dest, workers=4)
+    with open(dest, 'rb') as f:
+        assert f.read() == new
+    assert result['resumed_bytes'] == 0
+
+def test_checksum_mismatch_is_rejected(source_server, tmp_path):
+    payload = _payload()
+    source_server.files['/data.csv'] = payload
+    dest = str(tmp_path / 'data.csv')
+
+    with pytest.raises(DownloadError, match='Checksum mismatch'):
+        download(source_server.url('/data.csv'), dest, workers=4, sha256='0' * 64)
+    assert not os.path.exists(dest) and not os.path.exists(dest + '.part')
+
+    result = download(source_server.url('/data.csv'), dest, workers=4,
+                      sha256=hashlib.sha256(payload).hexdigest().upper())
+    assert result['sha256'] == hashlib.sha256(payload).hexdigest()
+
+def test_loader_rejects_a_checksum_mismatch(source_server, cache_dir, transactions_csv, monkeypatch):
+    source_server.files['/creditcard.csv'] = transactions_csv(rows=100)
+    url = source_server.url('/creditcard.csv')
+    monkeypatch.setenv('CREDIT_CARD_DATA_SHA256', '0' * 64)
+
+    with pytest.raises(DownloadError):
+        data_loader.load_and_clean_data(url)
+    # Nothing was parsed or saved as a snapshot
+    assert snapshot.load(url) is None
+    assert not os.path.exists(snapshot.download_path(url))
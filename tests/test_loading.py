@@ -0,0 +1,89 @@
+"""
+Tests for coalescing concurrent cold loads of the same source (utils.data_loader)
+"""
+import threading
+import time
+import pytest
+import requests
+from utils import data_loader
+
+# Sessions asking for the dataset at the same time
+N_CALLERS = 8
+
+def _load_concurrently(url):
+    """
+    Calls load_and_clean_data from N_CALLERS threads at once and returns their results (or exceptions)
+    """
+    barrier = threading.Barrier(N_CALLERS)
+    results = [None] * N_CALLERS
+
+    def call(i):
+        barrier.wait()
+        try:
+            results[i] = data_loader.load_and_clean_data(url)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(N_CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    return results
+
+def test_concurrent_cold_loads_download_and_parse_once(source_server, cache_dir, transactions_csv, monkeypatch):
+    source_server.files['/creditcard.csv'] = transactions_csv(rows=2_000)
+    # A slow host keeps the first load in flight while the other callers arrive
+    source_server.delay = 0.5
+
+    parsed = []
+    read_csv = data_loader.read_csv
+
+    def counting_read_csv(path, seen=None):
+        parsed.append(path)
+        return read_csv(path, seen)
+
+    monkeypatch.setattr(data_loader, 'read_csv', counting_read_csv)
+    before = data_loader.load_stats()
+
+    results = _load_concurrently(source_server.url('/creditcard.csv'))
+
+    after = data_loader.load_stats()
+    assert after['executions'] - before['executions'] == 1
+    assert after['coalesced'] - before['coalesced'] == N_CALLERS - 1
+    assert after['in_flight'] == 0
+    assert len(source_server.requests) == 1
+    assert len(parsed) == 1
+    assert all(result is results[0] for result in results)
+    assert len(results[0]) == 2_000
+
+def test_concurrent_callers_share_the_failure(source_server, cache_dir):
+    # Nothing is served at this path: the single download fails with 404
+    source_server.delay = 0.5
+    before = data_loader.load_stats()
+
+    results = _load_concurrently(source_server.url('/missing.csv'))
+
+    after = data_loader.load_stats()
+    assert after['executions'] - before['executions'] == 1
+    assert after['failures'] - before['failures'] == 1
+    assert len(source_server.requests) == 1
+    assert all(isinstance(result, requests.HTTPError) for result in results)
+
+def test_waiting_caller_times_out(source_server, cache_dir, transactions_csv):
+    source_server.files['/creditcard.csv'] = transactions_csv(rows=100)
+    source_server.delay = 1.0
+    url = source_server.url('/creditcard.csv')
+    before = data_loader.load_stats()
+
+    leader = threading.Thread(target=data_loader.load_and_clean_data, args=(url,))
+    leader.start()
+    while not data_loader.loads.in_flight():
+        time.sleep(0.01)
+    with pytest.raises(TimeoutError):
+        data_loader.load_and_clean_data(url, timeout=0.1)
+    leader.join(timeout=30)
+
+    after = data_loader.load_stats()
+    assert after['timeouts'] - before['timeouts'] == 1
+    assert after['executions'] - before['executions'] == 1
@@ -0,0 +1,136 @@
+"""
+Appends new transaction batches to the shared dataset and updates the aggregates incrementally
+"""
+import hashlib
+import os
+import threading
+import time
+import pandas as pd
+from utils.cube import extend_cube
+from utils.data_loader import dataset_version, get_data_source, prepare_chunk, read_csv, stamp_version
+from utils.dataset import get_dataset, publish
+from utils.dedupe import FingerprintIndex, duplicate_mask, row_fingerprints
+from utils.ingest import DEFAULT_MAX_MEMORY_MB, ColumnBuffer
+from utils.schema import apply_schema
+
+# Spare rows allocated when the dataset first becomes appendable (as a share of its size)
+GROWTH_MARGIN = 0.25
+
+_lock = threading.Lock()
+
+# Per source: (dataset version, ColumnBuffer holding the rows with spare capacity)
+_buffers = {}
+
+# Per source: (dataset version, FingerprintIndex of the rows)
+_indexes = {}
+
+def _fingerprint_index(source, df):
+    """
+    Returns the fingerprint index of the current dataset, building it on the first append
+    """
+    version, index = _indexes.get(source, (None, None))
+    if index is None or version != dataset_version(df):
+        index = FingerprintIndex(df, df.columns)
+    return index
+
+def _check_columns(df, columns):
+    missing = [name for name in columns if name not in df.columns]
+    if missing:
+        raise ValueError(f"Batch is missing columns: {', '.join(missing)}")
+
+def _clean_batch(batch, columns, index):
+    """
+    Cleans a batch like the loader does and drops rows already in the dataset
+
+    batch: DataFrame of raw transactions, or path of a CSV file (plain or gzip)
+    """
+    if not isinstance(batch, pd.DataFrame):
+        df = read_csv(os.fspath(batch), seen=index)
+    else:
+        _check_columns(batch, columns)
+        df = prepare_chunk(batch[columns])
+        unseen = ~index.seen_mask(df)
+        skipped = int(len(df) - unseen.sum())
+        df = df[unseen]
+        keep = ~duplicate_mask({name: df[name].to_numpy() for name in columns})
+        df = df[keep].reset_index(drop=True)
+        df.attrs['duplicates_removed'] = int(len(keep) - keep.sum())
+        df.attrs['seen_rows_skipped'] = skipped
+
+    if len(df):
+        _check_columns(df, columns)
+        df = df[columns]
+    return apply_schema(df)
+
+def _next_version(version, added):
+    """
+    Derives the version of the dataset after an append from the previous one and the new rows
+    """
+    fingerprints = row_fingerprints({name: added[name].to_numpy() for name in added.columns})
+    digest = hashlib.sha1(str(version).encode('utf-8'))
+    digest.update(fingerprints.tobytes())
+    return digest.hexdigest()[:16]
+
+def append_batch(batch, source=None):
+    """
+    Adds a batch of transactions to the shared dataset of a source
+
+    The batch goes through the same cleaning as a full load (missing values
+    dropped, duplicates removed, compact column types) and rows the dataset
+    already holds are skipped. Rows are copied into buffers with spare
+    capacity and the cube behind the KPIs is merged with the cube of the
+    batch alone, so an append costs time proportional to the batch, not to
+    the dataset. Other caches (range indexes, figures) are keyed by dataset
+    version and rebuild on first use.
+
+    Appended rows are kept in memory only: reloading the source drops them.
+
+    Returns a summary with the rows added, duplicates removed and rows skipped.
+    """
+    source = source or get_data_source()
+    started = time.perf_counter()
+
+    with _lock:
+        current = get_dataset(source)
+        version = dataset_version(current)
+        index = _fingerprint_index(source, current)
+        columns = list(current.columns)
+        added = _clean_batch(batch, columns, index)
+
+        summary = {
+            'rows_added': len(added),
+            'duplicates_removed': added.attrs.get('duplicates_removed', 0),
+            'seen_rows_skipped': added.attrs.get('seen_rows_skipped', 0),
+            'dataset_rows': len(current),
+            'dataset_version': version,
+        }
+
+        if len(added):
+            buffer_version, buffer = _buffers.get(source, (None, None))
+            if buffer is None or buffer_version != version:
+                # First append to this dataset: copy it once into buffers with room to grow
+                capacity = len(current) + max(len(added), int(len(current) * GROWTH_MARGIN))
+                buffer = ColumnBuffer(current, capacity, DEFAULT_MAX_MEMORY_MB * 2**20)
+                buffer.append(current)
+            buffer.append(added)
+
+            # Frames handed out earlier only see rows up to their own length, so they never change
+            df = pd.DataFrame(buffer.views(), copy=False)
+            df.attrs.update(current.attrs)
+            df.attrs['duplicates_removed'] = (
+                current.attrs.get('duplicates_removed', 0) + summary['duplicates_removed']
+            )
+            new_version = _next_version(version, added)
+            stamp_version(df, new_version)
+
+            # Merged before publishing: publish drops what was cached for the previous version
+            extend_cube(df, current, added)
+            dataset = publish(source, df)
+            index.extend(dataset)
+            _buffers[source] = (new_version, buffer)
+            summary.update(dataset_rows=len(dataset), dataset_version=new_version)
+
+        _indexes[source] = (summary['dataset_version'], index)
+
+    summary['seconds'] = time.perf_counter() - started
+    return summary
@@ -0,0 +1,683 @@
+"""
+Query backends: the shared in-memory frame (default) or partitioned Parquet files scanned on disk
+
+Pages ask a backend for aggregates (cube, time buckets, amount bins, top
+transactions, amount/hour range filters) and for the rows of a Time window
+(the live replay) instead of working on a DataFrame, so the same pages run
+on datasets that do not fit in memory.
+
+    CREDIT_CARD_BACKEND=parquet CREDIT_CARD_PARQUET_DIR=/data/partitions streamlit run app.py
+
+The Parquet backend runs its aggregations as SQL in DuckDB when it is
+installed (pip install duckdb) and otherwise scans the files batch by batch
+with pyarrow, reusing the in-memory kernels on every batch.
+"""
+import argparse
+import glob
+import hashlib
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from utils.charts import amount_bin_edges, bar_geometry, binned_amounts, bucket_table, bucketed_counts
+from utils.cube import N_AMOUNT_BINS, N_CLASSES, N_HOURS, build_cube, get_cube, merge_cubes
+from utils.data_loader import dataset_version, is_url, prepare_chunk
+from utils.dedupe import FingerprintIndex, duplicate_mask, row_fingerprints
+from utils.derived import (AMOUNT_EDGES, DERIVED_COLUMNS, SECONDS_PER_DAY, TIME_BUCKET_COLUMNS, bin_codes,
+                           buckets_per_day, compute_column)
+from utils.metrics import (binned_histogram, fraud_rate_grid, fraud_rate_grid_result, heatmap_amount_edges,
+                           histogram_result)
+from utils.parallel import aggregate
+from utils.range_index import get_range_index, hour_buckets
+from utils.registry import default_source, get_registry
+from utils.replay import feed_window, get_replay_feed
+from utils.schema import apply_schema
+from utils.sketch import DESCRIBE_QUANTILES, EXACT_MAX_ROWS, QuantileSketches, describe, describe_result, get_sketches
+from utils.snapshot import CACHE_DIR
+
+try:
+    import duckdb
+except ImportError:  # optional: the pyarrow scan is used instead
+    duckdb = None
+
+# 'pandas' (default) keeps the dataset in memory, 'parquet' queries the files in PARQUET_DIR
+BACKEND = os.environ.get('CREDIT_CARD_BACKEND', 'pandas')
+
+# Folder of the partitioned Parquet dataset (one day=N folder per day of Time);
+# with several registered datasets, one subfolder per dataset key
+PARQUET_DIR = os.environ.get('CREDIT_CARD_PARQUET_DIR', os.path.join(CACHE_DIR, 'partitions'))
+
+# Columns the aggregations read; the features are never scanned
+SCAN_COLUMNS = ['Time', 'Amount', 'Class']
+
+# Rows per batch when scanning without DuckDB
+BATCH_ROWS = 1_000_000
+
+# Rows parsed per chunk when converting a CSV into partitions
+CONVERT_CHUNK_ROWS = 500_000
+
+# Rows of the top-transactions tables
+TOP_COLUMNS = ['Time', 'Amount', 'Class']
+
+def as_backend(data):
+    """
+    Returns data if it already is a backend, or a PandasBackend over a DataFrame
+    """
+    if isinstance(data, pd.DataFrame):
+        return PandasBackend(data)
+    return data
+
+def data_version(data):
+    """
+    Returns the version token of a DataFrame or a backend (None for unversioned frames)
+    """
+    if isinstance(data, pd.DataFrame):
+        return dataset_version(data)
+    return data.version
+
+class PandasBackend:
+    """
+    Answers the page aggregations from an in-memory frame (the default backend)
+    """
+
+    name = 'pandas'
+
+    def __init__(self, df):
+        self.df = df
+
+    @property
+    def version(self):
+        return dataset_version(self.df)
+
+    def cube(self):
+        return get_cube(self.df)
+
+    def bucketed_counts(self, granularity='hour', cls=None):
+        return aggregate(self.df, 'bucketed_counts', granularity=granularity, cls=cls)
+
+    def binned_histogram(self, edges):
+        return aggregate(self.df, 'binned_histogram', edges=edges)
+
+    def amount_histogram(self, cls, bins=50, log_scale=False):
+        amounts = self.df['Amount'].to_numpy(dtype=np.float64)
+        return binned_amounts(amounts[self.df['Class'].to_numpy() == cls], bins, log_scale)
+
+    def fraud_rate_grid(self, granularity='15min', amount_bins=40, log_scale=True, max_amount=5000):
+        return aggregate(self.df, 'fraud_rate_grid', granularity=granularity, amount_bins=amount_bins,
+                         log_scale=log_scale, max_amount=max_amount)
+
+    def top_transactions(self, n=10, cls=1):
+        rows = self.df[self.df['Class'] == cls].nlargest(n, 'Amount')
+        return rows[TOP_COLUMNS].reset_index(drop=True)
+
+    def range_summary(self, amount_range, hour_range, cls=0, granularity='hour', edges=AMOUNT_EDGES):
+        """
+        Returns count, sum and mean of the rows inside inclusive amount and hour ranges,
+        with their counts per time bucket (bucket_counts) and per amount bin (bin_counts)
+        """
+        index = get_range_index(self.df, cls=cls, granularity=granularity)
+        bucket_range = index.bucket_range(hour_range)
+        bucket_counts, _ = index.per_bucket(amount_range, bucket_range)
+        return dict(index.query(amount_range, bucket_range), bucket_counts=bucket_counts,
+                    bin_counts=index.count_by_bins(edges, amount_range, bucket_range))
+
+    def range_describe(self, amount_range, hour_range, cls=0, granularity='hour'):
+        """
+        Returns the utils.sketch.describe summary of the amounts inside the ranges
+        """
+        index = get_range_index(self.df, cls=cls, granularity=granularity)
+        return describe(index, amount_range, index.bucket_range(hour_range),
+                        sketches=get_sketches(self.df, granularity))
+
+    def time_span(self):
+        """
+        Returns the first and last Time and the number of rows
+        """
+        times = get_replay_feed(self.df)[0]
+        if len(times) == 0:
+            return 0.0, 0.0, 0
+        return float(times[0]), float(times[-1]), len(times)
+
+    def replay_window(self, start, end):
+        """
+        Returns (Time, Amount, Class) arrays of the rows with start <= Time < end, sorted by Time
+        """
+        return feed_window(get_replay_feed(self.df), start, end)
+
+def _sql_column(name):
+    """
+    Returns the SQL expression of a derived column, generated from the registry in utils.derived
+    """
+    spec = DERIVED_COLUMNS[name]
+    source = spec['source']
+    if spec['kernel'] == 'bucket':
+        expression = f"CAST(floor({source} / {spec['size']}) AS BIGINT)"
+        if 'modulo' in spec:
+            expression = f"({expression} % {spec['modulo']})"
+        return expression
+    if spec['kernel'] == 'bins':
+        return _sql_bin_codes(source, spec['edges'])
+    raise ValueError(f"No SQL form for derived column {name}")
+
+def _sql_bin_codes(column, edges):
+    """
+    SQL equivalent of utils.derived.bin_codes: the number of edges <= value
+    """
+    if len(edges) == 0:
+        return '0'
+    return '(' + ' + '.join(f'CAST({column} >= {float(edge)!r} AS INTEGER)' for edge in edges) + ')'
+
+class ParquetBackend:
+    """
+    Answers the page aggregations by scanning partitioned Parquet files
+
+    Only Time, Amount and Class are read, and only aggregates (a few hundred
+    numbers) are kept in memory, so the dataset can be much larger than RAM.
+    Results are cached per version of the file set.
+    """
+
+    name = 'parquet'
+
+    def __init__(self, path):
+        self.path = path
+        self.files = list_partitions(path)
+        if not self.files:
+            raise FileNotFoundError(
+                f"No Parquet files in {path}. Create them with: python -m utils.backend convert SOURCE {path}"
+            )
+        self.version = partitions_version(self.files)
+        self.engine = 'duckdb' if duckdb is not None else 'pyarrow'
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._connection = None
+        if duckdb is not None:
+            files = ', '.join("'" + path.replace("'", "''") + "'" for path in self.files)
+            self._connection = duckdb.connect()
+            self._connection.execute(f"CREATE VIEW transactions AS SELECT * FROM read_parquet([{files}])")
+
+    def _cached(self, key, build):
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        value = build()
+        with self._lock:
+            self._cache[key] = value
+        return value
+
+    def _sql(self, query):
+        """
+        Runs a query over the files (the view 'transactions') and returns numpy columns
+        """
+        # One cursor per query so concurrent sessions can query in parallel
+        cursor = self._connection.cursor()
+        try:
+            return cursor.execute(query).fetchnumpy()
+        finally:
+            cursor.close()
+
+    def _batches(self, columns=SCAN_COLUMNS):
+        """
+        Yields the files as small DataFrames of the requested columns
+        """
+        import pyarrow.dataset as ds
+
+        dataset = ds.dataset(self.files, format='parquet')
+        for batch in dataset.to_batches(columns=columns, batch_size=BATCH_ROWS):
+            yield batch.to_pandas()
+
+    def cube(self):
+        return self._cached('cube', self._build_cube)
+
+    def _build_cube(self):
+        if self.engine == 'pyarrow':
+            cube = None
+            for batch in self._batches():
+                part = build_cube(batch)
+                cube = part if cube is None else merge_cubes(cube, part)
+            return cube
+
+        rows = self._sql(f"""
+            SELECT Class, {_sql_column('Hour_Of_Day')} AS hour, {_sql_column('Amount_Category')} AS tier,
+                   count(*) AS count, sum(Amount) AS sum, sum(Amount * Amount) AS sumsq,
+                   min(Amount) AS min, max(Amount) AS max
+            FROM transactions GROUP BY ALL
+        """)
+        shape = (N_CLASSES, N_HOURS, N_AMOUNT_BINS)
+        cube = {
+            'count': np.zeros(shape, dtype=np.int64),
+            'sum': np.zeros(shape),
+            'sumsq': np.zeros(shape),
+            'min': np.full(shape, np.inf),
+            'max': np.full(shape, -np.inf),
+        }
+        cells = (rows['Class'].astype(np.intp), rows['hour'].astype(np.intp), rows['tier'].astype(np.intp))
+        for stat in cube:
+            cube[stat][cells] = rows[stat]
+        return cube
+
+    def bucketed_counts(self, granularity='hour', cls=None):
+        return self._cached(('bucketed_counts', granularity, cls),
+                            lambda: self._build_bucketed_counts(granularity, cls)).copy()
+
+    def _build_bucketed_counts(self, granularity, cls):
+        if self.engine == 'pyarrow':
+            parts = [bucketed_counts(batch, granularity, cls) for batch in self._batches()]
+            totals = pd.concat(parts).groupby('Bucket')[['count', 'amount']].sum()
+            buckets, counts, amounts = totals.index.to_numpy(), totals['count'].to_numpy(), totals['amount'].to_numpy()
+        else:
+            where = '' if cls is None else f'WHERE Class = {int(cls)}'
+            rows = self._sql(f"""
+                SELECT {_sql_column(TIME_BUCKET_COLUMNS[granularity])} AS bucket,
+                       count(*) AS count, sum(Amount) AS amount
+                FROM transactions {where} GROUP BY ALL
+            """)
+            buckets, counts, amounts = rows['bucket'].astype(np.intp), rows['count'], rows['amount']
+
+        if granularity == 'day':
+            n_buckets = int(buckets.max()) + 1 if len(buckets) else 0
+        else:
+            n_buckets = buckets_per_day(granularity)
+        bucket_counts = np.zeros(n_buckets, dtype=np.int64)
+        bucket_amounts = np.zeros(n_buckets)
+        bucket_counts[buckets] = counts
+        bucket_amounts[buckets] = amounts
+        return bucket_table(granularity, bucket_counts, bucket_amounts)
+
+    def binned_histogram(self, edges):
+        edges = sorted(edges)
+        return self._cached(('binned_histogram', tuple(edges)), lambda: self._build_binned_histogram(edges))
+
+    def _build_binned_histogram(self, edges):
+        n_bins = len(edges) + 1
+        if self.engine == 'pyarrow':
+            counts, sums = {}, {}
+            for batch in self._batches():
+                part = binned_histogram(batch, edges)
+                for group, count, total in zip(part['groups'], part['count'], part['sum']):
+                    counts[group] = counts.get(group, 0) + count
+                    sums[group] = sums.get(group, 0) + total
+            groups = sorted(counts)
+            return histogram_result(edges, groups,
+                                    np.array([counts[g] for g in groups]).reshape(len(groups), n_bins),
+                                    np.array([sums[g] for g in groups]).reshape(len(groups), n_bins))
+
+        rows = self._sql(f"""
+            SELECT Class, {_sql_bin_codes('Amount', edges)} AS bin, count(*) AS count, sum(Amount) AS sum
+            FROM transactions GROUP BY ALL
+        """)
+        groups = np.unique(rows['Class'])
+        group_codes = np.searchsorted(groups, rows['Class'])
+        counts = np.zeros((len(groups), n_bins), dtype=np.int64)
+        sums = np.zeros((len(groups), n_bins))
+        counts[group_codes, rows['bin']] = rows['count']
+        sums[group_codes, rows['bin']] = rows['sum']
+        return histogram_result(edges, groups.tolist(), counts, sums)
+
+    def amount_histogram(self, cls, bins=50, log_scale=False):
+        return self._cached(('amount_histogram', cls, bins, log_scale),
+                            lambda: self._build_amount_histogram(cls, bins, log_scale))
+
+    def _build_amount_histogram(self, cls, bins, log_scale):
+        # First pass: the smallest, largest and smallest positive amount, which fix the bin edges
+        if self.engine == 'pyarrow':
+            extremes = []
+            for batch in self._batches():
+                amounts = batch['Amount'].to_numpy(dtype=np.float64)[batch['Class'].to_numpy() == cls]
+                positive = amounts[amounts > 0]
+                if len(amounts):
+                    extremes += [amounts.min(), amounts.max()]
+                if len(positive):
+                    extremes.append(positive.min())
+        else:
+            row = self._sql(f"""
+                SELECT min(Amount) AS low, max(Amount) AS high, min(Amount) FILTER (WHERE Amount > 0) AS low_positive
+                FROM transactions WHERE Class = {int(cls)}
+            """)
+            extremes = [float(row[key][0]) for key in row if not np.ma.is_masked(row[key][0])]
+        # amount_bin_edges only looks at these three values, so the edges match the in-memory ones
+        edges = amount_bin_edges(np.array(extremes, dtype=np.float64), bins, log_scale)
+
+        # Second pass: counts per bin (amounts below the first edge fall in the first bin)
+        counts = np.zeros(bins, dtype=np.int64)
+        if self.engine == 'pyarrow':
+            for batch in self._batches():
+                amounts = batch['Amount'].to_numpy(dtype=np.float64)[batch['Class'].to_numpy() == cls]
+                counts += np.histogram(np.clip(amounts, edges[0], edges[-1]), bins=edges)[0]
+        elif extremes:
+            rows = self._sql(f"""
+                SELECT {_sql_bin_codes('Amount', edges[1:-1])} AS bin, count(*) AS count
+                FROM transactions WHERE Class = {int(cls)} GROUP BY ALL
+            """)
+            counts[rows['bin'].astype(np.intp)] = rows['count']
+        return bar_geometry(edges, counts, log_scale)
+
+    def fraud_rate_grid(self, granularity='15min', amount_bins=40, log_scale=True, max_amount=5000):
+        return self._cached(('fraud_rate_grid', granularity, amount_bins, log_scale, max_amount),
+                            lambda: self._build_fraud_rate_grid(granularity, amount_bins, log_scale, max_amount))
+
+    def _build_fraud_rate_grid(self, granularity, amount_bins, log_scale, max_amount):
+        edges = heatmap_amount_edges(amount_bins, log_scale, max_amount)
+        shape = (len(edges) + 1, buckets_per_day(granularity))
+        counts = np.zeros(shape, dtype=np.int64)
+        frauds = np.zeros(shape, dtype=np.int64)
+        if self.engine == 'pyarrow':
+            for batch in self._batches():
+                part = fraud_rate_grid(batch, granularity, amount_bins, log_scale, max_amount)
+                counts += part['count']
+                frauds += part['fraud']
+        else:
+            rows = self._sql(f"""
+                SELECT {_sql_bin_codes('Amount', edges)} AS row, {_sql_column(TIME_BUCKET_COLUMNS[granularity])} AS bucket,
+                       count(*) AS count, sum(Class) AS fraud
+                FROM transactions GROUP BY ALL
+            """)
+            cells = (rows['row'].astype(np.intp), rows['bucket'].astype(np.intp))
+            counts[cells] = rows['count']
+            frauds[cells] = rows['fraud']
+        return fraud_rate_grid_result(granularity, edges, counts, frauds)
+
+    def top_transactions(self, n=10, cls=1):
+        return self._cached(('top_transactions', n, cls), lambda: self._build_top_transactions(n, cls)).copy()
+
+    def _build_top_transactions(self, n, cls):
+        if self.engine == 'pyarrow':
+            best = None
+            for batch in self._batches(TOP_COLUMNS):
+                candidates = batch[batch['Class'] == cls].nlargest(n, 'Amount')
+                best = candidates if best is None else pd.concat([best, candidates]).nlargest(n, 'Amount')
+            return (best if best is not None else pd.DataFrame(columns=TOP_COLUMNS)).reset_index(drop=True)
+
+        rows = self._sql(f"""
+            SELECT {', '.join(TOP_COLUMNS)} FROM transactions
+            WHERE Class = {int(cls)} ORDER BY Amount DESC LIMIT {int(n)}
+        """)
+        return pd.DataFrame(rows)[TOP_COLUMNS]
+
+    # Range queries follow the page sliders, so they are not cached: each one scans the three columns
+
+    def _range_where(self, amount_range, hour_range, cls, granularity):
+        first, last = hour_buckets(hour_range, granularity)
+        return (f"Class = {int(cls)} AND Amount BETWEEN {float(amount_range[0])!r} AND {float(amount_range[1])!r} "
+                f"AND {_sql_column(TIME_BUCKET_COLUMNS[granularity])} BETWEEN {first} AND {last}")
+
+    def _range_batches(self, amount_range, hour_range, cls, granularity):
+        """
+        Yields the rows of every batch inside the ranges, with their time buckets (pyarrow scan)
+        """
+        first, last = hour_buckets(hour_range, granularity)
+        low, high = amount_range
+        for batch in self._batches():
+            buckets = compute_column(batch, TIME_BUCKET_COLUMNS[granularity]).to_numpy(dtype=np.intp)
+            amounts = batch['Amount'].to_numpy(dtype=np.float64)
+            mask = ((batch['Class'].to_numpy() == cls) & (amounts >= low) & (amounts <= high)
+                    & (buckets >= first) & (buckets <= last))
+            yield batch[mask], buckets[mask]
+
+    def range_summary(self, amount_range, hour_range, cls=0, granularity='hour', edges=AMOUNT_EDGES):
+        edges = sorted(edges)
+        bucket_counts = np.zeros(buckets_per_day(granularity), dtype=np.int64)
+        bin_counts = np.zeros(len(edges) + 1, dtype=np.int64)
+        if self.engine == 'pyarrow':
+            total = 0.0
+            for rows, buckets in self._range_batches(amount_range, hour_range, cls, granularity):
+                amounts = rows['Amount'].to_numpy(dtype=np.float64)
+                bucket_counts += np.bincount(buckets, minlength=len(bucket_counts))
+                bin_counts += np.bincount(bin_codes(amounts, edges), minlength=len(bin_counts))
+                total += float(amounts.sum())
+        else:
+            rows = self._sql(f"""
+                SELECT {_sql_column(TIME_BUCKET_COLUMNS[granularity])} AS bucket,
+                       {_sql_bin_codes('Amount', edges)} AS bin, count(*) AS count, sum(Amount) AS sum
+                FROM transactions WHERE {self._range_where(amount_range, hour_range, cls, granularity)}
+                GROUP BY ALL
+            """)
+            np.add.at(bucket_counts, rows['bucket'].astype(np.intp), rows['count'])
+            np.add.at(bin_counts, rows['bin'].astype(np.intp), rows['count'])
+            total = float(rows['sum'].sum())
+        count = int(bucket_counts.sum())
+        return {'count': count, 'sum': total, 'mean': total / count if count > 0 else 0,
+                'bucket_counts': bucket_counts, 'bin_counts': bin_counts}
+
+    def range_describe(self, amount_range, hour_range, cls=0, granularity='hour'):
+        if self.engine == 'pyarrow':
+            return self._scan_describe(amount_range, hour_range, cls, granularity)
+
+        # DuckDB computes exact quantiles, interpolated like numpy
+        quantiles = ', '.join(f'quantile_cont(Amount, {q!r}) AS q{i}' for i, q in enumerate(DESCRIBE_QUANTILES))
+        row = self._sql(f"""
+            SELECT count(*) AS count, avg(Amount) AS mean, stddev_samp(Amount) AS std,
+                   min(Amount) AS min, max(Amount) AS max, {quantiles}
+            FROM transactions WHERE {self._range_where(amount_range, hour_range, cls, granularity)}
+        """)
+        values = {key: np.nan if np.ma.is_masked(row[key][0]) else float(row[key][0]) for key in row}
+        return describe_result(values, [values[f'q{i}'] for i in range(len(DESCRIBE_QUANTILES))], exact=True)
+
+    def _scan_describe(self, amount_range, hour_range, cls, granularity):
+        """
+        describe() in one scan: exact moments, and quantiles from the gathered amounts
+        while the selection is small, else from quantile sketches merged across batches
+        """
+        count, total, sumsq, low, high = 0, 0.0, 0.0, np.inf, -np.inf
+        gathered = []
+        sketches = None
+        for rows, _ in self._range_batches(amount_range, hour_range, cls, granularity):
+            if len(rows) == 0:
+                continue
+            amounts = rows['Amount'].to_numpy(dtype=np.float64)
+            count += len(amounts)
+            total += float(amounts.sum())
+            sumsq += float((amounts * amounts).sum())
+            low, high = min(low, float(amounts.min())), max(high, float(amounts.max()))
+            part = QuantileSketches(rows, granularity=granularity)
+            sketches = part if sketches is None else sketches.merge(part)
+            if gathered is not None:
+                gathered.append(amounts)
+                if count > EXACT_MAX_ROWS:
+                    gathered = None
+
+        if count == 0:
+            stats = {'count': 0, 'mean': np.nan, 'std': np.nan, 'min': np.nan, 'max': np.nan}
+            return describe_result(stats, [np.nan] * len(DESCRIBE_QUANTILES), exact=True)
+        mean = total / count
+        variance = (sumsq - count * mean * mean) / (count - 1) if count > 1 else np.nan
+        stats = {'count': count, 'mean': mean, 'std': max(variance, 0.0) ** 0.5 if count > 1 else np.nan,
+                 'min': low, 'max': high}
+        if gathered is not None:
+            quantiles = np.percentile(np.concatenate(gathered), [q * 100 for q in DESCRIBE_QUANTILES])
+        else:
+            counts = sketches.merged(cls, (0, sketches.n_buckets - 1))
+            quantiles = np.clip(sketches.quantiles(DESCRIBE_QUANTILES, counts), low, high)
+        return describe_result(stats, quantiles, exact=gathered is not None)
+
+    def time_span(self):
+        return self._cached('time_span', self._build_time_span)
+
+    def _build_time_span(self):
+        if self.engine == 'pyarrow':
+            first, last, rows = np.inf, -np.inf, 0
+            for batch in self._batches(['Time']):
+                if len(batch):
+                    times = batch['Time'].to_numpy(dtype=np.float64)
+                    first, last, rows = min(first, times.min()), max(last, times.max()), rows + len(times)
+        else:
+            row = self._sql("SELECT min(Time) AS first, max(Time) AS last, count(*) AS rows FROM transactions")
+            first, last, rows = row['first'][0], row['last'][0], int(row['rows'][0])
+        if rows == 0:
+            return 0.0, 0.0, 0
+        return float(first), float(last), rows
+
+    def replay_window(self, start, end):
+        if self.engine == 'pyarrow':
+            import pyarrow.dataset as ds
+
+            # Row groups outside the window are skipped using the Parquet statistics
+            window = (ds.field('Time') >= float(start)) & (ds.field('Time') < float(end))
+            rows = ds.dataset(self.files, format='parquet').to_table(columns=SCAN_COLUMNS, filter=window).to_pandas()
+            rows = rows.sort_values('Time', kind='stable')
+        else:
+            rows = self._sql(f"""
+                SELECT Time, Amount, Class FROM transactions
+                WHERE Time >= {float(start)!r} AND Time < {float(end)!r} ORDER BY Time
+            """)
+        return (np.asarray(rows['Time'], dtype=np.float64), np.asarray(rows['Amount'], dtype=np.float64),
+                np.asarray(rows['Class'], dtype=np.int8))
+
+def list_partitions(path):
+    """
+    Returns the Parquet files of a partitioned dataset, in a stable order
+    """
+    return sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True))
+
+def partitions_version(files):
+    """
+    Returns a token that changes whenever a partition file is added, removed or rewritten
+    """
+    digest = hashlib.sha1()
+    for path in files:
+        info = os.stat(path)
+        digest.update(f'{path}:{info.st_size}:{info.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def partitions_dir(source=None):
+    """
+    Returns the folder of the Parquet dataset converted from a registered source (default: the first one)
+
+    With a single registered source this is PARQUET_DIR itself; with several
+    (CREDIT_CARD_DATASETS) it is the subfolder named by the source's key.
+    """
+    registry = get_registry()
+    source = source or default_source()
+    keys = [key for key, registered in registry.items() if registered == source]
+    if not keys:
+        raise ValueError(f"{source} is not a registered dataset, so it has no Parquet folder "
+                         f"(registered: {', '.join(registry.values())})")
+    if len(registry) == 1:
+        return PARQUET_DIR
+    return os.path.join(PARQUET_DIR, keys[0])
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend(source=None):
+    """
+    Returns the configured backend (CREDIT_CARD_BACKEND) for a source
+
+    The default wraps the shared in-memory dataset. The Parquet backend reads
+    the source's folder (see partitions_dir); one is shared by every session
+    per folder and is recreated when its files change.
+    """
+    if BACKEND != 'parquet':
+        from utils.dataset import get_dataset
+        return PandasBackend(get_dataset(source))
+
+    path = partitions_dir(source)
+    version = partitions_version(list_partitions(path))
+    with _backends_lock:
+        backend = _backends.get(path)
+        if backend is None or backend.version != version:
+            backend = ParquetBackend(path)
+            _backends[path] = backend
+    return backend
+
+class _PartitionIndex(FingerprintIndex):
+    """
+    Fingerprints of the rows written to one day's partition, to drop later repeats of them
+
+    Only the fingerprints are kept in memory (16 bytes per row): a match is
+    confirmed against the rows read back from their file, which only happens
+    for actual duplicates and the rare hash collision.
+    """
+
+    def __init__(self, chunk):
+        super().__init__(chunk.iloc[:0], chunk.columns)
+        self._files = []
+        self._starts = []
+
+    def add(self, part, path):
+        """
+        Indexes the rows of a part just written to path
+        """
+        self._starts.append(len(self))
+        self._files.append(path)
+        fingerprints = row_fingerprints({name: part[name].to_numpy() for name in self.columns})
+        self._insert(fingerprints, np.arange(len(self), len(self) + len(part)))
+
+    def _stored(self, rows):
+        numbers = np.searchsorted(self._starts, rows, side='right') - 1
+        stored = {name: np.empty(len(rows), dtype=values.dtype) for name, values in self._values.items()}
+        for number in np.unique(numbers):
+            picked = numbers == number
+            part = pd.read_parquet(self._files[number], columns=self.columns)
+            local = rows[picked] - self._starts[number]
+            for name in self.columns:
+                stored[name][picked] = part[name].to_numpy()[local]
+        return stored
+
+def convert_to_partitions(source, dest, chunk_rows=CONVERT_CHUNK_ROWS):
+    """
+    Converts a CSV into a Parquet dataset partitioned by day, without loading it whole
+
+    Chunks are cleaned like the in-memory loader and written to their day's
+    folder, one file per chunk. Duplicate rows always share their Time, hence
+    their day, so each chunk is de-duplicated against itself and against the
+    fingerprints of its day's rows written so far, which removes every
+    duplicate while holding one chunk and the fingerprints in memory.
+    Returns the number of rows written.
+    """
+    if is_url(source):
+        from utils.download import download
+        # Next to the staging folder: dest itself is replaced at the end
+        path = dest.rstrip(os.sep) + '.download.csv'
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        download(source, path)
+        try:
+            return convert_to_partitions(path, dest, chunk_rows)
+        finally:
+            os.remove(path)
+
+    staging = dest.rstrip(os.sep) + '.staging'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    indexes = {}   # day -> _PartitionIndex of its written rows
+    rows = 0
+    for number, chunk in enumerate(pd.read_csv(source, chunksize=chunk_rows)):
+        chunk = apply_schema(prepare_chunk(chunk))
+        chunk = chunk[~duplicate_mask({name: chunk[name].to_numpy() for name in chunk.columns})]
+        days = (chunk['Time'].to_numpy() // SECONDS_PER_DAY).astype(np.int64)
+        for day in np.unique(days):
+            part = chunk[days == day]
+            index = indexes.get(day)
+            if index is None:
+                index = indexes[day] = _PartitionIndex(part)
+            elif len(index):
+                part = part[~index.seen_mask(part)]
+            if len(part) == 0:
+                continue
+            folder = os.path.join(staging, f'day={day}')
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f'chunk-{number:05d}.parquet')
+            part.to_parquet(path, index=False)
+            index.add(part, path)
+            rows += len(part)
+
+    # Swap the finished dataset in, so readers never see a half-written one
+    if os.path.isdir(dest):
+        shutil.rmtree(dest)
+    os.replace(staging, dest)
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the source CSV into a partitioned Parquet dataset")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    convert = subcommands.add_parser('convert', help="write SOURCE as Parquet files partitioned by day")
+    convert.add_argument('source', nargs='?', default=None, help="CSV path or URL (default: the configured source)")
+    convert.add_argument('dest', nargs='?', default=None,
+                         help="output folder (default: the folder the parquet backend reads for SOURCE)")
+    convert.add_argument('--chunk-rows', type=int, default=CONVERT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    source = args.source or default_source()
+    dest = args.dest or partitions_dir(source)
+    rows = convert_to_partitions(source, dest, args.chunk_rows)
+    print(f"Wrote {rows:,} rows to {dest}")
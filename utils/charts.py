@@ -1,107 +1,202 @@
 """
 Creates interactive charts using Plotly
+
+Plotly is imported inside each chart builder, so importing this module
+(e.g. for bucketed_counts) stays cheap until a chart is actually drawn.
 """
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import numpy as np
 import pandas as pd
+from utils.derived import TIME_BUCKET_COLUMNS, bucket_label, buckets_per_day, compute_column
+
+def bucketed_counts(df, granularity='hour', cls=None):
+    """
+    Counts transactions and sums amounts per time bucket with one bincount
+
+    granularity: 'minute', '5min', '15min', 'hour' (buckets within the day) or 'day'
+    cls: only count this Class (0 = normal, 1 = fraud); None counts everything
+    """
+    buckets = compute_column(df, TIME_BUCKET_COLUMNS[granularity]).to_numpy(dtype=np.intp)
+    amounts = df['Amount'].to_numpy(dtype=np.float64)
+    if cls is not None:
+        # Select the class on the arrays only, without copying the frame
+        mask = df['Class'].to_numpy() == cls
+        buckets, amounts = buckets[mask], amounts[mask]
+    
+    if granularity == 'day':
+        n_buckets = int(buckets.max()) + 1 if len(buckets) else 0
+    else:
+        n_buckets = buckets_per_day(granularity)
+    
+    return bucket_table(
+        granularity,
+        np.bincount(buckets, minlength=n_buckets),
+        np.bincount(buckets, weights=amounts, minlength=n_buckets),
+    )
+
+def bucket_table(granularity, counts, amounts):
+    """
+    Packs per-bucket counts and amounts into the frame returned by bucketed_counts
+    """
+    return pd.DataFrame({
+        'Bucket': np.arange(len(counts)),
+        'Label': [bucket_label(bucket, granularity) for bucket in range(len(counts))],
+        'count': counts,
+        'amount': amounts,
+    })
 
-def create_fraud_timeline(df):
+def create_fraud_timeline(data, granularity='hour'):
     """
-    Creates a line chart showing fraud distribution over 24 hours
+    Creates a line chart showing fraud distribution over the day
+
+    data: a DataFrame or a query backend (utils.backend)
     """
-    # Count fraud transactions per hour
-    fraud_by_hour = df[df['Class'] == 1].groupby('Hour').size().reset_index(name='count')
+    import plotly.express as px
+    from utils.backend import as_backend
+    
+    # Count fraud transactions per time bucket
+    fraud_by_bucket = as_backend(data).bucketed_counts(granularity, cls=1)
     
     # Create line chart
     fig = px.line(
-        fraud_by_hour,
-        x='Hour',
+        fraud_by_bucket,
+        x='Label',
         y='count',
-        title='Fraud Transactions by Hour',
+        title='Fraud Transactions by Hour' if granularity == 'hour' else 'Fraud Transactions over Time',
         markers=True
     )
     
     # Customize the chart
     fig.update_traces(line_color='red', line_width=3)
     fig.update_layout(
-        xaxis_title='Hour of Day',
+        xaxis_title='Day' if granularity == 'day' else 'Time of Day',
         yaxis_title='Number of Fraud Transactions',
         hovermode='x unified'
     )
     
     return fig
 
-def create_amount_distribution(df):
+def amount_bin_edges(amounts, bins=50, log_scale=False):
+    """
+    Returns histogram bin edges for an array of amounts
+
+    With log_scale the edges are spaced evenly on a log axis, which suits
+    the heavily skewed Amount column (zero amounts fall in the first bin).
+    """
+    if len(amounts) == 0:
+        return np.linspace(0, 1, bins + 1)
+    low, high = float(amounts.min()), float(amounts.max())
+    if log_scale:
+        positive = amounts[amounts > 0]
+        low = float(positive.min()) if len(positive) else 0.01
+        high = max(high, low * 10)
+        return np.geomspace(low, high, bins + 1)
+    if high <= low:
+        high = low + 1
+    return np.linspace(low, high, bins + 1)
+
+def binned_amounts(amounts, bins=50, log_scale=False):
+    """
+    Bins amounts on the server and returns (centers, widths, counts) for a bar trace
+    """
+    edges = amount_bin_edges(amounts, bins, log_scale)
+    # Amounts below the first log edge (zeros) are counted in the first bin
+    counts, _ = np.histogram(np.clip(amounts, edges[0], edges[-1]), bins=edges)
+    return bar_geometry(edges, counts, log_scale)
+
+def bar_geometry(edges, counts, log_scale=False):
+    """
+    Returns (centers, widths, counts) of the bars drawn for binned counts
+    """
+    if log_scale:
+        centers = np.sqrt(edges[:-1] * edges[1:])
+    else:
+        centers = (edges[:-1] + edges[1:]) / 2
+    return centers, np.diff(edges), counts
+
+def create_amount_distribution(data, bins=50, log_scale=False):
     """
     Creates histogram comparing normal vs fraud amounts
+
+    Amounts are binned here and sent as bar traces, so the figure only
+    carries one value per bin instead of every transaction amount.
+    data: a DataFrame or a query backend (utils.backend)
     """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    from utils.backend import as_backend
+    
+    backend = as_backend(data)
+    
     # Create subplot with two charts side by side
     fig = make_subplots(
         rows=1, cols=2,
         subplot_titles=('Normal Transactions', 'Fraud Transactions')
     )
     
-    # Get amounts for normal and fraud transactions
-    normal_amounts = df[df['Class'] == 0]['Amount']
-    fraud_amounts = df[df['Class'] == 1]['Amount']
-    
-    # Add normal transactions histogram
-    fig.add_trace(
-        go.Histogram(x=normal_amounts, nbinsx=50, name='Normal', marker_color='green'),
-        row=1, col=1
-    )
-    
-    # Add fraud transactions histogram
-    fig.add_trace(
-        go.Histogram(x=fraud_amounts, nbinsx=50, name='Fraud', marker_color='red'),
-        row=1, col=2
-    )
+    # Add one bar trace per class: normal (green) on the left, fraud (red) on the right
+    for col, (name, color, cls) in enumerate([('Normal', 'green', 0), ('Fraud', 'red', 1)], start=1):
+        centers, widths, counts = backend.amount_histogram(cls, bins, log_scale)
+        # Explicit widths are in linear units, so they only fit a linear axis
+        fig.add_trace(
+            go.Bar(x=centers, y=counts, width=None if log_scale else widths, name=name, marker_color=color),
+            row=1, col=col
+        )
     
     # Update layout
     fig.update_layout(
         title='Amount Distribution: Normal vs Fraud',
         height=400,
-        showlegend=False
+        showlegend=False,
+        bargap=0
     )
     
-    fig.update_xaxes(title_text="Amount ($)", row=1, col=1)
-    fig.update_xaxes(title_text="Amount ($)", row=1, col=2)
+    axis_type = 'log' if log_scale else 'linear'
+    fig.update_xaxes(title_text="Amount ($)", type=axis_type, row=1, col=1)
+    fig.update_xaxes(title_text="Amount ($)", type=axis_type, row=1, col=2)
     fig.update_yaxes(title_text="Count", row=1, col=1)
     
     return fig
 
-def create_fraud_heatmap(df):
+def create_fraud_heatmap(data, granularity='hour', amount_bins=20, log_scale=True, max_amount=5000):
     """
-    Creates heatmap showing fraud rate by hour and amount category
+    Creates heatmap showing fraud rate by time of day and amount
+
+    data: a DataFrame or a query backend (utils.backend)
+    granularity: width of the time columns ('minute', '5min', '15min' or 'hour')
+    amount_bins: number of amount rows below max_amount; a last row holds
+                 every larger amount, so nothing is left out
     """
-    # Create amount bins
-    df_copy = df.copy()
-    df_copy['Amount_Bin'] = pd.cut(
-        df_copy['Amount'], 
-        bins=[0, 100, 500, 1000, 5000], 
-        labels=['0-100', '100-500', '500-1000', '>1000']
-    )
+    import plotly.graph_objects as go
+    from utils.backend import as_backend
     
-    # Create pivot table for heatmap
-    heatmap_data = df_copy.pivot_table(
-        values='Class',
-        index='Amount_Bin',
-        columns=pd.cut(df_copy['Hour'], bins=24, labels=[f'{i:02d}' for i in range(24)]),
-        aggfunc='mean'
-    ).fillna(0)
-    
-    # Create heatmap
-    fig = px.imshow(
-        heatmap_data,
-        labels=dict(x="Hour", y="Amount Category", color="Fraud Rate"),
-        color_continuous_scale='Reds',
-        aspect="auto"
-    )
+    grid = as_backend(data).fraud_rate_grid(granularity, amount_bins, log_scale, max_amount)
+    
+    fig = go.Figure(go.Heatmap(
+        z=grid['rate'],
+        x=grid['bucket_labels'],
+        y=grid['amount_labels'],
+        customdata=np.dstack([grid['fraud'], grid['count']]),
+        colorscale='Reds',
+        colorbar=dict(title='Fraud Rate (%)'),
+        hovertemplate=(
+            'Time: %{x}<br>Amount: %{y}<br>Fraud rate: %{z:.2f}%<br>'
+            'Frauds: %{customdata[0]:,} of %{customdata[1]:,}<extra></extra>'
+        ),
+    ))
     
     fig.update_layout(
-        title='Fraud Rate Heatmap: Hour vs Amount',
-        height=400
+        title='Fraud Rate Heatmap: Time of Day vs Amount',
+        xaxis_title='Time of Day',
+        yaxis_title='Amount',
+        height=max(400, 14 * len(grid['amount_labels'])),
     )
     
-    return fig
\ No newline at end of file
+    return fig
+
+# Figures shown when the pages open with their default settings
+# (rendered ahead of time by the warm-up thread and the precompute job)
+DEFAULT_FIGURES = [
+    (create_fraud_timeline, {'granularity': 'hour'}),
+    (create_amount_distribution, {'bins': 50, 'log_scale': False}),
+    (create_fraud_heatmap, {'granularity': 'hour', 'amount_bins': 20}),
+]
@@ -0,0 +1,83 @@
+"""
+Aggregate cube of transaction counts and amounts by class, hour and amount tier
+"""
+import numpy as np
+from utils.data_loader import cached_by_version, remember_by_version, version_cache
+from utils.derived import AMOUNT_EDGES, bin_codes, compute_column
+from utils.parallel import aggregate
+
+# Cube dimensions: Class (0/1) x hour of day (0-23) x amount tier
+N_CLASSES = 2
+N_HOURS = 24
+N_AMOUNT_BINS = len(AMOUNT_EDGES) + 1
+
+# Cubes kept in memory: one per dataset version
+MAX_CACHED_CUBES = 1
+_cube_cache = version_cache()
+
+def build_cube(df):
+    """
+    Aggregates the frame into a cube of shape (class, hour, amount tier)
+
+    Each cell holds the count, sum, sum of squares, min and max of Amount,
+    which is enough to answer every KPI, timeline and breakdown on the pages.
+    """
+    amount = df['Amount'].to_numpy(dtype=np.float64)
+    classes = df['Class'].to_numpy(dtype=np.intp)
+    hours = compute_column(df, 'Hour_Of_Day').to_numpy(dtype=np.intp)
+    tiers = bin_codes(amount, AMOUNT_EDGES)
+
+    # Flat cell number for every row, then one bincount per statistic
+    shape = (N_CLASSES, N_HOURS, N_AMOUNT_BINS)
+    size = N_CLASSES * N_HOURS * N_AMOUNT_BINS
+    cells = (classes * N_HOURS + hours) * N_AMOUNT_BINS + tiers
+
+    minimum = np.full(size, np.inf)
+    maximum = np.full(size, -np.inf)
+    np.minimum.at(minimum, cells, amount)
+    np.maximum.at(maximum, cells, amount)
+
+    return {
+        'count': np.bincount(cells, minlength=size).reshape(shape),
+        'sum': np.bincount(cells, weights=amount, minlength=size).reshape(shape),
+        'sumsq': np.bincount(cells, weights=amount * amount, minlength=size).reshape(shape),
+        'min': minimum.reshape(shape),
+        'max': maximum.reshape(shape),
+    }
+
+def merge_cubes(a, b):
+    """
+    Combines the cubes of two disjoint sets of rows into the cube of their union
+    """
+    return {
+        'count': a['count'] + b['count'],
+        'sum': a['sum'] + b['sum'],
+        'sumsq': a['sumsq'] + b['sumsq'],
+        'min': np.minimum(a['min'], b['min']),
+        'max': np.maximum(a['max'], b['max']),
+    }
+
+def extend_cube(df, previous, added):
+    """
+    Returns the cube of df = previous + added rows, merging instead of rebuilding
+
+    Only the added rows are aggregated, and the result is cached for df's version.
+    """
+    cube = merge_cubes(get_cube(previous), build_cube(added))
+    return remember_cube(df, cube)
+
+def remember_cube(df, cube):
+    """
+    Caches a cube built elsewhere (merged, or read from a precomputed bundle) for df's version
+    """
+    remember_by_version(_cube_cache, df, 'cube', cube, MAX_CACHED_CUBES)
+    return cube
+
+def get_cube(df):
+    """
+    Returns the cube for a frame, building it only once per dataset version
+
+    Large datasets are aggregated in parallel Time ranges (utils.parallel).
+    Frames without a version (e.g. filtered subsets) get a fresh cube.
+    """
+    return cached_by_version(_cube_cache, df, 'cube', lambda frame: aggregate(frame, 'cube'), MAX_CACHED_CUBES)
@@ -1,104 +1,307 @@
 """
 Handles data loading and cleaning operations
 """
+import gzip
+import os
+import numpy as np
 import pandas as pd
-import streamlit as st
 import requests
-from io import BytesIO
+from utils import snapshot
+from utils.download import PROBE_HEADERS, download
+from utils.ingest import stream_clean_csv
+from utils.schema import apply_schema
+from utils.singleflight import SingleFlight
 
-@st.cache_data
-def load_and_clean_data():
+# URL for the credit card fraud dataset from GitHub repository
+# This URL points to a raw CSV file hosted on GitHub
+DEFAULT_SOURCE = "https://raw.githubusercontent.com/nsethi31/Kaggle-Data-Credit-Card-Fraud-Detection/master/creditcard.csv"
+
+# Seconds to wait for the server before giving up on a request
+REQUEST_TIMEOUT = 60
+
+# First bytes of a gzip file (servers may send the CSV compressed)
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Seconds a caller waits for a load already started by another caller
+# Can be overridden with the CREDIT_CARD_LOAD_TIMEOUT environment variable
+LOAD_TIMEOUT = float(os.environ.get('CREDIT_CARD_LOAD_TIMEOUT', 600))
+
+# Coalesces concurrent loads of the same source (and of the shared dataset)
+loads = SingleFlight()
+
+# Dataset versions a version cache keeps entries for; loaded datasets drop
+# theirs when evicted (forget_version), this only bounds stray versions
+MAX_CACHED_VERSIONS = 32
+
+# Every cache made by version_cache, so a version's entries can be found and dropped together
+_version_caches = []
+
+def get_data_source():
+    """
+    Returns the configured data source (URL or local CSV path)
+
+    Set the CREDIT_CARD_DATA_SOURCE environment variable to use another
+    URL (e.g. a local HTTP server) or a CSV file on disk.
+    """
+    return os.environ.get('CREDIT_CARD_DATA_SOURCE', DEFAULT_SOURCE)
+
+def is_url(source):
+    """
+    Checks whether the source is an HTTP(S) URL rather than a local path
+    """
+    return source.startswith(('http://', 'https://'))
+
+def prepare_chunk(df):
+    """
+    Cleans one chunk of raw transactions
+
+    Duplicate rows are removed afterwards across the whole file (see utils.dedupe).
+    Derived columns (Hour, Amount_Category, ...) are not stored: pages add the ones
+    they need with utils.derived.ensure_columns.
     """
-    Loads data directly from URL (no files in repo)
+    # Remove any rows with missing values
+    # This ensures data quality for analysis
+    return df.dropna()
+
+def _fetch_if_changed(source, meta):
     """
-    # URL for the credit card fraud dataset from GitHub repository
-    # This URL points to a raw CSV file hosted on GitHub
-    url = "https://raw.githubusercontent.com/nsethi31/Kaggle-Data-Credit-Card-Fraud-Detection/master/creditcard.csv"
+    Fetches the raw CSV only if it changed since the snapshot described by meta
+
+    Returns (path, validators) where path is None when the snapshot is still current.
+    URLs are revalidated with ETag / Last-Modified conditional requests and
+    downloaded to the cache folder (see utils.download), local files are
+    revalidated with their size and modification time.
+    """
+    if not is_url(source):
+        validators = snapshot.file_validators(source)
+        if meta is not None and snapshot.same_validators(meta, validators):
+            return None, validators
+        return source, validators
     
-    # Download the data from the URL
-    # requests.get() fetches the file content
-    response = requests.get(url)
+    # Ask the server to reply "304 Not Modified" if our copy is still current
+    # (and for the uncompressed file, so it can be downloaded in parallel ranges)
+    headers = dict(PROBE_HEADERS)
+    if meta is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
     
-    # Convert the response content to a pandas DataFrame
-    # BytesIO is used to handle the binary data
-    df = pd.read_csv(BytesIO(response.content))
+    try:
+        # stream=True so only the headers are read until we know the file changed
+        response = requests.get(source, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+    except requests.RequestException:
+        # Source unreachable: keep serving the last good snapshot if we have one
+        if meta is not None:
+            return None, meta
+        raise
     
-    # Remove any rows with missing values
-    # This ensures data quality for analysis
-    df = df.dropna()
+    if response.status_code == 304 and meta is not None:
+        response.close()
+        return None, meta
+    if not response.ok:
+        response.close()
+        response.raise_for_status()
     
-    # Remove duplicate rows if they exist
-    # Duplicates can skew analysis results
-    df = df.drop_duplicates()
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    # Download to disk (in parallel ranges when the server allows it) and
+    # check size / checksum before the parser sees any byte
+    path = snapshot.download_path(source)
+    try:
+        download(source, path, response=response, sha256=os.environ.get('CREDIT_CARD_DATA_SHA256'))
+    except requests.RequestException:
+        # Interrupted download: it resumes on the next load, meanwhile keep the snapshot
+        if meta is not None:
+            return None, meta
+        raise
+    return path, validators
+
+def read_csv(path, seen=None):
+    """
+    Streams a local CSV file (plain or gzip-compressed) through the chunked parser
+
+    seen: optional utils.dedupe.FingerprintIndex of rows to skip
+    """
+    with open(path, 'rb') as f:
+        if f.read(2) == GZIP_MAGIC:
+            f.seek(0)
+            with gzip.open(f) as csv:
+                return stream_clean_csv(csv, prepare_chunk, seen=seen)
+        f.seek(0)
+        return stream_clean_csv(f, prepare_chunk, size_hint=os.path.getsize(path), seen=seen)
+
+def load_and_clean_data(source=None, timeout=None):
+    """
+    Loads the cleaned dataset, from the local snapshot when the source is unchanged
+
+    The source defaults to the GitHub mirror (see get_data_source).
+    The CSV is only downloaded and parsed again when the source changed.
+    Concurrent calls for the same source are coalesced: one caller does the
+    download/parse/clean and the others receive the same frame (or the same
+    exception). timeout limits how long a coalesced caller waits (default:
+    CREDIT_CARD_LOAD_TIMEOUT seconds).
+    Pages should use utils.dataset.get_dataset, which shares one read-only
+    copy across all sessions instead of returning a new frame per call.
+    """
+    source = source or get_data_source()
+    if timeout is None:
+        timeout = LOAD_TIMEOUT
+    return loads.do(('load', source), lambda: _load_and_clean(source), timeout=timeout)
+
+def load_stats():
+    """
+    Returns how many loads ran and how many concurrent callers were coalesced into them
+    """
+    return loads.stats()
+
+def _load_and_clean(source):
+    """
+    Does the actual load for load_and_clean_data (one caller at a time per source)
+    """
+    # Revalidate the snapshot (if any) against the source
+    meta = snapshot.read_meta(source)
+    csv, validators = _fetch_if_changed(source, meta)
     
-    # Create a new column with readable transaction type
-    # Map 0 to 'Normal' and 1 to 'Fraud' for better understanding
-    df['Transaction_Type'] = df['Class'].map({0: 'Normal', 1: 'Fraud'})
+    if csv is None:
+        df = snapshot.load(source)
+        if df is not None:
+            return stamp_version(df, snapshot.make_version(source, validators))
+        # Snapshot file is unreadable: fetch the source unconditionally
+        csv, validators = _fetch_if_changed(source, None)
     
-    # Convert time from seconds to hours (24-hour format)
-    # Original time is in seconds from first transaction
-    # Dividing by 3600 converts to hours, % 24 gives hour of day
-    df['Hour'] = (df['Time'] / 3600) % 24
+    # Parse, clean and de-duplicate the CSV chunk by chunk
+    df = read_csv(csv)
+    if csv != source:
+        # The raw download is no longer needed once the snapshot is written below
+        os.remove(csv)
     
-    # Create amount in thousands for better readability
-    # Large numbers are easier to read in thousands
-    df['Amount_K'] = df['Amount'] / 1000
+    # Shrink the frame to the compact column types (float32 features, categoricals, ...)
+    df = apply_schema(df)
     
-    # Helper function to categorize amounts into meaningful groups
-    def categorize_amount(amount):
-        if amount < 100:
-            return 'Small (< $100)'
-        elif amount < 500:
-            return 'Medium ($100-$500)'
-        elif amount < 1000:
-            return 'Large ($500-$1000)'
-        else:
-            return 'Very Large (> $1000)'
+    # Without ETag / Last-Modified, identify the version by its content instead
+    if not any(validators.values()):
+        content = pd.util.hash_pandas_object(df[['Time', 'Amount', 'Class']], index=False)
+        validators['content_hash'] = str(int(content.sum()))
     
-    # Apply the categorization function to create new column
-    df['Amount_Category'] = df['Amount'].apply(categorize_amount)
+    # Save the cleaned frame so the next start can skip this work
+    snapshot.save(source, df, validators)
     
+    return stamp_version(df, snapshot.make_version(source, validators))
+
+def stamp_version(df, version):
+    """
+    Records the dataset version (and its row count) on the frame
+    """
+    df.attrs['dataset_version'] = version
+    df.attrs['dataset_rows'] = len(df)
     return df
 
+def dataset_version(df):
+    """
+    Returns the dataset version of a frame loaded by load_and_clean_data, or None
+
+    Filtered frames inherit attrs from their parent; a frame whose row count
+    no longer matches the stamp is a subset, so it has no version.
+    """
+    if df.attrs.get('dataset_rows') != len(df):
+        return None
+    return df.attrs.get('dataset_version')
+
+def version_cache():
+    """
+    Returns a new cache for cached_by_version / remember_by_version
+
+    The cache is registered so that forget_version and cached_bytes reach it.
+    """
+    cache = {}
+    _version_caches.append(cache)
+    return cache
+
+def cached_by_version(cache, df, key, build, max_entries=4):
+    """
+    Returns build(df), computed once per (dataset version, key) and kept in cache
+
+    Frames without a version (e.g. filtered subsets) are built every time.
+    Each version keeps up to max_entries keys (the oldest is dropped first).
+    """
+    version = dataset_version(df)
+    if version is None:
+        return build(df)
+    
+    value = cache.get((version, key))
+    if value is None:
+        value = build(df)
+        remember_by_version(cache, df, key, value, max_entries)
+    return value
+
+def remember_by_version(cache, df, key, value, max_entries=4):
+    """
+    Stores a result computed elsewhere (e.g. merged incrementally) for the frame's version
+
+    Makes room like cached_by_version: the version's oldest keys beyond
+    max_entries, and whole versions beyond MAX_CACHED_VERSIONS, are dropped.
+    """
+    version = dataset_version(df)
+    if version is None:
+        return
+    cache_key = (version, key)
+    keys = [other for other in list(cache) if other != cache_key]
+    own = [other for other in keys if other[0] == version]
+    for other in own[:max(len(own) - max_entries + 1, 0)]:
+        cache.pop(other, None)
+    versions = list(dict.fromkeys(other[0] for other in keys if other[0] != version))
+    for other in versions[:max(len(versions) - MAX_CACHED_VERSIONS + 1, 0)]:
+        _forget_in(cache, other)
+    cache[cache_key] = value
+
+def _forget_in(cache, version):
+    for key in list(cache):
+        if key[0] == version:
+            cache.pop(key, None)
+
+def forget_version(version):
+    """
+    Drops every cached result of a dataset version (e.g. when the dataset is evicted)
+    """
+    for cache in _version_caches:
+        _forget_in(cache, version)
+
+def _nbytes(value):
+    """
+    Returns the bytes of the numpy arrays held by a cached value (dicts, tuples and objects included)
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    if hasattr(value, '__dict__'):
+        return _nbytes(vars(value))
+    return 0
+
+def cached_bytes(version):
+    """
+    Returns the memory taken by the cached results of a dataset version
+    """
+    return sum(_nbytes(value) for cache in _version_caches
+               for key, value in list(cache.items()) if key[0] == version)
+
+# Keys returned by get_basic_stats
+BASIC_STATS_KEYS = ['total_transactions', 'fraud_transactions', 'normal_transactions', 'fraud_rate',
+                    'total_amount', 'fraud_amount', 'fraud_amount_percent', 'avg_normal_amount']
+
 def get_basic_stats(df):
     """
     Calculates basic statistics from the dataframe
+
+    A view over utils.metrics.summarize, which computes all KPIs in one pass.
     """
-    # Total number of transactions
-    total_transactions = len(df)
-    
-    # Number of fraud transactions (Class = 1)
-    fraud_transactions = df['Class'].sum()
-    
-    # Number of normal transactions
-    normal_transactions = total_transactions - fraud_transactions
-    
-    # Total amount of all transactions
-    total_amount = df['Amount'].sum()
-    
-    # Total amount of fraud transactions
-    fraud_amount = df[df['Class'] == 1]['Amount'].sum() if fraud_transactions > 0 else 0
-    
-    # DataFrame containing only normal transactions
-    normal_df = df[df['Class'] == 0]
-    
-    # Dictionary containing all statistics
-    stats = {
-        # Transaction counts
-        'total_transactions': total_transactions,
-        'fraud_transactions': int(fraud_transactions),
-        'normal_transactions': int(normal_transactions),
-        
-        # Fraud rate as percentage
-        'fraud_rate': (fraud_transactions / total_transactions) * 100 if total_transactions > 0 else 0,
-        
-        # Amount statistics
-        'total_amount': total_amount,
-        'fraud_amount': fraud_amount,
-        'fraud_amount_percent': (fraud_amount / total_amount) * 100 if total_amount > 0 else 0,
-        
-        # Average normal transaction amount
-        'avg_normal_amount': normal_df['Amount'].mean() if len(normal_df) > 0 else 0
-    }
+    # Imported here because utils.metrics depends on this module
+    from utils.metrics import summarize
     
-    return stats
\ No newline at end of file
+    summary = summarize(df)
+    return {key: summary[key] for key in BASIC_STATS_KEYS}
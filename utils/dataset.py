@@ -0,0 +1,263 @@
+"""
+Process-wide, read-only dataset shared by every session and page
+"""
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from utils import precompute, shared_store
+from utils.data_loader import (LOAD_TIMEOUT, cached_bytes, dataset_version, forget_version, get_data_source,
+                               load_and_clean_data, loads)
+from utils.parallel import release_version, shared_bytes
+
+class ReadOnlyDatasetError(RuntimeError):
+    """
+    Raised when code tries to modify the shared dataset
+    """
+
+def _refuse(*args, **kwargs):
+    raise ReadOnlyDatasetError(
+        "The shared dataset is read-only. Work on a filtered frame or on "
+        "df.copy() instead, or use utils.derived.compute_column for derived columns."
+    )
+
+class _ReadOnlyIndexer:
+    """
+    Wraps .loc / .iloc / .at / .iat of a FrozenFrame: lookups pass through, assignments are refused
+    """
+
+    def __init__(self, indexer):
+        self._indexer = indexer
+
+    def __getitem__(self, key):
+        return self._indexer[key]
+
+    def __call__(self, axis=None):
+        return _ReadOnlyIndexer(self._indexer(axis))
+
+    def __getattr__(self, name):
+        return getattr(self._indexer, name)
+
+    # Includes .loc enlargement (new rows), which the read-only arrays don't catch
+    __setitem__ = _refuse
+
+class FrozenFrame(pd.DataFrame):
+    """
+    DataFrame whose columns, values, index and column labels can't be changed
+
+    Every change is refused before it touches the frame, so a failed attempt
+    leaves the shared dataset intact. Its arrays are also marked read-only.
+    Filtering or copying it returns an ordinary (writable) DataFrame.
+    """
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    # Column assignment, insertion and removal
+    __setitem__ = _refuse
+    __delitem__ = _refuse
+    insert = _refuse
+    pop = _refuse
+
+    # Most inplace=True operations (fillna, drop, sort_values, ...) end here
+    _update_inplace = _refuse
+
+    # Axis changes: df.columns = ..., df.index = ..., and the inplace rename,
+    # rename_axis, reset_index and set_index, which relabel the frame itself
+    # before reaching _update_inplace
+    _set_axis = _refuse
+
+    def _set_axis_nocheck(self, labels, axis, inplace):
+        if inplace:
+            _refuse()
+        return super()._set_axis_nocheck(labels, axis, inplace)
+
+    def __setattr__(self, name, value):
+        if name in ('columns', 'index'):
+            _refuse()
+        super().__setattr__(name, value)
+
+    # Value assignment, including new rows
+    @property
+    def loc(self):
+        return _ReadOnlyIndexer(super().loc)
+
+    @property
+    def iloc(self):
+        return _ReadOnlyIndexer(super().iloc)
+
+    @property
+    def at(self):
+        return _ReadOnlyIndexer(super().at)
+
+    @property
+    def iat(self):
+        return _ReadOnlyIndexer(super().iat)
+
+def _readonly_column(series):
+    """
+    Returns the column's data backed by read-only arrays, without copying
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = np.asarray(series.cat.codes.to_numpy())
+        codes.flags.writeable = False
+        return pd.Categorical.from_codes(codes, dtype=series.dtype)
+    values = np.asarray(series.to_numpy())
+    values.flags.writeable = False
+    return values
+
+def freeze(df):
+    """
+    Wraps a cleaned frame into a FrozenFrame that shares its arrays (zero-copy)
+    """
+    frozen = FrozenFrame({name: _readonly_column(df[name]) for name in df.columns}, copy=False)
+    frozen.attrs.update(df.attrs)
+    return frozen
+
+# Memory budget (in MB) of the loaded datasets and their cached indexes, sketches and shared copies;
+# the least recently used datasets are evicted beyond it
+# Can be overridden with the CREDIT_CARD_DATASET_MEMORY_MB environment variable
+DATASET_MEMORY_MB = int(os.environ.get('CREDIT_CARD_DATASET_MEMORY_MB', 4096))
+
+# Loaded datasets, one per source, shared like st.cache_resource (least recently used first)
+_datasets = OrderedDict()
+_sizes = {}
+_lock = threading.Lock()
+_stats = {'loads': 0, 'hits': 0, 'evictions': 0, 'evicted_bytes': 0}
+
+def dataset_bytes(df):
+    """
+    Returns the memory taken by a frame's columns (categories and strings included)
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def _derived_bytes(source):
+    """
+    Returns the memory of what was computed for a loaded dataset: version-keyed caches and shared column copies
+    """
+    version = dataset_version(_datasets[source])
+    return cached_bytes(version) + shared_bytes(version)
+
+def _release(version):
+    """
+    Drops the cached results and shared column copies of a version no loaded dataset uses (caller holds the lock)
+    """
+    if version is None or any(dataset_version(dataset) == version for dataset in _datasets.values()):
+        return
+    forget_version(version)
+    release_version(version)
+
+def _evict(keep):
+    """
+    Drops the least recently used datasets until the others fit in the budget (caller holds the lock)
+
+    A dataset counts with its cached indexes, sketches and aggregates, which
+    grow as pages use it, so this runs on every access, and they are dropped
+    with it. The dataset of source keep is never dropped, even if it alone
+    exceeds the budget. Frames already handed out stay valid until their
+    sessions let go of them.
+    """
+    budget = DATASET_MEMORY_MB * 2**20
+    sizes = {source: _sizes[source] + _derived_bytes(source) for source in _datasets}
+    for source in list(_datasets):
+        if sum(sizes.values()) <= budget:
+            break
+        if source == keep:
+            continue
+        dataset = _datasets.pop(source)
+        del _sizes[source]
+        _release(dataset_version(dataset))
+        _stats['evictions'] += 1
+        _stats['evicted_bytes'] += sizes.pop(source)
+
+def publish(source, df):
+    """
+    Replaces the shared dataset of a source (e.g. after an append)
+
+    Sessions get the new frame on their next rerun; frames already handed
+    out stay valid and unchanged. The cached results of the replaced
+    version are dropped, and other datasets may be evicted to stay within
+    CREDIT_CARD_DATASET_MEMORY_MB.
+    """
+    dataset = freeze(df)
+    size = dataset_bytes(dataset)
+    with _lock:
+        previous = _datasets.get(source)
+        _datasets[source] = dataset
+        _datasets.move_to_end(source)
+        _sizes[source] = size
+        if previous is not None:
+            _release(dataset_version(previous))
+        _evict(source)
+    return dataset
+
+def dataset_stats():
+    """
+    Returns load, hit and eviction counters and the memory of every loaded dataset (least recently used first)
+
+    Each dataset reports its frame and what was computed from it (derived_bytes).
+    """
+    with _lock:
+        datasets = {source: {'frame_bytes': _sizes[source], 'derived_bytes': _derived_bytes(source)}
+                    for source in _datasets}
+    loaded = sum(sizes['frame_bytes'] + sizes['derived_bytes'] for sizes in datasets.values())
+    return dict(_stats, budget_bytes=DATASET_MEMORY_MB * 2**20, loaded_bytes=loaded, datasets=datasets)
+
+def _load_shared(source):
+    with _lock:
+        _stats['loads'] += 1
+    if precompute.BUNDLE_DIR:
+        # Data, aggregates and figures precomputed offline (None if no bundle was built from this source)
+        df = precompute.load_latest(source)
+        if df is not None:
+            return publish(source, df)
+    if shared_store.SHARED_DIR:
+        # One memory-mapped copy per node instead of one per process
+        return publish(source, shared_store.load(source))
+    return publish(source, load_and_clean_data(source))
+
+def get_dataset(source=None, timeout=LOAD_TIMEOUT):
+    """
+    Returns the shared read-only dataset for a source (loaded once per process)
+
+    Every session and page gets the same object, so memory does not grow
+    with the number of sessions or pages. Sessions arriving during the first
+    load wait for it instead of starting their own (see utils.singleflight).
+
+    With CREDIT_CARD_BUNDLE_DIR set, the dataset and its aggregates come from
+    the newest precomputed bundle (utils.precompute). With
+    CREDIT_CARD_SHARED_DIR set, the columns are memory-mapped from a store
+    shared by every server process of the node (utils.shared_store). In both
+    modes a newer published version replaces the dataset without a restart.
+
+    Several sources can be loaded side by side (see utils.registry): a loaded
+    one is returned at once, and the least recently used ones are evicted
+    when they exceed CREDIT_CARD_DATASET_MEMORY_MB.
+    """
+    source = source or get_data_source()
+    with _lock:
+        dataset = _datasets.get(source)
+        if dataset is not None:
+            _datasets.move_to_end(source)
+            _stats['hits'] += 1
+            _evict(source)
+    if dataset is None:
+        dataset = loads.do(('dataset', source), lambda: _load_shared(source), timeout=timeout)
+    else:
+        newer = _newer_version(source, dataset)
+        if newer is not None:
+            dataset = publish(source, newer)
+    return dataset
+
+def _newer_version(source, dataset):
+    """
+    Returns a newer published version of a source (bundle or shared store), or None
+    """
+    newer = None
+    if precompute.BUNDLE_DIR:
+        newer = precompute.refresh(source, dataset)
+    if newer is None and shared_store.SHARED_DIR:
+        newer = shared_store.refresh(source, dataset)
+    return newer
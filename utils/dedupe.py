@@ -0,0 +1,165 @@
+"""
+Finds duplicate rows from 64-bit row fingerprints, with exact checks against hash collisions
+"""
+import numpy as np
+import pandas as pd
+
+# Odd 64-bit constants used to mix the words of a row (from SplitMix64)
+_SEED = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+# Rows hashed per block, so the float64 copy of a block stays small (~16 MB for 31 columns)
+BLOCK_ROWS = 65_536
+
+def _as_float_block(columns, start, stop):
+    """
+    Copies rows start:stop of the columns into one contiguous (columns x rows) float64 block
+
+    Integer columns (Class) are exact in float64, and adding 0.0 turns -0.0
+    into 0.0 so both hash the same (pandas treats them as equal too).
+    """
+    block = np.empty((len(columns), stop - start), dtype=np.float64)
+    for j, values in enumerate(columns.values()):
+        np.add(values[start:stop], 0.0, out=block[j], casting='unsafe')
+    return block
+
+def row_fingerprints(columns):
+    """
+    Returns a 64-bit fingerprint of every row, hashed from its raw bytes
+
+    columns: dict of equally long 1-D numeric arrays (no NaN)
+
+    Each block of rows is copied into one contiguous float64 buffer whose
+    bytes are read as uint64 words and mixed in place, one column of words
+    at a time for all rows at once (about twice as fast as
+    pd.util.hash_pandas_object, with no per-column temporaries).
+    """
+    n = len(next(iter(columns.values())))
+    fingerprints = np.empty(n, dtype=np.uint64)
+    for start in range(0, n, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, n)
+        words = _as_float_block(columns, start, stop).view(np.uint64)
+        h = np.full(stop - start, _SEED, dtype=np.uint64)
+        shifted = np.empty_like(h)
+        for column_words in words:
+            h ^= column_words
+            h *= _MIX_1
+            np.right_shift(h, np.uint64(31), out=shifted)
+            h ^= shifted
+        h *= _MIX_2
+        np.right_shift(h, np.uint64(29), out=shifted)
+        h ^= shifted
+        fingerprints[start:stop] = h
+    return fingerprints
+
+def _same_rows(columns, rows, other_columns, other_rows):
+    """
+    Compares rows of columns with rows of other_columns value by value
+    """
+    same = np.ones(len(rows), dtype=bool)
+    for name, values in columns.items():
+        same &= values[rows] == other_columns[name][other_rows]
+    return same
+
+def duplicate_mask(columns, fingerprints=None):
+    """
+    Marks rows that exactly repeat an earlier row (first occurrence is kept)
+
+    Gives the same result as DataFrame.duplicated() over the same columns.
+    Rows are grouped by fingerprint, then every candidate is compared
+    column by column against the first row with the same fingerprint,
+    so hash collisions never remove a distinct row.
+    """
+    if fingerprints is None:
+        fingerprints = row_fingerprints(columns)
+    n = len(fingerprints)
+    mask = np.zeros(n, dtype=bool)
+    _, first, inverse = np.unique(fingerprints, return_index=True, return_inverse=True)
+    first_of_row = first[inverse]
+    candidates = np.flatnonzero(first_of_row != np.arange(n))
+    if len(candidates) == 0:
+        return mask
+
+    same = _same_rows(columns, candidates, columns, first_of_row[candidates])
+    mask[candidates[same]] = True
+
+    # Rare: different rows sharing a fingerprint. Resolve those groups exactly with pandas
+    if not same.all():
+        clash = np.flatnonzero(np.isin(inverse, inverse[candidates[~same]]))
+        group = pd.DataFrame({name: values[clash] for name, values in columns.items()})
+        mask[clash] = group.duplicated().to_numpy()
+    return mask
+
+class FingerprintIndex:
+    """
+    Sorted fingerprints of the rows of a dataset, to recognise rows it already holds
+
+    Rows of a new batch are first cast to the dataset's column types (e.g. the
+    float32 features of the compact schema), so a row matches when it would be
+    stored identically. Every fingerprint match is confirmed value by value.
+    """
+
+    def __init__(self, df, columns):
+        self.columns = list(columns)
+        self.dtypes = {name: df[name].dtype for name in self.columns}
+        self._values = {name: np.asarray(df[name].to_numpy()) for name in self.columns}
+        fingerprints = row_fingerprints(self._values)
+        self._order = np.argsort(fingerprints, kind='stable')
+        self._sorted = fingerprints[self._order]
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def _cast(self, batch):
+        return {name: np.asarray(pd.Series(batch[name]).astype(self.dtypes[name]).to_numpy())
+                for name in self.columns}
+
+    def _stored(self, rows):
+        """
+        Returns the values of indexed rows (by row number), to confirm fingerprint matches
+        """
+        return {name: values[rows] for name, values in self._values.items()}
+
+    def _insert(self, fingerprints, rows):
+        """
+        Merges the fingerprints of new rows (numbered rows) into the sorted ones without re-sorting those
+        """
+        order = np.argsort(fingerprints, kind='stable')
+        positions = np.searchsorted(self._sorted, fingerprints[order], side='right')
+        self._sorted = np.insert(self._sorted, positions, fingerprints[order])
+        self._order = np.insert(self._order, positions, rows[order])
+
+    def seen_mask(self, batch):
+        """
+        Marks the rows of batch (DataFrame or dict of arrays) already held by the dataset
+        """
+        values = self._cast(batch)
+        fingerprints = row_fingerprints(values)
+        starts = np.searchsorted(self._sorted, fingerprints, side='left')
+        ends = np.searchsorted(self._sorted, fingerprints, side='right')
+        mask = np.zeros(len(fingerprints), dtype=bool)
+
+        # Usually at most one stored row per fingerprint; walk longer runs one step at a time
+        pending = np.flatnonzero(starts < ends)
+        offset = 0
+        while len(pending):
+            positions = starts[pending] + offset
+            same = _same_rows(values, pending, self._stored(self._order[positions]), slice(None))
+            mask[pending[same]] = True
+            offset += 1
+            pending = pending[~same & (starts[pending] + offset < ends[pending])]
+        return mask
+
+    def extend(self, df):
+        """
+        Indexes the rows appended to the dataset
+
+        df is the whole dataset: the rows already indexed followed by the new ones.
+        Only the new rows are hashed and sorted; they are merged into the
+        sorted fingerprints without re-sorting the existing ones.
+        """
+        n = len(self)
+        self._values = {name: np.asarray(df[name].to_numpy()) for name in self.columns}
+        fingerprints = row_fingerprints({name: values[n:] for name, values in self._values.items()})
+        self._insert(fingerprints, np.arange(n, len(df)))
@@ -0,0 +1,119 @@
+"""
+Registry of derived columns, computed on demand with vectorized kernels
+"""
+import numpy as np
+import pandas as pd
+from utils.schema import SCHEMA, TRANSACTION_TYPES, AMOUNT_CATEGORIES
+
+# Upper bounds of the amount tiers ($100, $500, $1000)
+# Shared by the Amount_Category column, the risk matrix and the heatmap
+AMOUNT_EDGES = [100, 500, 1000]
+
+# Time bucket granularities (bucket size in seconds) and the column holding each one
+# Buckets are counted within the day (e.g. 0-23 for 'hour'); 'day' is the absolute day number
+SECONDS_PER_DAY = 86400
+TIME_GRANULARITIES = {'minute': 60, '5min': 300, '15min': 900, 'hour': 3600, 'day': SECONDS_PER_DAY}
+TIME_BUCKET_COLUMNS = {
+    'minute': 'Minute_Of_Day',
+    '5min': 'Bucket_5Min',
+    '15min': 'Bucket_15Min',
+    'hour': 'Hour_Of_Day',
+    'day': 'Day',
+}
+
+# Each derived column is described by a kernel name, its source column and parameters
+DERIVED_COLUMNS = {
+    # Map 0 to 'Normal' and 1 to 'Fraud' for better understanding
+    'Transaction_Type': {'kernel': 'labels', 'source': 'Class', 'labels': TRANSACTION_TYPES},
+
+    # Time is in seconds from the first transaction: hours of day as a decimal number
+    'Hour': {'kernel': 'scale', 'source': 'Time', 'divisor': 3600, 'modulo': 24},
+
+    # Time buckets within the day: whole minute (0-1439), 5 minutes (0-287),
+    # 15 minutes (0-95) and whole hour (0-23), plus the absolute day number
+    'Minute_Of_Day': {'kernel': 'bucket', 'source': 'Time', 'size': 60, 'modulo': 1440},
+    'Bucket_5Min': {'kernel': 'bucket', 'source': 'Time', 'size': 300, 'modulo': 288},
+    'Bucket_15Min': {'kernel': 'bucket', 'source': 'Time', 'size': 900, 'modulo': 96},
+    'Hour_Of_Day': {'kernel': 'bucket', 'source': 'Time', 'size': 3600, 'modulo': 24},
+    'Day': {'kernel': 'bucket', 'source': 'Time', 'size': SECONDS_PER_DAY},
+
+    # Amount in thousands for better readability
+    'Amount_K': {'kernel': 'scale', 'source': 'Amount', 'divisor': 1000},
+
+    # Amount tiers: < $100, $100-$500, $500-$1000, > $1000
+    'Amount_Category': {'kernel': 'bins', 'source': 'Amount', 'edges': AMOUNT_EDGES, 'labels': AMOUNT_CATEGORIES},
+}
+
+def bin_codes(values, edges):
+    """
+    Returns the bin number of each value (bin i covers edges[i-1] <= value < edges[i])
+    """
+    return np.searchsorted(np.asarray(edges), np.asarray(values), side='right')
+
+def _labels_kernel(values, spec):
+    return pd.Categorical.from_codes(np.asarray(values, dtype=np.int8), categories=spec['labels'])
+
+def _scale_kernel(values, spec):
+    result = values / spec['divisor']
+    if 'modulo' in spec:
+        result = result % spec['modulo']
+    return result
+
+def _bucket_kernel(values, spec):
+    result = values // spec['size']
+    if 'modulo' in spec:
+        result = result % spec['modulo']
+    return result
+
+def _bins_kernel(values, spec):
+    codes = bin_codes(values, spec['edges'])
+    return pd.Categorical.from_codes(codes, categories=spec['labels'], ordered=True)
+
+KERNELS = {
+    'labels': _labels_kernel,
+    'scale': _scale_kernel,
+    'bucket': _bucket_kernel,
+    'bins': _bins_kernel,
+}
+
+def compute_column(df, name):
+    """
+    Returns a derived column as a Series aligned with df
+
+    Uses the existing column if the frame already has it.
+    """
+    if name in df.columns:
+        return df[name]
+    spec = DERIVED_COLUMNS[name]
+    values = KERNELS[spec['kernel']](df[spec['source']].to_numpy(), spec)
+    series = pd.Series(values, index=df.index, name=name)
+    if name in SCHEMA:
+        series = series.astype(SCHEMA[name])
+    return series
+
+def buckets_per_day(granularity):
+    """
+    Returns how many buckets of the given granularity fit in one day
+    """
+    return SECONDS_PER_DAY // TIME_GRANULARITIES[granularity]
+
+def bucket_label(bucket, granularity):
+    """
+    Returns a readable label for a time bucket ('HH:MM' within the day, or 'Day N')
+    """
+    if granularity == 'day':
+        return f'Day {bucket + 1}'
+    minutes = bucket * TIME_GRANULARITIES[granularity] // 60
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+def ensure_columns(df, names):
+    """
+    Adds the requested derived columns to df (only those that are missing)
+
+    The shared dataset (utils.dataset) is read-only: use compute_column on it,
+    or call this on a filtered frame.
+    """
+    for name in names:
+        if name not in df.columns:
+            df[name] = compute_column(df, name)
+    return df
@@ -0,0 +1,263 @@
+"""
+Downloads the source CSV to disk in parallel byte ranges, with resume and verification
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+# Parallel connections used for range downloads
+# Can be overridden with the CREDIT_CARD_DOWNLOAD_WORKERS environment variable
+DEFAULT_WORKERS = int(os.environ.get('CREDIT_CARD_DOWNLOAD_WORKERS', 4))
+
+# Bytes per range request (also the unit of resume)
+SEGMENT_BYTES = 8 * 2**20
+
+# Files smaller than this are fetched with a single request
+MIN_PARALLEL_BYTES = 2 * SEGMENT_BYTES
+
+# Attempts per segment before the download fails, and the first backoff in seconds
+RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+# Seconds to wait for the server (connect and between two reads)
+REQUEST_TIMEOUT = 60
+
+# Bytes read from the network per write
+READ_BYTES = 2**20
+
+# Headers of the first request: without them requests asks for gzip, and a
+# compressed reply (e.g. GitHub raw files) can't be split into byte ranges
+PROBE_HEADERS = {'Accept-Encoding': 'identity'}
+
+class DownloadError(requests.RequestException):
+    """
+    Raised when the downloaded file is incomplete, corrupted or changed on the server
+    """
+
+class _SourceChanged(DownloadError):
+    pass
+
+def _supports_ranges(response):
+    size = int(response.headers.get('Content-Length') or 0)
+    return (
+        response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        and not response.headers.get('Content-Encoding')
+        and size >= MIN_PARALLEL_BYTES
+    )
+
+def _validator(response):
+    """
+    Returns the header used to make sure every range comes from the same file version
+    """
+    return response.headers.get('ETag') or response.headers.get('Last-Modified')
+
+def file_sha256(path):
+    """
+    Returns the SHA-256 hex digest of a file, read in blocks
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class _Progress:
+    """
+    Bytes done per segment, saved next to the partial file so a later run can resume
+    """
+
+    def __init__(self, path, url, validator, size):
+        self.path = path
+        self.key = {'url': url, 'validator': validator, 'size': size}
+        self.done = {}
+        self.resumed = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get('key') != self.key:
+            return False
+        self.done = {int(start): done for start, done in state.get('done', {}).items()}
+        self.resumed = sum(self.done.values())
+        return True
+
+    def add(self, start, count):
+        with self._lock:
+            self.done[start] = self.done.get(start, 0) + count
+
+    def save(self):
+        with self._lock:
+            state = {'key': self.key, 'done': self.done}
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(self.path + '.tmp', self.path)
+
+def _fetch_segment(session, url, part_path, start, end, validator, progress):
+    """
+    Writes bytes start..end (inclusive) of the file into the partial file
+
+    Bytes already written by an earlier attempt or run are skipped.
+    """
+    for attempt in range(RETRIES):
+        offset = start + progress.done.get(start, 0)
+        if offset > end:
+            return
+        headers = {'Range': f'bytes={offset}-{end}', 'Accept-Encoding': 'identity'}
+        if validator:
+            # The server answers 200 (whole file) instead of 206 if the file changed
+            headers['If-Range'] = validator
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+                if response.status_code != 206:
+                    raise _SourceChanged(
+                        f"Expected a partial response for bytes {offset}-{end}, got {response.status_code} "
+                        "(the file probably changed on the server)"
+                    )
+                with open(part_path, 'r+b') as f:
+                    f.seek(offset)
+                    for block in response.iter_content(READ_BYTES):
+                        f.write(block)
+                        progress.add(start, len(block))
+            if start + progress.done.get(start, 0) > end:
+                return
+        except DownloadError:
+            raise
+        except (requests.RequestException, OSError):
+            if attempt == RETRIES - 1:
+                raise
+        progress.save()
+        time.sleep(RETRY_BACKOFF * 2 ** attempt)
+    raise DownloadError(f"Bytes {start}-{end} still incomplete after {RETRIES} attempts")
+
+def _download_ranges(url, response, dest, workers):
+    """
+    Downloads the file as parallel range requests into dest + '.part'
+    """
+    size = int(response.headers['Content-Length'])
+    validator = _validator(response)
+    response.close()
+
+    part_path = dest + '.part'
+    progress = _Progress(dest + '.progress', url, validator, size)
+    if not (progress.load() and os.path.exists(part_path) and os.path.getsize(part_path) == size):
+        progress.done, progress.resumed = {}, 0
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+    progress.save()
+
+    segments = [(start, min(start + SEGMENT_BYTES, size) - 1) for start in range(0, size, SEGMENT_BYTES)]
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download') as pool:
+            futures = [
+                pool.submit(_fetch_segment, session, url, part_path, start, end, validator, progress)
+                for start, end in segments
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except _SourceChanged:
+                # The file changed: the partial download is useless
+                for future in futures:
+                    future.cancel()
+                progress.done = {}
+                raise
+            finally:
+                progress.save()
+
+    written = sum(progress.done.values())
+    if written != size:
+        raise DownloadError(f"Downloaded {written:,} bytes, expected {size:,}")
+    return part_path, size, len(segments), progress.resumed
+
+def _download_single(response, dest):
+    """
+    Writes the body of an open response into dest + '.part' (no resume)
+
+    The bytes are stored as sent, so gzip bodies stay compressed and
+    can be checked against Content-Length; the parser decompresses them.
+    """
+    part_path = dest + '.part'
+    encoding = response.headers.get('Content-Encoding')
+    decode = encoding not in (None, 'gzip')
+    expected = None if decode else int(response.headers.get('Content-Length') or 0) or None
+
+    written = 0
+    with response, open(part_path, 'wb') as f:
+        while True:
+            block = response.raw.read(READ_BYTES, decode_content=decode)
+            if not block:
+                break
+            f.write(block)
+            written += len(block)
+    if expected is not None and written != expected:
+        raise DownloadError(f"Downloaded {written:,} bytes, expected {expected:,}")
+    return part_path, written, 1, 0
+
+def download(url, dest, response=None, workers=None, sha256=None):
+    """
+    Downloads url into the file dest and returns a summary of the transfer
+
+    Servers that accept byte ranges get several segments in parallel
+    (workers connections); an interrupted download resumes from the bytes
+    already on disk as long as the file did not change on the server.
+    Other servers are read in one request, gzip bodies included.
+    The size (and the SHA-256 when sha256 is given) is checked before dest
+    is written, so the parser never sees a truncated file.
+
+    response: an already open streamed GET for url (e.g. the revalidation
+              request), sent with PROBE_HEADERS so ranges can be used
+    """
+    workers = workers or DEFAULT_WORKERS
+    started = time.perf_counter()
+    if response is None:
+        response = requests.get(url, headers=PROBE_HEADERS, stream=True, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    if workers > 1 and _supports_ranges(response):
+        part_path, size, segments, resumed = _download_ranges(url, response, dest, workers)
+    else:
+        part_path, size, segments, resumed = _download_single(response, dest)
+
+    digest = file_sha256(part_path)
+    if sha256 and digest != sha256.lower():
+        os.remove(part_path)
+        raise DownloadError(f"Checksum mismatch: expected {sha256}, got {digest}")
+
+    os.replace(part_path, dest)
+    if os.path.exists(dest + '.progress'):
+        os.remove(dest + '.progress')
+    return {
+        'path': dest,
+        'bytes': size,
+        'sha256': digest,
+        'segments': segments,
+        'resumed_bytes': resumed,
+        'seconds': time.perf_counter() - started,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Download a file and report the throughput")
+    parser.add_argument('url')
+    parser.add_argument('dest')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--sha256')
+    args = parser.parse_args()
+
+    result = download(args.url, args.dest, workers=args.workers, sha256=args.sha256)
+    mb = result['bytes'] / 2**20
+    print(f"{mb:,.1f} MB in {result['seconds']:.2f}s ({mb / result['seconds']:,.1f} MB/s), "
+          f"{result['segments']} segment(s), {result['resumed_bytes']:,} bytes resumed")
+    print(f"sha256 {result['sha256']}")
@@ -0,0 +1,153 @@
+"""
+Caches serialized chart figures per dataset version and chart parameters
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from utils.backend import data_version
+
+# Memory budget (in MB) of the in-memory tier
+# Can be overridden with the CREDIT_CARD_FIGURE_CACHE_MB environment variable
+DEFAULT_MAX_MB = int(os.environ.get('CREDIT_CARD_FIGURE_CACHE_MB', 64))
+
+# Optional folder for the on-disk tier (figures survive restarts)
+# Enabled by setting the CREDIT_CARD_FIGURE_CACHE_DIR environment variable
+DEFAULT_DISK_DIR = os.environ.get('CREDIT_CARD_FIGURE_CACHE_DIR')
+
+class FigureCache:
+    """
+    Two-tier cache of figure JSON: an LRU in memory bounded by bytes,
+    plus an optional folder on disk
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_MB * 2**20, disk_dir=DEFAULT_DISK_DIR):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Counters shown by stats()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _disk_path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, name + '.json')
+
+    def _remember(self, key, figure_json):
+        """
+        Stores an entry in the memory tier and evicts the least recently used ones
+        """
+        size = len(figure_json)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key))
+        self._entries[key] = figure_json
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def get(self, key):
+        """
+        Returns the cached figure JSON for key, or None
+        """
+        with self._lock:
+            figure_json = self._entries.get(key)
+            if figure_json is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return figure_json
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                    figure_json = f.read()
+            except OSError:
+                figure_json = None
+            if figure_json is not None:
+                with self._lock:
+                    self._remember(key, figure_json)
+                    self.disk_hits += 1
+                return figure_json
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, figure_json):
+        """
+        Stores figure JSON in memory and, if enabled, on disk
+        """
+        with self._lock:
+            self._remember(key, figure_json)
+
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                path = self._disk_path(key)
+                with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                    f.write(figure_json)
+                os.replace(path + '.tmp', path)
+            except OSError:
+                # The disk tier is optional; the memory tier still works
+                pass
+
+    def clear(self):
+        """
+        Empties the memory tier (the disk tier is left alone)
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Returns hit/miss counters and the size of the memory tier
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
+
+# Process-wide cache shared by every session and page
+figure_cache = FigureCache()
+
+def figure_key(version, builder, params):
+    """
+    Builds the cache key from the dataset version, chart builder and parameters
+    """
+    return json.dumps([version, builder.__module__, builder.__name__, params], sort_keys=True, default=str)
+
+def cached_figure(data, builder, **params):
+    """
+    Returns builder(data, **params), building the figure only once per dataset version
+
+    data: a DataFrame or a query backend (utils.backend)
+    Frames without a version (e.g. filtered subsets) are always built fresh.
+    """
+    version = data_version(data)
+    if version is None:
+        return builder(data, **params)
+
+    # Imported here so plotly is only loaded once a chart is drawn
+    import plotly.io as pio
+
+    key = figure_key(version, builder, params)
+    figure_json = figure_cache.get(key)
+    if figure_json is None:
+        figure_json = builder(data, **params).to_json()
+        figure_cache.put(key, figure_json)
+    return pio.from_json(figure_json)
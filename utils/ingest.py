@@ -0,0 +1,196 @@
+"""
+Streams a CSV into a cleaned DataFrame chunk by chunk with bounded peak memory
+"""
+import io
+import math
+import os
+import numpy as np
+import pandas as pd
+from utils.dedupe import duplicate_mask, row_fingerprints
+from utils.schema import apply_schema
+
+# Upper bound on rows parsed at once
+DEFAULT_CHUNK_ROWS = 50_000
+
+# Memory ceiling (in MB) for the loaded dataset
+# Can be overridden with the CREDIT_CARD_MAX_MEMORY_MB environment variable
+DEFAULT_MAX_MEMORY_MB = int(os.environ.get('CREDIT_CARD_MAX_MEMORY_MB', 4096))
+
+# Extra room added to the row estimate so the buffers rarely need to grow
+CAPACITY_MARGIN = 1.05
+
+class _CountingReader:
+    """
+    File-like wrapper that counts the bytes handed to the CSV parser
+
+    The first block is kept so the header can be read even if no chunk is parsed.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+        self.head = b''
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if not self.bytes_read:
+            self.head = data
+        self.bytes_read += len(data)
+        return data
+
+    def header(self):
+        """
+        Returns the column names of the CSV header (empty if there is none)
+        """
+        first_line = self.head.split(b'\n', 1)[0]
+        if not first_line.strip():
+            return []
+        return list(pd.read_csv(io.BytesIO(first_line), nrows=0).columns)
+
+    def __iter__(self):
+        # pandas checks for read() or __iter__ to accept a file-like object
+        return iter(self.stream)
+
+class ColumnBuffer:
+    """
+    Preallocated per-column arrays that chunks are copied into
+
+    A column's type comes from the first chunk and is widened when a later
+    chunk needs more (e.g. whole amounts parsed as int64, then fractions).
+    Also used to append batches to the shared dataset (see utils.append).
+    """
+
+    def __init__(self, chunk, capacity, max_bytes):
+        self.columns = list(chunk.columns)
+        self.dtypes = {name: chunk[name].to_numpy().dtype for name in self.columns}
+        self.row_bytes = sum(dtype.itemsize for dtype in self.dtypes.values())
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.arrays = {}
+        self._allocate(capacity)
+
+    def _check_ceiling(self, capacity):
+        needed = capacity * self.row_bytes
+        if needed > self.max_bytes:
+            raise MemoryError(
+                f"Dataset needs about {needed / 2**20:,.1f} MB, which exceeds the "
+                f"{self.max_bytes / 2**20:,.0f} MB ceiling (CREDIT_CARD_MAX_MEMORY_MB)"
+            )
+
+    def _allocate(self, capacity):
+        self._check_ceiling(capacity)
+        for name in self.columns:
+            new = np.empty(capacity, dtype=self.dtypes[name])
+            old = self.arrays.get(name)
+            if old is not None:
+                new[:self.size] = old[:self.size]
+            self.arrays[name] = new
+        self.capacity = capacity
+
+    def _widen(self, name, dtype):
+        """
+        Converts a column to a type that also holds values of dtype without loss
+        """
+        dtype = np.result_type(self.dtypes[name], dtype)
+        if dtype == self.dtypes[name]:
+            return
+        self.row_bytes += dtype.itemsize - self.dtypes[name].itemsize
+        self._check_ceiling(self.capacity)
+        self.arrays[name] = self.arrays[name].astype(dtype)
+        self.dtypes[name] = dtype
+
+    def append(self, chunk):
+        n = len(chunk)
+        for name in self.columns:
+            self._widen(name, chunk[name].to_numpy().dtype)
+        if self.size + n > self.capacity:
+            # Row estimate was too low: grow by 50% (or enough for this chunk)
+            self._allocate(max(self.size + n, int(self.capacity * 1.5)))
+        for name in self.columns:
+            self.arrays[name][self.size:self.size + n] = chunk[name].to_numpy()
+        self.size += n
+
+    def views(self):
+        """
+        Returns the filled part of every column (views, no copy)
+        """
+        return {name: self.arrays[name][:self.size] for name in self.columns}
+
+def stream_clean_csv(stream, prepare_chunk, size_hint=None, chunk_rows=None, max_memory_mb=None, seen=None):
+    """
+    Parses a CSV stream in chunks and returns the cleaned, de-duplicated DataFrame
+
+    stream: binary file-like object (local file or HTTP response body)
+    prepare_chunk: function that drops bad rows from one chunk
+    size_hint: total size of the stream in bytes, used to preallocate the result
+    chunk_rows: rows parsed per chunk (default: derived from the memory ceiling)
+    max_memory_mb: ceiling for the final dataset; MemoryError is raised above it
+    seen: optional utils.dedupe.FingerprintIndex of rows already loaded;
+          those rows are skipped (e.g. when ingesting a newer snapshot)
+
+    The number of removed duplicates is recorded in df.attrs['duplicates_removed']
+    (and the skipped rows in df.attrs['seen_rows_skipped']). Without any row
+    the frame still has the header's columns, typed by utils.schema.
+
+    Peak memory stays close to the final frame plus one chunk,
+    instead of several full copies of the dataset.
+    """
+    max_bytes = (max_memory_mb or DEFAULT_MAX_MEMORY_MB) * 2**20
+    reader = _CountingReader(stream)
+
+    # Keep one parsed chunk to a small share of the ceiling
+    # (~300 bytes per raw row for the 31 numeric columns)
+    if chunk_rows is None:
+        chunk_rows = int(max(1_000, min(DEFAULT_CHUNK_ROWS, max_bytes // 32 // 300)))
+
+    buffer = None
+    raw_columns = None
+    fingerprints = []
+    skipped = 0
+
+    for chunk in pd.read_csv(reader, chunksize=chunk_rows):
+        if raw_columns is None:
+            raw_columns = list(chunk.columns)
+
+        chunk = prepare_chunk(chunk)
+        if seen is not None and len(seen):
+            unseen = ~seen.seen_mask(chunk)
+            skipped += int(len(chunk) - unseen.sum())
+            chunk = chunk[unseen]
+
+        # Fingerprints of the raw values, used for de-duplication across chunks
+        fingerprints.append(row_fingerprints({name: chunk[name].to_numpy() for name in raw_columns}))
+
+        if buffer is None:
+            # Estimate the total row count from the bytes consumed so far
+            capacity = len(chunk)
+            if size_hint and reader.bytes_read:
+                rows_seen = max(len(chunk), 1)
+                capacity = max(capacity, math.ceil(size_hint / reader.bytes_read * rows_seen * CAPACITY_MARGIN))
+            buffer = ColumnBuffer(chunk, max(capacity, 1), max_bytes)
+        buffer.append(chunk)
+
+    if buffer is None or buffer.size == 0:
+        # No rows (header only, all dropped or already seen): keep the header's
+        # columns with their usual types, since nothing could be inferred
+        df = apply_schema(pd.DataFrame({name: [] for name in raw_columns or reader.header()}))
+        df.attrs['duplicates_removed'] = 0
+        df.attrs['seen_rows_skipped'] = skipped
+        return df
+
+    # Drop rows that repeat an earlier row across the whole file
+    n = buffer.size
+    raw = {name: buffer.arrays[name][:n] for name in raw_columns}
+    keep = ~duplicate_mask(raw, np.concatenate(fingerprints))
+    del raw, fingerprints
+
+    # Build the final frame column by column, releasing each buffer as we go
+    columns = {}
+    compact = keep.all() and n >= buffer.capacity / CAPACITY_MARGIN
+    for name in buffer.columns:
+        values = buffer.arrays.pop(name)
+        columns[name] = values[:n] if compact else values[:n][keep]
+    df = pd.DataFrame(columns)
+    df.attrs['duplicates_removed'] = int(n - keep.sum())
+    df.attrs['seen_rows_skipped'] = skipped
+    return df
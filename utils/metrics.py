@@ -1,55 +1,272 @@
 """
 Calculates financial metrics and risk indicators
 """
+import numpy as np
 import pandas as pd
+from utils.cube import N_HOURS, get_cube
+from utils.derived import TIME_BUCKET_COLUMNS, bin_codes, bucket_label, buckets_per_day, compute_column
+from utils.schema import AMOUNT_CATEGORIES
+
+# Keys returned by each of the classic metric functions
+RISK_METRIC_KEYS = ['avg_fraud_amount', 'avg_normal_amount', 'max_fraud_amount',
+                    'fraud_to_normal_ratio', 'busiest_fraud_hour']
+FINANCIAL_IMPACT_KEYS = ['total_fraud_loss', 'total_transactions_volume', 'avg_loss_per_fraud',
+                         'max_fraud_amount', 'loss_percentage']
+
+def summarize(df):
+    """
+    Computes every KPI of the dashboard in a single pass over Class, Amount and Hour
+
+    The pass builds the aggregate cube (cached per dataset version, see utils.cube),
+    and all metrics are read from it. get_basic_stats, calculate_risk_metrics and
+    calculate_financial_impact are views over this result.
+    """
+    return query_kpis(get_cube(df))
 
 def calculate_risk_metrics(df):
     """
     Calculates risk-related metrics from fraud data
     """
-    fraud_df = df[df['Class'] == 1]
-    normal_df = df[df['Class'] == 0]
+    summary = summarize(df)
+    return {key: summary[key] for key in RISK_METRIC_KEYS}
+
+def calculate_financial_impact(df):
+    """
+    Calculates the financial impact of fraud
+    """
+    summary = summarize(df)
+    return {key: summary[key] for key in FINANCIAL_IMPACT_KEYS}
+
+def _cube_slice(cube, stat, cls=None):
+    """
+    Returns one statistic of the cube as an (hour, amount tier) array
+    for one class, or combined over both classes when cls is None
+    """
+    values = cube[stat]
+    if cls is not None:
+        return values[cls]
+    if stat == 'min':
+        return values.min(axis=0)
+    if stat == 'max':
+        return values.max(axis=0)
+    return values.sum(axis=0)
+
+def query_totals(cube, cls=None):
+    """
+    Returns count, sum, mean, std, min and max of Amount for one class (or all)
+    """
+    count = int(_cube_slice(cube, 'count', cls).sum())
+    total = float(_cube_slice(cube, 'sum', cls).sum())
+    sumsq = float(_cube_slice(cube, 'sumsq', cls).sum())
     
-    metrics = {}
+    if count == 0:
+        return {'count': 0, 'sum': 0.0, 'mean': 0, 'std': 0, 'min': 0, 'max': 0}
     
-    # Average amounts comparison
-    metrics['avg_fraud_amount'] = fraud_df['Amount'].mean() if len(fraud_df) > 0 else 0
-    metrics['avg_normal_amount'] = normal_df['Amount'].mean() if len(normal_df) > 0 else 0
-    metrics['max_fraud_amount'] = fraud_df['Amount'].max() if len(fraud_df) > 0 else 0
+    mean = total / count
+    # Sample standard deviation, as pandas computes it
+    variance = (sumsq - count * mean * mean) / (count - 1) if count > 1 else 0.0
     
-    # Calculate ratio of fraud to normal amounts
-    if metrics['avg_normal_amount'] > 0:
-        metrics['fraud_to_normal_ratio'] = metrics['avg_fraud_amount'] / metrics['avg_normal_amount']
-    else:
-        metrics['fraud_to_normal_ratio'] = 0
+    return {
+        'count': count,
+        'sum': total,
+        'mean': mean,
+        'std': max(variance, 0.0) ** 0.5,
+        'min': float(_cube_slice(cube, 'min', cls).min()),
+        'max': float(_cube_slice(cube, 'max', cls).max()),
+    }
+
+def query_by_hour(cube, cls=None):
+    """
+    Returns transaction count and amount for each hour of the day
+    """
+    return pd.DataFrame({
+        'Hour': np.arange(N_HOURS),
+        'count': _cube_slice(cube, 'count', cls).sum(axis=1),
+        'amount': _cube_slice(cube, 'sum', cls).sum(axis=1),
+    })
+
+def query_by_category(cube, cls=None):
+    """
+    Returns transaction count, amount and share of transactions for each amount category
+    """
+    counts = _cube_slice(cube, 'count', cls).sum(axis=0)
+    total = counts.sum()
+    return pd.DataFrame({
+        'Amount_Category': AMOUNT_CATEGORIES,
+        'count': counts,
+        'amount': _cube_slice(cube, 'sum', cls).sum(axis=0),
+        'percentage': (counts / total) * 100 if total > 0 else np.zeros(len(counts)),
+    })
+
+def _risk_matrix(labels, normal_counts, fraud_counts):
+    """
+    Builds the risk matrix table from per-category normal and fraud counts
+    """
+    totals = normal_counts + fraud_counts
+    rates = np.divide(fraud_counts * 100, totals, out=np.zeros(len(totals)), where=totals > 0)
+    return pd.DataFrame({
+        'Category': labels,
+        'Normal Count': normal_counts,
+        'Fraud Count': fraud_counts,
+        'Risk Rate (%)': rates.round(4),
+    })
+
+def query_risk_matrix(cube):
+    """
+    Returns normal count, fraud count and fraud rate for each amount category
+    """
+    counts = cube['count'].sum(axis=1)
+    return _risk_matrix(AMOUNT_CATEGORIES, counts[0], counts[1])
+
+def bin_labels(edges, prefix='$'):
+    """
+    Returns readable labels for the bins defined by edges (e.g. '$100-$500')
+    """
+    labels = [f'< {prefix}{edges[0]:,g}']
+    labels += [f'{prefix}{lo:,g}-{prefix}{hi:,g}' for lo, hi in zip(edges[:-1], edges[1:])]
+    labels.append(f'>= {prefix}{edges[-1]:,g}')
+    return labels
+
+def binned_histogram(df, edges, column='Amount', group='Class', value='Amount'):
+    """
+    Counts rows and sums a value for every (group, bin) pair in one vectorized pass
+
+    edges: sorted bin edges; bin i covers edges[i-1] <= column < edges[i],
+           with open-ended bins below the first and above the last edge
+    group: column whose values split the rows (e.g. Class)
+    value: column summed in each cell
+
+    Returns a dict with the group values, bin labels and (group, bin) arrays
+    of counts, sums and rates (share of the bin's rows in each group, in %).
+    """
+    edges = sorted(edges)
+    n_bins = len(edges) + 1
+    bins = bin_codes(df[column].to_numpy(), edges)
+    group_codes, groups = pd.factorize(df[group], sort=True)
     
-    # Find busiest hour for fraud
-    if len(fraud_df) > 0:
-        fraud_by_hour = fraud_df.groupby('Hour').size()
-        busiest_hour = fraud_by_hour.idxmax()
-        metrics['busiest_fraud_hour'] = int(busiest_hour)
-    else:
-        metrics['busiest_fraud_hour'] = None
+    # One flat cell number per row, then one bincount per statistic
+    size = len(groups) * n_bins
+    cells = group_codes * n_bins + bins
+    counts = np.bincount(cells, minlength=size).reshape(len(groups), n_bins)
+    sums = np.bincount(cells, weights=df[value].to_numpy(dtype=np.float64), minlength=size)
     
-    return metrics
+    return histogram_result(edges, groups, counts, sums.reshape(len(groups), n_bins))
 
-def calculate_financial_impact(df):
+def histogram_result(edges, groups, counts, sums):
     """
-    Calculates the financial impact of fraud
+    Packs (group, bin) counts and sums into the dict returned by binned_histogram
     """
-    fraud_df = df[df['Class'] == 1]
+    bin_totals = counts.sum(axis=0)
+    rates = np.divide(counts * 100, bin_totals, out=np.zeros(counts.shape), where=bin_totals > 0)
     
-    impact = {
-        'total_fraud_loss': fraud_df['Amount'].sum(),
-        'total_transactions_volume': df['Amount'].sum(),
-        'avg_loss_per_fraud': fraud_df['Amount'].mean() if len(fraud_df) > 0 else 0,
-        'max_fraud_amount': fraud_df['Amount'].max() if len(fraud_df) > 0 else 0
+    return {
+        'groups': list(groups),
+        'labels': bin_labels(edges),
+        'count': counts,
+        'sum': sums,
+        'rate': rates,
     }
+
+def binned_risk_matrix(data, edges):
+    """
+    Returns the risk matrix (normal count, fraud count, fraud rate) for custom amount edges
+
+    data: a DataFrame or a query backend (utils.backend)
+    """
+    from utils.backend import as_backend
     
-    # Calculate loss percentage
-    if impact['total_transactions_volume'] > 0:
-        impact['loss_percentage'] = (impact['total_fraud_loss'] / impact['total_transactions_volume']) * 100
+    histogram = as_backend(data).binned_histogram(edges)
+    counts = dict(zip(histogram['groups'], histogram['count']))
+    empty = np.zeros(len(histogram['labels']), dtype=np.int64)
+    return _risk_matrix(histogram['labels'], counts.get(0, empty), counts.get(1, empty))
+
+def heatmap_amount_edges(amount_bins=40, log_scale=True, max_amount=5000):
+    """
+    Returns amount_bins edges up to max_amount (log-spaced from $1, or evenly spaced)
+
+    With bin_codes they give amount_bins + 1 bins: everything from the last
+    edge up is the overflow bin, so large amounts are never dropped.
+    """
+    if log_scale:
+        edges = np.geomspace(1, max_amount, amount_bins)
     else:
-        impact['loss_percentage'] = 0
+        edges = np.linspace(max_amount / amount_bins, max_amount, amount_bins)
+    # 3 significant digits keep the labels readable
+    return np.unique([float(f'{edge:.3g}') for edge in edges])
+
+def fraud_rate_grid(df, granularity='15min', amount_bins=40, log_scale=True, max_amount=5000):
+    """
+    Counts transactions and frauds for every (amount bin, time bucket) cell with one 2D bincount
+
+    Works on the Time / Amount / Class arrays directly and never copies the frame.
+    Returns a dict with the amount labels (rows, last one is the overflow bin),
+    the time labels (columns) and (rows, columns) arrays of counts, frauds and
+    fraud rates in % (NaN where a cell has no transactions).
+    """
+    edges = heatmap_amount_edges(amount_bins, log_scale, max_amount)
+    n_rows = len(edges) + 1
+    n_columns = buckets_per_day(granularity)
+    
+    rows = bin_codes(df['Amount'].to_numpy(), edges)
+    columns = compute_column(df, TIME_BUCKET_COLUMNS[granularity]).to_numpy(dtype=np.intp)
+    cells = rows * n_columns + columns
+    
+    size = n_rows * n_columns
+    counts = np.bincount(cells, minlength=size).reshape(n_rows, n_columns)
+    frauds = np.bincount(cells, weights=df['Class'].to_numpy(), minlength=size).reshape(n_rows, n_columns)
+    
+    return fraud_rate_grid_result(granularity, edges, counts, frauds)
+
+def fraud_rate_grid_result(granularity, edges, counts, frauds):
+    """
+    Packs (amount bin, time bucket) counts and frauds into the dict returned by fraud_rate_grid
+    """
+    rates = np.divide(frauds * 100, counts, out=np.full(counts.shape, np.nan), where=counts > 0)
+    
+    return {
+        'amount_labels': bin_labels(edges),
+        'bucket_labels': [bucket_label(bucket, granularity) for bucket in range(counts.shape[1])],
+        'count': counts,
+        'fraud': frauds.astype(np.int64),
+        'rate': rates,
+    }
+
+def query_kpis(cube):
+    """
+    Answers every KPI of get_basic_stats, calculate_risk_metrics
+    and calculate_financial_impact from the cube
+    """
+    overall = query_totals(cube)
+    normal = query_totals(cube, 0)
+    fraud = query_totals(cube, 1)
+    
+    total = overall['count']
+    fraud_by_hour = _cube_slice(cube, 'count', 1).sum(axis=1)
+    
+    kpis = {
+        # Transaction counts
+        'total_transactions': total,
+        'fraud_transactions': fraud['count'],
+        'normal_transactions': normal['count'],
+        'fraud_rate': (fraud['count'] / total) * 100 if total > 0 else 0,
+        
+        # Amounts
+        'total_amount': overall['sum'],
+        'fraud_amount': fraud['sum'],
+        'fraud_amount_percent': (fraud['sum'] / overall['sum']) * 100 if overall['sum'] > 0 else 0,
+        'avg_normal_amount': normal['mean'],
+        'avg_fraud_amount': fraud['mean'],
+        'max_fraud_amount': fraud['max'],
+        'fraud_to_normal_ratio': fraud['mean'] / normal['mean'] if normal['mean'] > 0 else 0,
+        
+        # Busiest whole hour for fraud
+        'busiest_fraud_hour': int(fraud_by_hour.argmax()) if fraud['count'] > 0 else None,
+        
+        # Financial impact
+        'total_fraud_loss': fraud['sum'],
+        'total_transactions_volume': overall['sum'],
+        'avg_loss_per_fraud': fraud['mean'],
+        'loss_percentage': (fraud['sum'] / overall['sum']) * 100 if overall['sum'] > 0 else 0,
+    }
     
-    return impact
\ No newline at end of file
+    return kpis
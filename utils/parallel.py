@@ -0,0 +1,334 @@
+"""
+Partitioned aggregation: splits the rows by Time range, aggregates the parts in a worker pool and merges them
+
+Every aggregate here is a sum, min or max per cell, so the aggregate of the
+whole dataset is the merge of the aggregates of any split of its rows.
+
+    CREDIT_CARD_AGGREGATION_WORKERS=16 streamlit run app.py
+
+Worker processes do not receive the rows through pickling: the columns the
+kernels read are written once per dataset version to .npy files in shared
+memory (/dev/shm) and every worker maps them read-only. They are removed
+with the dataset (see release_version, called by utils.dataset on eviction or
+replacement), so shared memory follows CREDIT_CARD_DATASET_MEMORY_MB.
+"""
+import atexit
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from utils.data_loader import dataset_version
+from utils.shared_store import shared_folder
+
+# Worker count (1 aggregates in the calling thread)
+WORKERS = int(os.environ.get('CREDIT_CARD_AGGREGATION_WORKERS', os.cpu_count() or 1))
+
+# 'process' (default) or 'thread'; threads avoid the shared files but only
+# overlap where numpy releases the GIL
+EXECUTOR = os.environ.get('CREDIT_CARD_AGGREGATION_EXECUTOR', 'process')
+
+# Smaller frames are aggregated in the calling thread, faster than a pool round trip
+PARALLEL_MIN_ROWS = 1_000_000
+
+# Columns read by the partial aggregates
+SHARED_COLUMNS = ['Time', 'Amount', 'Class']
+
+# Folder of the shared column files (memory-backed on Linux)
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+_lock = threading.Lock()
+_pool = None
+_pool_key = None
+_shared = {}   # dataset version -> folder of its column files
+_stats = {'serial_runs': 0, 'parallel_runs': 0, 'partitions': 0, 'fallbacks': 0, 'seconds': 0.0}
+
+# In worker processes: folder -> mapped columns
+_mapped = {}
+
+def _cube_partial(frame):
+    from utils.cube import build_cube
+    return build_cube(frame)
+
+def _cube_finish(cube):
+    return cube
+
+def _merge_cubes(a, b):
+    from utils.cube import merge_cubes
+    return merge_cubes(a, b)
+
+def _add_arrays(a, b):
+    """
+    Adds two dicts of count arrays; 1-D arrays of different lengths (day buckets) are padded
+    """
+    result = {}
+    for key in a:
+        x, y = a[key], b[key]
+        if x.ndim == 1 and len(x) != len(y):
+            size = max(len(x), len(y))
+            x = np.pad(x, (0, size - len(x)))
+            y = np.pad(y, (0, size - len(y)))
+        result[key] = x + y
+    return result
+
+def _buckets_partial(frame, granularity='hour', cls=None):
+    from utils.charts import bucketed_counts
+    table = bucketed_counts(frame, granularity, cls)
+    return {'count': table['count'].to_numpy(), 'amount': table['amount'].to_numpy()}
+
+def _buckets_finish(partial, granularity='hour', cls=None):
+    from utils.charts import bucket_table
+    return bucket_table(granularity, partial['count'], partial['amount'])
+
+def _grid_partial(frame, granularity='15min', amount_bins=40, log_scale=True, max_amount=5000):
+    from utils.metrics import fraud_rate_grid
+    grid = fraud_rate_grid(frame, granularity, amount_bins, log_scale, max_amount)
+    return {'count': grid['count'], 'fraud': grid['fraud']}
+
+def _grid_finish(partial, granularity='15min', amount_bins=40, log_scale=True, max_amount=5000):
+    from utils.metrics import fraud_rate_grid_result, heatmap_amount_edges
+    edges = heatmap_amount_edges(amount_bins, log_scale, max_amount)
+    return fraud_rate_grid_result(granularity, edges, partial['count'], partial['fraud'])
+
+def _histogram_partial(frame, edges):
+    from utils.metrics import binned_histogram
+    histogram = binned_histogram(frame, edges)
+    return {group: (count, total) for group, count, total in
+            zip(histogram['groups'], histogram['count'], histogram['sum'])}
+
+def _merge_histograms(a, b):
+    merged = dict(a)
+    for group, (count, total) in b.items():
+        if group in merged:
+            merged[group] = (merged[group][0] + count, merged[group][1] + total)
+        else:
+            merged[group] = (count, total)
+    return merged
+
+def _histogram_finish(partial, edges):
+    from utils.metrics import histogram_result
+    edges = sorted(edges)
+    groups = sorted(partial)
+    shape = (len(groups), len(edges) + 1)
+    counts = np.array([partial[group][0] for group in groups], dtype=np.int64).reshape(shape)
+    sums = np.array([partial[group][1] for group in groups], dtype=np.float64).reshape(shape)
+    return histogram_result(edges, groups, counts, sums)
+
+# Each aggregate: (partial aggregate of a frame, merge of two partials, final result)
+AGGREGATES = {
+    'cube': (_cube_partial, _merge_cubes, _cube_finish),
+    'bucketed_counts': (_buckets_partial, _add_arrays, _buckets_finish),
+    'fraud_rate_grid': (_grid_partial, _add_arrays, _grid_finish),
+    'binned_histogram': (_histogram_partial, _merge_histograms, _histogram_finish),
+}
+
+def time_partitions(times, n_parts):
+    """
+    Splits rows into up to n_parts contiguous (start, stop) ranges of about equal size
+
+    When the rows are sorted by Time (as the source is) every range is a Time
+    range and rows sharing a Time value stay together. Otherwise the ranges
+    are plain row ranges, which merge to the same aggregates.
+    """
+    n_rows = len(times)
+    if n_parts <= 1 or n_rows == 0:
+        return [(0, n_rows)]
+    cuts = np.linspace(0, n_rows, n_parts + 1).astype(np.int64)[1:-1]
+    if np.all(times[1:] >= times[:-1]):
+        cuts = np.searchsorted(times, times[cuts], side='left')
+    bounds = np.unique(np.concatenate([[0], cuts, [n_rows]]))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+def _frame(columns, start, stop):
+    """
+    Returns a frame viewing rows start:stop of the columns (no copy)
+    """
+    return pd.DataFrame({name: values[start:stop] for name, values in columns.items()}, copy=False)
+
+def _map_columns(folder):
+    """
+    Maps the column files of a folder read-only (worker side, kept for later tasks)
+
+    Folders removed since (released versions) are unmapped, so their memory is freed.
+    """
+    columns = _mapped.get(folder)
+    if columns is None:
+        for other in [other for other in _mapped if not os.path.isdir(other)]:
+            del _mapped[other]
+        columns = {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r') for name in SHARED_COLUMNS}
+        _mapped[folder] = columns
+    return columns
+
+def _run_partition(folder, start, stop, kind, params):
+    """
+    Worker task: the partial aggregate of rows start:stop
+    """
+    partial, _, _ = AGGREGATES[kind]
+    return partial(_frame(_map_columns(folder), start, stop), **params)
+
+def _share_columns(df, version):
+    """
+    Writes the aggregated columns of a dataset version to shared memory once and returns their folder
+
+    The files stay until release_version drops the version.
+    """
+    with _lock:
+        folder = _shared.get(version)
+        if folder is not None:
+            return folder
+
+    folder = tempfile.mkdtemp(prefix=f'credit_card_{version}_', dir=SHARED_DIR)
+    for name in SHARED_COLUMNS:
+        np.save(os.path.join(folder, f'{name}.npy'), df[name].to_numpy())
+
+    with _lock:
+        if version in _shared:
+            # Another thread shared the same version meanwhile
+            shutil.rmtree(folder, ignore_errors=True)
+            return _shared[version]
+        _shared[version] = folder
+    return folder
+
+def release_version(version):
+    """
+    Removes the shared column files of a dataset version (e.g. when the dataset is evicted)
+    """
+    with _lock:
+        folder = _shared.pop(version, None)
+    if folder is not None:
+        shutil.rmtree(folder, ignore_errors=True)
+
+def shared_bytes(version):
+    """
+    Returns the shared memory taken by the column files of a dataset version
+    """
+    with _lock:
+        folder = _shared.get(version)
+    if folder is None:
+        return 0
+    try:
+        return sum(os.path.getsize(os.path.join(folder, f'{name}.npy')) for name in SHARED_COLUMNS)
+    except OSError:
+        # Removed meanwhile (released by another thread)
+        return 0
+
+def _get_pool(workers):
+    """
+    Returns the shared worker pool, created on first use (and again if the settings change)
+    """
+    global _pool, _pool_key
+    with _lock:
+        if _pool is None or _pool_key != (EXECUTOR, workers):
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            if EXECUTOR == 'thread':
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='aggregate')
+            else:
+                # forkserver: never fork the multi-threaded server process itself
+                _pool = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context('forkserver'))
+            _pool_key = (EXECUTOR, workers)
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+@contextmanager
+def _plain_main():
+    """
+    Hides the running script from worker processes started in this block
+
+    Streamlit runs each page as the __main__ module, and new worker processes
+    import __main__ before taking tasks, which would run the page again.
+    """
+    main = sys.modules.get('__main__')
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+def _run_parallel(df, kind, parts, workers, params):
+    """
+    Aggregates each part in the pool and returns the partial results
+    """
+    pool = _get_pool(workers)
+    if EXECUTOR == 'thread':
+        partial, _, _ = AGGREGATES[kind]
+        columns = {name: df[name].to_numpy() for name in SHARED_COLUMNS}
+        futures = [pool.submit(partial, _frame(columns, start, stop), **params) for start, stop in parts]
+    else:
+        # A dataset mapped from the node's shared store is already in shared memory
+        folder = shared_folder(df) or _share_columns(df, dataset_version(df))
+        # Workers are started on demand by submit()
+        with _lock, _plain_main():
+            futures = [pool.submit(_run_partition, folder, start, stop, kind, params) for start, stop in parts]
+    return [future.result() for future in futures]
+
+def aggregate(df, kind, workers=None, **params):
+    """
+    Returns an aggregate of df ('cube', 'bucketed_counts', 'fraud_rate_grid' or 'binned_histogram')
+
+    The result is the same as the single-threaded function of the same name.
+    Large frames with a dataset version are split into one Time range per
+    worker; smaller or unversioned frames (e.g. filtered subsets) are
+    aggregated in the calling thread. If the pool cannot run (e.g. no
+    process support), the aggregate falls back to the calling thread.
+    """
+    partial, merge, finish = AGGREGATES[kind]
+    workers = WORKERS if workers is None else workers
+    started = time.perf_counter()
+
+    result = None
+    if workers > 1 and len(df) >= PARALLEL_MIN_ROWS and dataset_version(df) is not None:
+        parts = time_partitions(df['Time'].to_numpy(), workers)
+        try:
+            partials = _run_parallel(df, kind, parts, workers, params)
+        except (BrokenProcessPool, OSError):
+            _reset_pool()
+            with _lock:
+                _stats['fallbacks'] += 1
+        else:
+            result = partials[0]
+            for other in partials[1:]:
+                result = merge(result, other)
+            with _lock:
+                _stats['parallel_runs'] += 1
+                _stats['partitions'] += len(parts)
+
+    if result is None:
+        result = partial(df, **params)
+        with _lock:
+            _stats['serial_runs'] += 1
+
+    with _lock:
+        _stats['seconds'] += time.perf_counter() - started
+    return finish(result, **params)
+
+def aggregation_stats():
+    """
+    Returns counters of serial and parallel runs, partitions, pool fallbacks and time spent
+    """
+    with _lock:
+        return dict(_stats, workers=WORKERS, executor=EXECUTOR, shared_versions=len(_shared))
+
+@atexit.register
+def _cleanup():
+    """
+    Removes the shared column files when the server stops
+    """
+    for folder in _shared.values():
+        shutil.rmtree(folder, ignore_errors=True)
+    _shared.clear()
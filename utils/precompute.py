@@ -0,0 +1,311 @@
+"""
+Offline precompute job: writes a versioned bundle of everything the dashboard computes at startup
+
+    python -m utils.precompute [SOURCE] [--out DIR]
+    CREDIT_CARD_BUNDLE_DIR=DIR streamlit run app.py
+
+A bundle holds the cleaned columns (memory-mapped by the dashboard), the
+aggregate cube, the range index and quantile sketches of the Transaction
+Analysis page, and the default figures, plus a manifest with the SHA-256 and
+size of every file. The dashboard maps the newest complete bundle, checks its
+file sizes against the manifest and seeds its caches from it, so it never
+loads, cleans or aggregates the data itself. The checksums are verified in a
+background thread: bundles published later are swapped in without a restart
+once they pass, and a bundle that fails is replaced by the source itself.
+Indexes are stored with pickle: only point the dashboard at bundles written by
+this job.
+
+Layout of the bundle folder:
+
+    LATEST                      name of the newest complete bundle (replaced atomically)
+    <created>-<version>/
+        manifest.json
+        data/<column>.npy       cleaned columns (see utils.shared_store)
+        cube.npz                aggregate cube
+        indexes/*.pkl           range index and sketches
+        figures/*.json          default figures
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+from utils.charts import DEFAULT_FIGURES, create_amount_distribution
+from utils.cube import get_cube, remember_cube
+from utils.data_loader import dataset_version, get_data_source, load_and_clean_data
+from utils.download import file_sha256
+from utils.figure_cache import figure_cache, figure_key
+from utils.range_index import get_range_index, remember_range_index
+from utils.shared_store import FOLDER_MODE, map_columns, read_pointer, write_columns, write_pointer
+from utils.sketch import get_sketches, remember_sketches
+from utils.snapshot import CACHE_DIR
+
+# Folder of the bundles (unset: the dashboard loads and aggregates the data itself)
+BUNDLE_DIR = os.environ.get('CREDIT_CARD_BUNDLE_DIR')
+
+# Seconds between two checks for a newer bundle
+CHECK_SECONDS = 10.0
+
+# Bundles kept on disk (running dashboards may still be mapping the previous one)
+KEEP_BUNDLES = 3
+
+# Bump this whenever the bundle layout changes so old bundles are ignored
+BUNDLE_FORMAT = 1
+
+LATEST_FILE = 'LATEST'
+MANIFEST_FILE = 'manifest.json'
+
+# Range indexes and sketches stored in a bundle: (class, granularity) and granularity
+BUNDLE_INDEXES = [(0, 'hour')]
+BUNDLE_SKETCHES = ['hour']
+
+# Per source: time of the last check for a newer bundle
+_checked = {}
+_checked_lock = threading.Lock()
+
+# Bundle name -> True once its checksums matched the manifest, False if they did not
+_verified = {}
+_verifying = set()
+
+def bundle_figures():
+    """
+    Returns the (builder, parameters) pairs of the figures stored in a bundle
+
+    The figures shown when a page opens with its default settings, and the
+    log-scaled amount distribution (one checkbox away).
+    """
+    return DEFAULT_FIGURES + [(create_amount_distribution, {'bins': 50, 'log_scale': True})]
+
+def _checksums(folder):
+    """
+    Returns {relative path: {sha256, bytes}} for every file of a bundle except the manifest
+    """
+    files = {}
+    for directory, _, names in os.walk(folder):
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, folder)
+            if relative == MANIFEST_FILE:
+                continue
+            files[relative] = {'sha256': file_sha256(path), 'bytes': os.path.getsize(path)}
+    return files
+
+def build_bundle(source, out, keep=KEEP_BUNDLES):
+    """
+    Loads a source, computes its aggregates, indexes and figures and publishes them as a new bundle
+
+    Returns the path of the bundle.
+    """
+    started = time.perf_counter()
+    df = load_and_clean_data(source)
+    version = dataset_version(df)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{version}"
+    os.makedirs(out, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=out)
+
+    write_columns(os.path.join(staging, 'data'), df)
+    np.savez(os.path.join(staging, 'cube.npz'), **get_cube(df))
+
+    os.makedirs(os.path.join(staging, 'indexes'))
+    indexes = []
+    for cls, granularity in BUNDLE_INDEXES:
+        filename = f'indexes/range_index_{cls}_{granularity}.pkl'
+        with open(os.path.join(staging, filename), 'wb') as f:
+            pickle.dump(get_range_index(df, cls=cls, granularity=granularity), f, protocol=pickle.HIGHEST_PROTOCOL)
+        indexes.append(filename)
+    for granularity in BUNDLE_SKETCHES:
+        filename = f'indexes/sketches_{granularity}.pkl'
+        with open(os.path.join(staging, filename), 'wb') as f:
+            pickle.dump(get_sketches(df, granularity=granularity), f, protocol=pickle.HIGHEST_PROTOCOL)
+        indexes.append(filename)
+
+    os.makedirs(os.path.join(staging, 'figures'))
+    figures = {}
+    for number, (builder, params) in enumerate(bundle_figures()):
+        filename = f'figures/{number:02d}_{builder.__name__}.json'
+        with open(os.path.join(staging, filename), 'w', encoding='utf-8') as f:
+            f.write(builder(df, **params).to_json())
+        figures[filename] = figure_key(version, builder, params)
+
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'source': source,
+        'dataset_version': version,
+        'rows': len(df),
+        'created': time.time(),
+        'build_seconds': round(time.perf_counter() - started, 3),
+        'indexes': indexes,
+        'figures': figures,
+        'files': _checksums(staging),
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Dashboards only ever see a complete bundle named by a complete LATEST file
+    path = os.path.join(out, name)
+    os.chmod(staging, FOLDER_MODE)
+    os.replace(staging, path)
+    write_pointer(out, LATEST_FILE, name)
+    _remove_old_bundles(out, name, keep)
+    return path
+
+def _remove_old_bundles(out, latest, keep):
+    """
+    Deletes all but the keep newest bundles (names start with their creation time)
+
+    Dashboards that mapped a deleted bundle keep reading it until they swap.
+    """
+    names = sorted((entry.name for entry in os.scandir(out)
+                    if entry.is_dir() and not entry.name.startswith('.')), reverse=True)
+    for name in names[keep:]:
+        if name != latest:
+            shutil.rmtree(os.path.join(out, name), ignore_errors=True)
+
+def read_manifest(path):
+    """
+    Returns the manifest of a bundle, or None if it is missing or from another bundle format
+    """
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != BUNDLE_FORMAT:
+        return None
+    return manifest
+
+def verify_bundle(path, manifest, checksums=True):
+    """
+    Raises ValueError if a file of the bundle is missing or differs from its manifest
+
+    checksums=False only compares file sizes, which needs no read of the data.
+    """
+    for relative, expected in manifest['files'].items():
+        file = os.path.join(path, relative)
+        if (not os.path.exists(file) or os.path.getsize(file) != expected['bytes']
+                or (checksums and file_sha256(file) != expected['sha256'])):
+            raise ValueError(f"Bundle {path} is corrupt: {relative} does not match its manifest")
+
+def _verify_later(path, manifest):
+    """
+    Checks the checksums of a bundle in a background thread (once per bundle); the result lands in _verified
+    """
+    name = os.path.basename(path)
+    with _checked_lock:
+        if name in _verified or name in _verifying:
+            return
+        _verifying.add(name)
+
+    def run():
+        try:
+            verify_bundle(path, manifest)
+        except (OSError, ValueError):
+            # Corrupt, or deleted meanwhile by a newer build
+            passed = False
+        else:
+            passed = True
+        with _checked_lock:
+            _verifying.discard(name)
+            _verified[name] = passed
+
+    threading.Thread(target=run, name=f'verify-{name}', daemon=True).start()
+
+def load_bundle(path, verify=True):
+    """
+    Maps a bundle's columns and seeds the cube, index, sketch and figure caches from it
+
+    Returns the mapped frame; the caches are keyed by its dataset version.
+    File sizes are always checked against the manifest, checksums only with verify=True.
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise ValueError(f"{path} is not a bundle written by this version of utils.precompute")
+    verify_bundle(path, manifest, checksums=verify)
+
+    df = map_columns(os.path.join(path, 'data'))
+    df.attrs['bundle'] = os.path.basename(path)
+
+    with np.load(os.path.join(path, 'cube.npz')) as cube:
+        remember_cube(df, {stat: cube[stat] for stat in cube.files})
+    for filename in manifest['indexes']:
+        with open(os.path.join(path, filename), 'rb') as f:
+            index = pickle.load(f)
+        if filename.startswith('indexes/sketches_'):
+            remember_sketches(df, index)
+        else:
+            remember_range_index(df, index)
+    for filename, key in manifest['figures'].items():
+        with open(os.path.join(path, filename), 'r', encoding='utf-8') as f:
+            figure_cache.put(key, f.read())
+    return df
+
+def _latest(source, root):
+    """
+    Returns (path, manifest) of the newest bundle built from source, or (None, None)
+    """
+    name = read_pointer(root, LATEST_FILE)
+    if name is None:
+        return None, None
+    path = os.path.join(root, name)
+    manifest = read_manifest(path)
+    if manifest is None or manifest['source'] != source:
+        return None, None
+    return path, manifest
+
+def load_latest(source, root=None):
+    """
+    Returns the dataset of the newest bundle built from source, or None if there is none (or it failed verification)
+
+    Only the manifest and file sizes are checked before the bundle is used;
+    its checksums are verified in the background (see refresh).
+    """
+    path, manifest = _latest(source, root or BUNDLE_DIR)
+    if path is None or _verified.get(os.path.basename(path)) is False:
+        return None
+    df = load_bundle(path, verify=False)
+    _verify_later(path, manifest)
+    return df
+
+def refresh(source, df, root=None):
+    """
+    Returns a dataset to replace df with, or None (checked every CHECK_SECONDS)
+
+    A newer bundle replaces df once its checksums were verified in the
+    background. If the bundle of df itself failed verification and no newer
+    bundle passed, the source is loaded and cleaned instead.
+    """
+    now = time.monotonic()
+    with _checked_lock:
+        if now - _checked.get(source, 0.0) < CHECK_SECONDS:
+            return None
+        _checked[source] = now
+
+    current = df.attrs.get('bundle')
+    path, manifest = _latest(source, root or BUNDLE_DIR)
+    if path is not None and os.path.basename(path) != current:
+        passed = _verified.get(os.path.basename(path))
+        if passed:
+            return load_bundle(path, verify=False)
+        if passed is None:
+            # Swapped in on a later check, once the checksums matched
+            _verify_later(path, manifest)
+    if current is not None and _verified.get(current) is False:
+        return load_and_clean_data(source)
+    return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute the dashboard's data, aggregates and figures into a bundle")
+    parser.add_argument('source', nargs='?', default=None, help="CSV path or URL (default: the configured source)")
+    parser.add_argument('--out', default=BUNDLE_DIR or os.path.join(CACHE_DIR, 'bundles'),
+                        help="bundle folder (default: CREDIT_CARD_BUNDLE_DIR or bundles/ in the cache folder)")
+    parser.add_argument('--keep', type=int, default=KEEP_BUNDLES, help="bundles kept on disk")
+    args = parser.parse_args()
+
+    path = build_bundle(args.source or get_data_source(), args.out, args.keep)
+    manifest = read_manifest(path)
+    print(f"Wrote {path} ({manifest['rows']:,} rows, {len(manifest['files'])} files, "
+          f"{manifest['build_seconds']:.1f}s)")
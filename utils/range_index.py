@@ -0,0 +1,169 @@
+"""
+Sorted range index answering amount / time-bucket filters without filtering the frame
+"""
+import numpy as np
+import pandas as pd
+from utils.data_loader import cached_by_version, remember_by_version, version_cache
+from utils.derived import TIME_BUCKET_COLUMNS, buckets_per_day, compute_column
+
+# Range indexes kept in memory per dataset version, keyed by class and granularity
+MAX_CACHED_INDEXES = 8
+_index_cache = version_cache()
+
+def hour_buckets(hour_range, granularity):
+    """
+    Converts an inclusive hour range (e.g. (0, 23)) into an inclusive range of time buckets
+    """
+    per_hour = buckets_per_day(granularity) // 24
+    return hour_range[0] * per_hour, (hour_range[1] + 1) * per_hour - 1
+
+class RangeIndex:
+    """
+    Amounts sorted within each time bucket, with prefix sums
+
+    Rows are ordered by (bucket, amount), so the rows of one bucket are a
+    contiguous slice and any amount range inside it is found by binary search.
+    Counts and sums for any (amount range, bucket range) then come from the
+    prefix sums, without building a filtered frame.
+    """
+
+    def __init__(self, df, cls=None, granularity='hour'):
+        buckets = compute_column(df, TIME_BUCKET_COLUMNS[granularity]).to_numpy(dtype=np.intp)
+        amounts = df['Amount'].to_numpy(dtype=np.float64)
+        if cls is not None:
+            mask = df['Class'].to_numpy() == cls
+            buckets, amounts = buckets[mask], amounts[mask]
+
+        # Sort by bucket first, then by amount
+        order = np.lexsort((amounts, buckets))
+        self.amounts = amounts[order]
+        self.cls = cls
+        self.granularity = granularity
+        self.n_buckets = buckets_per_day(granularity)
+
+        # offsets[b]:offsets[b + 1] is the slice holding bucket b
+        self.offsets = np.searchsorted(buckets[order], np.arange(self.n_buckets + 1))
+
+        # Prefix sums: prefix_sum[i] is the sum of the first i amounts
+        self.prefix_sum = np.concatenate([[0.0], np.cumsum(self.amounts)])
+        self.prefix_sumsq = np.concatenate([[0.0], np.cumsum(self.amounts * self.amounts)])
+
+    def _positions(self, value, side, first, last):
+        """
+        Returns, for buckets first..last, the position of value inside each bucket's slice
+        """
+        positions = np.empty(last - first + 1, dtype=np.intp)
+        for i, bucket in enumerate(range(first, last + 1)):
+            start, end = self.offsets[bucket], self.offsets[bucket + 1]
+            positions[i] = start + np.searchsorted(self.amounts[start:end], value, side=side)
+        return positions
+
+    def bucket_range(self, hour_range):
+        """
+        Converts an inclusive hour range (e.g. (0, 23)) into an inclusive bucket range
+        """
+        return hour_buckets(hour_range, self.granularity)
+
+    def slices(self, amount_range, bucket_range):
+        """
+        Returns the (start, end) positions of the selected rows in every selected bucket
+
+        Both ranges are inclusive, like the page sliders.
+        """
+        first, last = bucket_range
+        starts = self._positions(amount_range[0], 'left', first, last)
+        ends = self._positions(amount_range[1], 'right', first, last)
+        return starts, ends
+
+    def per_bucket(self, amount_range, bucket_range=None):
+        """
+        Returns count and amount for every bucket, limited to the selected ranges
+        """
+        counts = np.zeros(self.n_buckets, dtype=np.int64)
+        sums = np.zeros(self.n_buckets)
+        first, last = bucket_range if bucket_range is not None else (0, self.n_buckets - 1)
+        starts, ends = self.slices(amount_range, (first, last))
+        counts[first:last + 1] = ends - starts
+        sums[first:last + 1] = self.prefix_sum[ends] - self.prefix_sum[starts]
+        return counts, sums
+
+    def query(self, amount_range, bucket_range):
+        """
+        Returns count, sum and mean of the rows inside the selected ranges
+        """
+        starts, ends = self.slices(amount_range, bucket_range)
+        count = int((ends - starts).sum())
+        total = float((self.prefix_sum[ends] - self.prefix_sum[starts]).sum())
+        return {'count': count, 'sum': total, 'mean': total / count if count > 0 else 0}
+
+    def count_by_bins(self, edges, amount_range, bucket_range):
+        """
+        Counts the selected rows in each amount bin (bin i covers edges[i-1] <= amount < edges[i])
+        """
+        starts, ends = self.slices(amount_range, bucket_range)
+        # Bin boundaries, clipped to the selection, as positions in each bucket
+        boundaries = [starts]
+        for edge in edges:
+            positions = self._positions(edge, 'left', *bucket_range)
+            boundaries.append(np.clip(positions, starts, ends))
+        boundaries.append(ends)
+        return np.array([(upper - lower).sum() for lower, upper in zip(boundaries[:-1], boundaries[1:])])
+
+    def moments(self, amount_range, bucket_range):
+        """
+        Returns count, mean, std, min and max of the selected amounts without gathering them
+
+        Count, mean and std come from the prefix sums; min and max are the
+        first and last amount of each bucket's (sorted) slice.
+        """
+        starts, ends = self.slices(amount_range, bucket_range)
+        count = int((ends - starts).sum())
+        if count == 0:
+            return {'count': 0, 'mean': np.nan, 'std': np.nan, 'min': np.nan, 'max': np.nan}
+
+        total = (self.prefix_sum[ends] - self.prefix_sum[starts]).sum()
+        sumsq = (self.prefix_sumsq[ends] - self.prefix_sumsq[starts]).sum()
+        mean = total / count
+        variance = (sumsq - count * mean * mean) / (count - 1) if count > 1 else np.nan
+        filled = ends > starts
+        return {
+            'count': count,
+            'mean': mean,
+            'std': max(variance, 0.0) ** 0.5 if count > 1 else np.nan,
+            'min': self.amounts[starts[filled]].min(),
+            'max': self.amounts[ends[filled] - 1].max(),
+        }
+
+    def describe(self, amount_range, bucket_range):
+        """
+        Returns the same summary as Series.describe() for the selected amounts
+
+        Quartiles only gather the selected amounts (never the whole frame);
+        utils.sketch.describe answers large selections without gathering.
+        """
+        stats = self.moments(amount_range, bucket_range)
+        labels = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+        if stats['count'] == 0:
+            return pd.Series([0.0] + [np.nan] * 7, index=labels, name='Amount')
+
+        starts, ends = self.slices(amount_range, bucket_range)
+        values = np.concatenate([self.amounts[start:end] for start, end in zip(starts, ends)])
+        quartiles = np.percentile(values, [25, 50, 75])
+        values = [stats['count'], stats['mean'], stats['std'], stats['min'], *quartiles, stats['max']]
+        return pd.Series(values, index=labels, name='Amount')
+
+def get_range_index(df, cls=None, granularity='hour'):
+    """
+    Returns the range index for a frame, building it only once per dataset version
+    """
+    def build(frame):
+        return RangeIndex(frame, cls=cls, granularity=granularity)
+    return cached_by_version(_index_cache, df, ('range_index', cls, granularity), build, MAX_CACHED_INDEXES)
+
+def remember_range_index(df, index):
+    """
+    Caches an index built elsewhere (e.g. read from a precomputed bundle) for df's version
+    """
+    key = ('range_index', index.cls, index.granularity)
+    remember_by_version(_index_cache, df, key, index, MAX_CACHED_INDEXES)
+    return index
@@ -0,0 +1,101 @@
+"""
+Named datasets served by one deployment (per region, per month, ...) and the sidebar selector of the pages
+
+    CREDIT_CARD_DATASETS="emea=/data/emea.csv;us=https://example.com/us.csv" streamlit run app.py
+
+Pages pass the selected source to get_backend / get_dataset. Datasets are
+loaded on first selection and kept in memory within
+CREDIT_CARD_DATASET_MEMORY_MB (see utils.dataset), so switching back to one
+still loaded is instant.
+"""
+import os
+import streamlit as st
+from utils.data_loader import get_data_source
+
+# Key of the dataset in the session, shared by every page
+SESSION_KEY = 'dataset_key'
+
+# Session key of the selector itself (Streamlit drops widget state when the page changes)
+WIDGET_KEY = 'dataset_selector'
+
+def get_registry():
+    """
+    Returns {key: source} of the configured datasets, the default one first
+
+    CREDIT_CARD_DATASETS lists key=source pairs separated by semicolons;
+    unset, the registry holds the single configured source under 'default'.
+    """
+    setting = os.environ.get('CREDIT_CARD_DATASETS', '').strip()
+    if not setting:
+        return {'default': get_data_source()}
+
+    registry = {}
+    for entry in setting.split(';'):
+        entry = entry.strip()
+        if not entry:
+            continue
+        key, separator, source = entry.partition('=')
+        if not separator or not key.strip() or not source.strip():
+            raise ValueError(f"CREDIT_CARD_DATASETS entries must look like key=source, got {entry!r}")
+        registry[key.strip()] = source.strip()
+    return registry
+
+def default_source():
+    """
+    Returns the source of the first registered dataset (the one warmed up at startup)
+    """
+    return next(iter(get_registry().values()))
+
+def source_for(key):
+    """
+    Returns the source registered under key
+    """
+    registry = get_registry()
+    if key not in registry:
+        raise KeyError(f"Unknown dataset {key!r} (registered: {', '.join(registry)})")
+    return registry[key]
+
+def select_dataset():
+    """
+    Shows the dataset selector in the sidebar and returns the selected source
+
+    The choice is kept in the session, so it follows the user across pages.
+    The selector is hidden when a single dataset is registered. With the
+    Parquet backend each dataset is read from its own folder (see
+    utils.backend.partitions_dir).
+    """
+    from utils.backend import BACKEND
+
+    registry = get_registry()
+    keys = list(registry)
+    current = st.session_state.get(SESSION_KEY)
+    if current not in registry:
+        current = keys[0]
+
+    st.session_state[SESSION_KEY] = current
+
+    if len(keys) > 1:
+        st.session_state[WIDGET_KEY] = current
+        st.sidebar.selectbox("📁 Dataset", options=keys, key=WIDGET_KEY, on_change=_remember_selection)
+        if BACKEND != 'parquet':
+            # Parquet datasets are scanned on disk, not loaded
+            _show_memory()
+    return registry[current]
+
+def _remember_selection():
+    """
+    Keeps the selector's new value in the session (runs before the page reruns)
+    """
+    st.session_state[SESSION_KEY] = st.session_state[WIDGET_KEY]
+
+def _show_memory():
+    """
+    Shows how many datasets are loaded and the memory they take against the budget
+    """
+    from utils.dataset import dataset_stats
+
+    stats = dataset_stats()
+    st.sidebar.caption(
+        f"{len(stats['datasets'])} loaded · {stats['loaded_bytes'] / 2**20:,.0f} of "
+        f"{stats['budget_bytes'] / 2**20:,.0f} MB · {stats['evictions']} evicted"
+    )
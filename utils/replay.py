@@ -0,0 +1,229 @@
+"""
+Replays the dataset in Time order as a simulated live feed with sliding-window statistics
+"""
+import math
+import time
+from collections import deque
+import numpy as np
+from utils.data_loader import cached_by_version, version_cache
+
+# Replay speeds offered on the monitor page (simulated seconds per real second)
+SPEEDS = [1, 10, 60, 600, 3600]
+
+# Sliding windows offered on the monitor page, in seconds
+WINDOWS = {'1 minute': 60, '5 minutes': 300, '15 minutes': 900, '1 hour': 3600}
+
+# Width of one ring-buffer slot in seconds
+SLOT_SECONDS = 1.0
+
+# Window snapshots kept for the trend chart
+HISTORY_LENGTH = 300
+
+# Sorted feeds kept in memory: one per dataset version
+MAX_CACHED_FEEDS = 1
+_feed_cache = version_cache()
+
+class SlidingWindow:
+    """
+    Counts, fraud count, amount and fraud loss over the last window_seconds of events
+
+    Events land in a ring of one-second slots. Moving the clock forward clears
+    the slots that fell out of the window and subtracts them from running
+    totals, so each event costs O(1) and each slot is cleared once per pass.
+    """
+
+    def __init__(self, window_seconds, slot_seconds=SLOT_SECONDS):
+        self.window_seconds = window_seconds
+        self.slot_seconds = slot_seconds
+        self.n_slots = max(1, math.ceil(window_seconds / slot_seconds))
+        self.counts = np.zeros(self.n_slots, dtype=np.int64)
+        self.frauds = np.zeros(self.n_slots, dtype=np.int64)
+        self.amounts = np.zeros(self.n_slots)
+        self.losses = np.zeros(self.n_slots)
+        self.head = None   # absolute number of the newest slot
+        self.count = 0
+        self.fraud = 0
+        self.amount = 0.0
+        self.loss = 0.0
+
+    def _clear(self, ring):
+        """
+        Removes the given ring positions from the totals and empties them
+        """
+        self.count -= int(self.counts[ring].sum())
+        self.fraud -= int(self.frauds[ring].sum())
+        self.amount -= float(self.amounts[ring].sum())
+        self.loss -= float(self.losses[ring].sum())
+        self.counts[ring] = 0
+        self.frauds[ring] = 0
+        self.amounts[ring] = 0.0
+        self.losses[ring] = 0.0
+
+    def advance(self, t):
+        """
+        Moves the window so it ends at time t (earlier times are ignored)
+        """
+        slot = int(t // self.slot_seconds)
+        if self.head is None:
+            self.head = slot
+            return
+        steps = slot - self.head
+        if steps <= 0:
+            return
+        if steps >= self.n_slots:
+            self._clear(slice(None))
+            # Totals are exactly zero now; drop accumulated float error
+            self.count, self.fraud, self.amount, self.loss = 0, 0, 0.0, 0.0
+        else:
+            self._clear(np.arange(self.head + 1, slot + 1) % self.n_slots)
+        self.head = slot
+
+    def add(self, t, amount, is_fraud):
+        """
+        Adds one event (events must arrive in time order, late ones outside the window are dropped)
+        """
+        self.advance(t)
+        slot = int(t // self.slot_seconds)
+        if slot <= self.head - self.n_slots:
+            return
+        i = slot % self.n_slots
+        self.counts[i] += 1
+        self.amounts[i] += amount
+        self.count += 1
+        self.amount += amount
+        if is_fraud:
+            self.frauds[i] += 1
+            self.losses[i] += amount
+            self.fraud += 1
+            self.loss += amount
+
+    def add_many(self, times, amounts, classes):
+        """
+        Adds a batch of events sorted by time, with one vectorized update per batch
+        """
+        if len(times) == 0:
+            return
+        self.advance(times[-1])
+        slots = (times // self.slot_seconds).astype(np.int64)
+        inside = slots > self.head - self.n_slots
+        ring = slots[inside] % self.n_slots
+        amounts = amounts[inside]
+        fraud = classes[inside] == 1
+
+        counts = np.bincount(ring, minlength=self.n_slots)
+        frauds = np.bincount(ring, weights=fraud, minlength=self.n_slots).astype(np.int64)
+        sums = np.bincount(ring, weights=amounts, minlength=self.n_slots)
+        losses = np.bincount(ring, weights=amounts * fraud, minlength=self.n_slots)
+        self.counts += counts
+        self.frauds += frauds
+        self.amounts += sums
+        self.losses += losses
+        self.count += int(counts.sum())
+        self.fraud += int(frauds.sum())
+        self.amount += float(sums.sum())
+        self.loss += float(losses.sum())
+
+    def snapshot(self):
+        """
+        Returns the current window totals
+        """
+        # Subtracting expired slots can leave tiny rounding residues below zero
+        return {
+            'count': self.count,
+            'fraud': self.fraud,
+            'fraud_rate': self.fraud / self.count * 100 if self.count > 0 else 0.0,
+            'amount': max(self.amount, 0.0),
+            'loss': max(self.loss, 0.0),
+        }
+
+def get_replay_feed(df):
+    """
+    Returns (Time, Amount, Class) arrays sorted by Time, built once per dataset version
+    """
+    def build(frame):
+        times = frame['Time'].to_numpy(dtype=np.float64)
+        order = None if np.all(times[1:] >= times[:-1]) else np.argsort(times, kind='stable')
+        amounts = frame['Amount'].to_numpy(dtype=np.float64)
+        classes = frame['Class'].to_numpy(dtype=np.int8)
+        if order is not None:
+            times, amounts, classes = times[order], amounts[order], classes[order]
+        return times, amounts, classes
+    return cached_by_version(_feed_cache, df, 'replay_feed', build, MAX_CACHED_FEEDS)
+
+def feed_window(feed, start, end):
+    """
+    Returns the events of a sorted feed with start <= Time < end
+    """
+    times, amounts, classes = feed
+    first, last = np.searchsorted(times, [start, end], side='left')
+    return times[first:last], amounts[first:last], classes[first:last]
+
+class Replay:
+    """
+    Feeds a dataset into a SlidingWindow as if the transactions were arriving now
+
+    data is a query backend (see utils.backend): every call to step() asks it
+    for the events whose Time was reached since the previous call, so the
+    work and memory per refresh are proportional to the new events. The
+    simulated clock runs speed times faster than the wall clock.
+    """
+
+    def __init__(self, data, window_seconds, speed=60):
+        self.data = data
+        first, self.last, self.total = data.time_span()
+        self.window = SlidingWindow(window_seconds)
+        self.speed = speed
+        self.position = 0
+        self.clock = first
+        self._fed = first   # events before this Time were fed
+        self.running = False
+        self.history = deque(maxlen=HISTORY_LENGTH)
+        self._wall = None
+        self._events = 0
+        self._busy = 0.0
+
+    @property
+    def finished(self):
+        return self.total == 0 or self._fed > self.last
+
+    def start(self):
+        self.running = True
+        self._wall = time.monotonic()
+
+    def pause(self):
+        self.step()
+        self.running = False
+
+    def set_speed(self, speed):
+        self.step()
+        self.speed = speed
+
+    def step(self):
+        """
+        Advances the simulated clock to now and feeds the events reached in between
+        """
+        if not self.running or self.finished:
+            return 0
+        now = time.monotonic()
+        self.clock += (now - self._wall) * self.speed
+        self._wall = now
+
+        started = time.perf_counter()
+        times, amounts, classes = self.data.replay_window(self._fed, self.clock)
+        self._fed = self.clock
+        self.window.add_many(times, amounts, classes)
+        self.window.advance(self.clock)
+        self._busy += time.perf_counter() - started
+        self._events += len(times)
+        self.position += len(times)
+
+        self.history.append({'Time': self.clock, **self.window.snapshot()})
+        if self.finished:
+            self.running = False
+        return len(times)
+
+    def throughput(self):
+        """
+        Returns the events processed per second of processing time
+        """
+        return self._events / self._busy if self._busy > 0 else 0.0
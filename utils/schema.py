@@ -0,0 +1,56 @@
+"""
+Defines the compact column types of the transaction frame
+"""
+import pandas as pd
+
+# PCA features V1-V28 from the original dataset
+FEATURE_COLUMNS = [f'V{i}' for i in range(1, 29)]
+
+# Labels used by the derived columns
+TRANSACTION_TYPES = ['Normal', 'Fraud']
+AMOUNT_CATEGORIES = ['Small (< $100)', 'Medium ($100-$500)', 'Large ($500-$1000)', 'Very Large (> $1000)']
+
+# Column types of the cleaned frame
+# Time and Amount stay float64 so sums and averages match the raw values exactly;
+# the anonymized features only need float32 precision
+SCHEMA = {
+    'Time': 'float64',
+    **{name: 'float32' for name in FEATURE_COLUMNS},
+    'Amount': 'float64',
+    'Class': 'int8',
+    'Transaction_Type': pd.CategoricalDtype(TRANSACTION_TYPES),
+    'Hour': 'float64',
+    'Minute_Of_Day': 'int16',
+    'Bucket_5Min': 'int16',
+    'Bucket_15Min': 'int8',
+    'Hour_Of_Day': 'int8',
+    'Day': 'int16',
+    'Amount_K': 'float32',
+    'Amount_Category': pd.CategoricalDtype(AMOUNT_CATEGORIES, ordered=True),
+}
+
+def apply_schema(df):
+    """
+    Converts the columns of the frame to the compact schema
+
+    Columns are converted one at a time, so peak memory only grows
+    by a single column while the frame shrinks.
+    """
+    for name, dtype in SCHEMA.items():
+        if name in df.columns and df[name].dtype != dtype:
+            df[name] = df[name].astype(dtype)
+    return df
+
+def memory_report(df):
+    """
+    Returns a table of memory usage per column, largest first
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'Column': usage.index,
+        'Dtype': [str(df[name].dtype) for name in usage.index],
+        'MB': usage.values / 2**20,
+    })
+    total = report['MB'].sum()
+    report['Share (%)'] = (report['MB'] / total) * 100 if total > 0 else 0
+    return report.sort_values('MB', ascending=False).reset_index(drop=True)
@@ -0,0 +1,268 @@
+"""
+Memory-mapped copy of the cleaned dataset, shared by every server process of a node
+
+    CREDIT_CARD_SHARED_DIR=/dev/shm/credit_card streamlit run app.py --server.port 8501
+    CREDIT_CARD_SHARED_DIR=/dev/shm/credit_card streamlit run app.py --server.port 8502
+
+The first process that needs the data loads it and writes each column to an
+.npy file; every process (the loader included) then maps the files
+read-only, so the node holds one copy of the data whatever the number of
+processes. To publish new data without a restart, run the loader:
+
+    CREDIT_CARD_SHARED_DIR=/dev/shm/credit_card python -m utils.shared_store [SOURCE]
+
+Layout of the store of one source:
+
+    CURRENT           name of the current version folder (replaced atomically)
+    .lock             file lock held by writers
+    v-<version>/      one <column>.npy per column and meta.json
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from utils.data_loader import dataset_version, get_data_source, load_and_clean_data
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: a single writer process is assumed
+    fcntl = None
+
+# Root folder of the shared stores (unset: every process keeps its own copy)
+SHARED_DIR = os.environ.get('CREDIT_CARD_SHARED_DIR')
+
+# Seconds between two checks for a newer version
+CHECK_SECONDS = 5.0
+
+# Version folders kept on disk (processes may still be mapping the previous one)
+KEEP_VERSIONS = 2
+
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = '.lock'
+META_FILE = 'meta.json'
+
+# Per source: time of the last check for a newer version
+_checked = {}
+_checked_lock = threading.Lock()
+
+def _read_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+# Temporary files and folders are created private (0600 / 0700); published
+# ones get the usual permissions so server processes of other users can read them
+_UMASK = _read_umask()
+FILE_MODE = 0o666 & ~_UMASK
+FOLDER_MODE = 0o777 & ~_UMASK
+
+def store_dir(source):
+    """
+    Returns the store folder of a source
+    """
+    key = hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(SHARED_DIR, key)
+
+@contextmanager
+def _locked(root):
+    """
+    Holds the store's writer lock (shared by every process of the node)
+    """
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, LOCK_FILE)
+    try:
+        lock = open(path, 'a')
+    except PermissionError:
+        # Created by another user: a shared read handle is enough for flock
+        lock = open(path, 'r')
+    with lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+def current_name(root):
+    """
+    Returns the name of the current version folder, or None if nothing was published yet
+    """
+    return read_pointer(root, CURRENT_FILE)
+
+def _json_attrs(attrs):
+    """
+    Keeps the frame attributes that can be stored as JSON
+    """
+    kept = {}
+    for key, value in attrs.items():
+        try:
+            json.dumps(value)
+        except TypeError:
+            continue
+        kept[key] = value
+    return kept
+
+def write_columns(folder, df):
+    """
+    Writes every column of df to folder as <column>.npy, plus meta.json with the column order and attrs
+    """
+    os.makedirs(folder, exist_ok=True)
+    for column in df.columns:
+        np.save(os.path.join(folder, f'{column}.npy'), df[column].to_numpy())
+    # Where a frame was mapped from is set again by map_columns
+    attrs = {key: value for key, value in df.attrs.items() if key not in ('shared_folder', 'shared_version')}
+    meta = {'columns': list(df.columns), 'rows': len(df), 'attrs': _json_attrs(attrs)}
+    with open(os.path.join(folder, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+def map_columns(folder):
+    """
+    Returns a frame whose columns are read-only memory maps of a folder written by write_columns (no copy)
+    """
+    with open(os.path.join(folder, META_FILE), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    columns = {column: np.load(os.path.join(folder, f'{column}.npy'), mmap_mode='r') for column in meta['columns']}
+    df = pd.DataFrame(columns, copy=False)
+    df.attrs.update(meta['attrs'])
+    df.attrs['shared_folder'] = folder
+    df.attrs['shared_version'] = dataset_version(df)
+    return df
+
+def write_pointer(root, filename, name):
+    """
+    Points root/filename at name, replacing it atomically (readers see the old or the new name)
+    """
+    fd, path = tempfile.mkstemp(prefix=f'.{filename.lower()}-', dir=root)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.chmod(path, FILE_MODE)
+    os.replace(path, os.path.join(root, filename))
+
+def read_pointer(root, filename):
+    """
+    Returns the name root/filename points at, or None if it does not exist yet
+    """
+    try:
+        with open(os.path.join(root, filename), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _write_version(root, df):
+    """
+    Writes df as a new version folder and makes it current (caller holds the lock)
+    """
+    name = f'v-{dataset_version(df)}'
+    folder = os.path.join(root, name)
+    if not os.path.isdir(folder):
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=root)
+        write_columns(staging, df)
+        os.chmod(staging, FOLDER_MODE)
+        os.replace(staging, folder)
+
+    # Readers only ever see a complete CURRENT file naming a complete folder
+    write_pointer(root, CURRENT_FILE, name)
+    _remove_old_versions(root, name)
+    return name
+
+def _remove_old_versions(root, current):
+    """
+    Deletes version folders beyond the KEEP_VERSIONS newest
+
+    Processes that mapped a deleted version keep reading it until they swap:
+    the files stay alive as long as they are mapped.
+    """
+    folders = [entry for entry in os.scandir(root) if entry.is_dir() and entry.name.startswith('v-')]
+    folders.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    kept = {current}
+    for entry in folders:
+        if entry.name in kept:
+            continue
+        if len(kept) < KEEP_VERSIONS:
+            kept.add(entry.name)
+        else:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def publish_version(source, df):
+    """
+    Writes a cleaned frame to the store of a source and makes it the current version
+    """
+    root = store_dir(source)
+    with _locked(root):
+        return _write_version(root, df)
+
+def _map_current(root):
+    """
+    Maps the current version, or returns None if nothing was published yet
+    """
+    for _ in range(3):
+        name = current_name(root)
+        if name is None:
+            return None
+        try:
+            return map_columns(os.path.join(root, name))
+        except FileNotFoundError:
+            # Replaced and removed between reading CURRENT and opening it: read CURRENT again
+            continue
+    raise RuntimeError(f"Could not map the current version of {root}")
+
+def load(source):
+    """
+    Returns the shared dataset of a source, loading and publishing it if no process did yet
+
+    Processes arriving while another one loads wait on the store lock and
+    then map what it published.
+    """
+    root = store_dir(source)
+    df = _map_current(root)
+    if df is not None:
+        return df
+    with _locked(root):
+        df = _map_current(root)
+        if df is None:
+            _write_version(root, load_and_clean_data(source))
+            df = _map_current(root)
+    return df
+
+def shared_folder(df):
+    """
+    Returns the folder of .npy files holding exactly df's columns, or None
+
+    Frames derived from a mapped one (filtered, appended) keep its attributes
+    but not its rows, so the mapped version must also be the frame's own.
+    """
+    version = dataset_version(df)
+    if version is None or df.attrs.get('shared_version') != version:
+        return None
+    return df.attrs.get('shared_folder')
+
+def refresh(source, df):
+    """
+    Returns the newer published version of a source if there is one (checked every CHECK_SECONDS), else None
+    """
+    now = time.monotonic()
+    with _checked_lock:
+        if now - _checked.get(source, 0.0) < CHECK_SECONDS:
+            return None
+        _checked[source] = now
+
+    root = store_dir(source)
+    name = current_name(root)
+    if name is None or name == f"v-{df.attrs.get('shared_version')}":
+        return None
+    return _map_current(root)
+
+if __name__ == '__main__':
+    if not SHARED_DIR:
+        sys.exit("Set CREDIT_CARD_SHARED_DIR to the folder shared by the server processes")
+    source = sys.argv[1] if len(sys.argv) > 1 else get_data_source()
+    name = publish_version(source, load_and_clean_data(source))
+    print(f"Published {name} to {store_dir(source)}")
@@ -0,0 +1,93 @@
+"""
+Coalesces concurrent calls for the same key into a single execution
+"""
+import threading
+
+class _Call:
+    """
+    One in-flight execution and the outcome its waiters share
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Lets exactly one caller per key run the work while the others wait for its result
+
+    If the work raises, every waiting caller gets the same exception.
+    Callers that arrive after the work finished start a new execution.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+        # Counters shown by stats()
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    def do(self, key, fn, timeout=None):
+        """
+        Returns fn(), running it only once for all concurrent callers with the same key
+
+        timeout: seconds a waiting caller accepts to wait before TimeoutError
+                 (the caller running fn is never interrupted)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self.failures += 1
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Timed out after {timeout}s waiting for {key!r} to load")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self):
+        """
+        Returns the keys currently being computed
+        """
+        with self._lock:
+            return list(self._calls)
+
+    def stats(self):
+        """
+        Returns how many executions ran and how many callers were coalesced into them
+        """
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts,
+                'failures': self.failures,
+                'in_flight': len(self._calls),
+            }
@@ -0,0 +1,184 @@
+"""
+Mergeable quantile sketches of Amount per class and time bucket
+"""
+import math
+import numpy as np
+import pandas as pd
+from utils.data_loader import cached_by_version, remember_by_version, version_cache
+from utils.derived import TIME_BUCKET_COLUMNS, buckets_per_day, compute_column
+
+# Every quantile returned by a sketch is within 1% of the exact value
+RELATIVE_ACCURACY = 0.01
+
+# Amounts up to this value share the first bucket and are reported as $0
+MIN_AMOUNT = 0.01
+
+# Selections with at most this many rows get exact quantiles from the range index
+EXACT_MAX_ROWS = 20_000
+
+# Quantiles reported by describe(), labelled like Series.describe()
+DESCRIBE_QUANTILES = [0.25, 0.5, 0.75, 0.99]
+
+# Sketch grids kept in memory per dataset version, keyed by granularity
+MAX_CACHED_SKETCHES = 4
+_sketch_cache = version_cache()
+
+class QuantileSketches:
+    """
+    Log-bucket histograms of Amount (DDSketch-style), one per class and time bucket
+
+    Bucket k >= 1 holds the amounts in (MIN_AMOUNT * gamma^(k-1), MIN_AMOUNT * gamma^k]
+    with gamma = (1 + a) / (1 - a). Reporting the bucket's midpoint
+    2 * MIN_AMOUNT * gamma^k / (gamma + 1) is then within a relative error a
+    of every amount in it, whatever the data. Sketches merge by adding their
+    counts, so the sketch of any hour range is the sum of a few rows.
+    """
+
+    def __init__(self, df, granularity='hour', relative_accuracy=RELATIVE_ACCURACY):
+        self.granularity = granularity
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.n_buckets = buckets_per_day(granularity)
+
+        amounts = df['Amount'].to_numpy(dtype=np.float64)
+        classes = df['Class'].to_numpy(dtype=np.intp)
+        buckets = compute_column(df, TIME_BUCKET_COLUMNS[granularity]).to_numpy(dtype=np.intp)
+        largest = float(amounts.max()) if len(amounts) else MIN_AMOUNT
+        self.n_keys = int(self.key_of(np.array([largest]))[0]) + 1
+
+        keys = self.key_of(amounts)
+        cells = (classes * self.n_buckets + buckets) * self.n_keys + keys
+        size = 2 * self.n_buckets * self.n_keys
+        self.counts = np.bincount(cells, minlength=size).astype(np.int32).reshape(2, self.n_buckets, self.n_keys)
+
+    def key_of(self, values):
+        """
+        Returns the bucket number of every value (0 for values up to MIN_AMOUNT)
+        """
+        keys = np.zeros(len(values), dtype=np.intp)
+        above = values > MIN_AMOUNT
+        keys[above] = np.ceil(np.log(values[above] / MIN_AMOUNT) / math.log(self.gamma))
+        return keys
+
+    def upper_edge(self, key):
+        """
+        Returns the largest amount stored in bucket key
+        """
+        return MIN_AMOUNT * self.gamma ** key
+
+    def value_of(self, keys):
+        """
+        Returns the value reported for each bucket (within the relative accuracy of its amounts)
+        """
+        keys = np.asarray(keys)
+        return np.where(keys > 0, 2 * MIN_AMOUNT * self.gamma ** keys / (self.gamma + 1), 0.0)
+
+    def merged(self, cls, bucket_range):
+        """
+        Returns the counts per key of one class (None: both) over an inclusive bucket range
+        """
+        first, last = bucket_range
+        counts = self.counts[:, first:last + 1] if cls is None else self.counts[cls, first:last + 1]
+        return counts.reshape(-1, self.n_keys).sum(axis=0, dtype=np.int64)
+
+    def merge(self, other):
+        """
+        Adds the counts of another grid built with the same granularity and accuracy
+        """
+        if (other.granularity, other.relative_accuracy) != (self.granularity, self.relative_accuracy):
+            raise ValueError("Only sketches with the same granularity and accuracy can be merged")
+        n_keys = max(self.n_keys, other.n_keys)
+        counts = np.zeros((2, self.n_buckets, n_keys), dtype=np.int32)
+        counts[:, :, :self.n_keys] += self.counts
+        counts[:, :, :other.n_keys] += other.counts
+        self.counts, self.n_keys = counts, n_keys
+        return self
+
+    def quantiles(self, qs, counts):
+        """
+        Returns the quantiles qs (0-1) of merged counts, interpolated like numpy's default
+        """
+        total = int(counts.sum())
+        if total == 0:
+            return np.full(len(qs), np.nan)
+        cumulative = np.cumsum(counts)
+        ranks = np.asarray(qs, dtype=np.float64) * (total - 1)
+        lower = np.floor(ranks).astype(np.int64)
+        upper = np.minimum(lower + 1, total - 1)
+        lower_values = self.value_of(np.searchsorted(cumulative, lower, side='right'))
+        upper_values = self.value_of(np.searchsorted(cumulative, upper, side='right'))
+        return lower_values + (ranks - lower) * (upper_values - lower_values)
+
+def get_sketches(df, granularity='hour'):
+    """
+    Returns the sketch grid for a frame, building it only once per dataset version
+    """
+    def build(frame):
+        return QuantileSketches(frame, granularity=granularity)
+    return cached_by_version(_sketch_cache, df, ('sketches', granularity), build, MAX_CACHED_SKETCHES)
+
+def remember_sketches(df, sketches):
+    """
+    Caches a sketch grid built elsewhere (e.g. read from a precomputed bundle) for df's version
+    """
+    remember_by_version(_sketch_cache, df, ('sketches', sketches.granularity), sketches, MAX_CACHED_SKETCHES)
+    return sketches
+
+def _selection_counts(sketches, index, cls, amount_range, bucket_range):
+    """
+    Merged counts per key, limited to an amount range with exact counts in the edge buckets
+
+    The buckets holding the range limits are only partly selected, so their
+    counts are replaced by exact ones from the range index; what remains is
+    the value error of the sketch alone.
+    """
+    counts = sketches.merged(cls, bucket_range)
+    low, high = amount_range
+    keys = sketches.key_of(np.array([low, high], dtype=np.float64))
+    low_key, high_key = np.minimum(keys, sketches.n_keys - 1)
+    counts[:low_key] = 0
+    counts[high_key + 1:] = 0
+
+    total = index.query(amount_range, bucket_range)['count']
+    if low_key == high_key:
+        counts[low_key] = total
+    else:
+        counts[low_key] = index.query((low, sketches.upper_edge(low_key)), bucket_range)['count']
+        counts[high_key] = total - counts[low_key:high_key].sum()
+    return counts
+
+def describe_result(stats, quantiles, exact):
+    """
+    Builds the describe() Series from moments (count, mean, std, min, max) and the DESCRIBE_QUANTILES
+    """
+    labels = ['count', 'mean', 'std', 'min'] + [f'{q * 100:g}%' for q in DESCRIBE_QUANTILES] + ['max']
+    values = [float(stats['count']), stats['mean'], stats['std'], stats['min'], *quantiles, stats['max']]
+    result = pd.Series(values, index=labels, name='Amount')
+    result.attrs['exact'] = exact
+    return result
+
+def describe(index, amount_range, bucket_range, sketches=None, exact_max_rows=EXACT_MAX_ROWS):
+    """
+    Returns count, mean, std, min, quartiles, p99 and max of the selected amounts
+
+    Count, mean, std, min and max are exact (range index). Quantiles are exact
+    for selections of up to exact_max_rows rows; larger selections merge the
+    sketches of the selected buckets instead of gathering the amounts, and
+    every quantile is then within RELATIVE_ACCURACY of the exact value
+    (amounts up to MIN_AMOUNT read as 0). The Series' attrs['exact'] says which.
+    """
+    stats = index.moments(amount_range, bucket_range)
+    count = stats['count']
+
+    exact = sketches is None or count <= exact_max_rows
+    if count == 0:
+        quantiles = [np.nan] * len(DESCRIBE_QUANTILES)
+    elif exact:
+        starts, ends = index.slices(amount_range, bucket_range)
+        values = np.concatenate([index.amounts[start:end] for start, end in zip(starts, ends)])
+        quantiles = np.percentile(values, [q * 100 for q in DESCRIBE_QUANTILES])
+    else:
+        counts = _selection_counts(sketches, index, index.cls, amount_range, bucket_range)
+        # Reported values never leave the selected amounts' range
+        quantiles = np.clip(sketches.quantiles(DESCRIBE_QUANTILES, counts), stats['min'], stats['max'])
+    return describe_result(stats, quantiles, exact)
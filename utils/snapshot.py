@@ -0,0 +1,122 @@
+"""
+Keeps an on-disk snapshot of the cleaned dataset so restarts skip the download and parse
+"""
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+
+# Folder where snapshots are stored (one Parquet file + one JSON metadata file per source)
+# Can be overridden with the CREDIT_CARD_CACHE_DIR environment variable
+CACHE_DIR = os.environ.get(
+    'CREDIT_CARD_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.data_cache')
+)
+
+# Bump this whenever the cleaning steps change so old snapshots are rebuilt
+SNAPSHOT_FORMAT = 3
+
+# Metadata fields that identify the version of the source
+VALIDATOR_KEYS = ['etag', 'last_modified', 'mtime_ns', 'size', 'content_hash']
+
+def _snapshot_paths(source):
+    """
+    Returns the (data, metadata) file paths used for a given source
+    """
+    key = hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(CACHE_DIR, f'creditcard_{key}')
+    return base + '.parquet', base + '.json'
+
+def download_path(source):
+    """
+    Returns where the raw CSV of a URL source is downloaded before parsing
+    """
+    data_path, _ = _snapshot_paths(source)
+    return data_path[:-len('.parquet')] + '.csv'
+
+def file_validators(path):
+    """
+    Builds validators for a local CSV file from its size and modification time
+    """
+    info = os.stat(path)
+    return {'mtime_ns': info.st_mtime_ns, 'size': info.st_size}
+
+def make_version(source, validators):
+    """
+    Returns a short token identifying one version of the cleaned dataset
+
+    Two loads of an unchanged source give the same token,
+    so caches of derived results can be keyed on it.
+    """
+    fields = {key: validators.get(key) for key in VALIDATOR_KEYS}
+    payload = json.dumps([source, SNAPSHOT_FORMAT, fields], sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+def read_meta(source):
+    """
+    Returns the stored metadata for a source, or None if there is no usable snapshot
+    """
+    data_path, meta_path = _snapshot_paths(source)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Snapshots written by an older version of the cleaning code are ignored
+    if meta.get('format') != SNAPSHOT_FORMAT or meta.get('source') != source:
+        return None
+    return meta
+
+def same_validators(meta, validators):
+    """
+    Checks whether the stored validators still match the current ones
+    """
+    return all(meta.get(key) == value for key, value in validators.items())
+
+def load(source):
+    """
+    Loads the cleaned DataFrame from the snapshot, or returns None if it can't be read
+    """
+    data_path, _ = _snapshot_paths(source)
+    try:
+        return pd.read_parquet(data_path)
+    except (OSError, ValueError, ImportError):
+        return None
+
+def save(source, df, validators):
+    """
+    Writes the cleaned DataFrame and its validators to disk
+
+    Files are written to a temporary name first and then renamed,
+    so a crash never leaves a half-written snapshot behind.
+    Returns True if the snapshot was saved.
+    """
+    data_path, meta_path = _snapshot_paths(source)
+    meta = dict(validators)
+    meta.update({
+        'format': SNAPSHOT_FORMAT,
+        'source': source,
+        'rows': len(df),
+        'created': time.time(),
+    })
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+        # Data first, then metadata: metadata only ever points to a complete file
+        tmp_data = data_path + '.tmp'
+        df.to_parquet(tmp_data, index=False)
+        os.replace(tmp_data, data_path)
+
+        tmp_meta = meta_path + '.tmp'
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, meta_path)
+    except (OSError, ValueError, ImportError):
+        # The snapshot is only a speed-up; the dashboard still works without it
+        return False
+
+    return True
@@ -0,0 +1,118 @@
+"""
+Loads the dataset and prepares aggregates and default figures in a background thread
+"""
+import os
+import threading
+import time
+import streamlit as st
+from utils.registry import default_source
+
+# Set CREDIT_CARD_WARMUP=0 to load data in the first request instead
+WARMUP_ENABLED = os.environ.get('CREDIT_CARD_WARMUP', '1') != '0'
+
+# Seconds between two checks while a page waits for the data
+POLL_SECONDS = 1.0
+
+_lock = threading.Lock()
+_thread = None
+_status = {
+    'state': 'idle',          # idle, running, ready or failed
+    'dataset_ready': False,   # the dataset itself is loaded (aggregates may still be building)
+    'error': None,
+    'started': None,
+    'finished': None,
+}
+
+def _default_figures():
+    """
+    Returns the (builder, parameters) pairs of the charts shown by default
+    """
+    from utils.charts import DEFAULT_FIGURES
+    return DEFAULT_FIGURES
+
+def _warm(source):
+    """
+    Loads the dataset, builds the aggregates and renders the default figures
+    """
+    from utils.backend import get_backend
+    from utils.figure_cache import cached_figure
+    from utils.range_index import get_range_index
+    from utils.sketch import get_sketches
+
+    try:
+        data = get_backend(source)
+        with _lock:
+            _status['dataset_ready'] = True
+
+        data.cube()
+        if data.name == 'pandas':
+            # Indexes of the row-level pages (only available in memory)
+            get_range_index(data.df, cls=0, granularity='hour')
+            get_sketches(data.df, granularity='hour')
+        for builder, params in _default_figures():
+            cached_figure(data, builder, **params)
+
+        with _lock:
+            _status['state'] = 'ready'
+    except Exception as e:
+        with _lock:
+            _status['state'] = 'failed'
+            _status['error'] = str(e)
+    finally:
+        with _lock:
+            _status['finished'] = time.time()
+
+def start_warmup(source=None, retry=False):
+    """
+    Starts the background warm-up once per process (later calls do nothing)
+
+    The default source is the first registered dataset (see utils.registry).
+
+    With retry=True a failed warm-up is started again.
+    """
+    global _thread
+    with _lock:
+        if _status['state'] == 'running' or _status['state'] == 'ready':
+            return
+        if _status['state'] == 'failed' and not retry:
+            return
+        _status.update({'state': 'running', 'dataset_ready': False, 'error': None,
+                        'started': time.time(), 'finished': None})
+        _thread = threading.Thread(
+            target=_warm, args=(source or default_source(),), name='dashboard-warmup', daemon=True
+        )
+        _thread.start()
+
+def warmup_status():
+    """
+    Returns a copy of the warm-up status
+    """
+    with _lock:
+        return dict(_status)
+
+def wait_for_data():
+    """
+    Shows a lightweight placeholder until the background load has finished
+
+    The page reruns by itself once the data is ready, and stops with an
+    error message (and a retry button) if loading failed.
+    When warm-up is disabled this returns immediately and the page loads the data itself.
+    """
+    if not WARMUP_ENABLED:
+        return
+
+    start_warmup()
+    status = warmup_status()
+    if status['dataset_ready']:
+        return
+
+    if status['state'] == 'failed':
+        st.error(f"❌ Failed to load data: {status['error']}")
+        if st.button("Retry"):
+            start_warmup(retry=True)
+            st.rerun()
+        st.stop()
+
+    st.info("⏳ Loading data in the background. This page will appear as soon as it is ready.")
+    time.sleep(POLL_SECONDS)
+    st.rerun()